@@ -22,6 +22,9 @@ requirements = [
     'squarify',
 ]
 
+# Optional dependencies (Parquet/Feather header exports)
+extras_requirements = {'parquet': ['pyarrow']}
+
 setup_requirements = ['pytest-runner', ]
 
 test_requirements = ['pytest', ]
@@ -38,6 +41,7 @@ setup(
     ],
     description="Geophysical / GIS toolbox",
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
     keywords='vmlib',
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""
+Run tests for the dirs module of vmlib
+"""
+
+import pathlib
+from vmlib import dirs
+
+
+def _tree(root):
+    for name in ['a.sgy', 'b.SGY', 'c.sgy.bak', 'line_cut.sgy', 'notes.txt',
+                 'sub/d.sgy', 'sub/deep/e.segy', 'sub/deep/f.txt']:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+
+
+def test_walk_files(tmp_path):
+    _tree(tmp_path)
+
+    def names(**kwargs):
+        return sorted(p.name for p in dirs.walk_files(tmp_path, **kwargs))
+    assert names() == ['a.sgy', 'b.SGY', 'c.sgy.bak', 'line_cut.sgy',
+                       'notes.txt']
+    assert names(extension='sgy') == ['a.sgy', 'b.SGY', 'line_cut.sgy']
+    assert names(recurse=True, extension=['.sgy', '*.segy']) == \
+        ['a.sgy', 'b.SGY', 'd.sgy', 'e.segy', 'line_cut.sgy']
+    assert names(recurse=True, pattern='*.txt') == ['f.txt', 'notes.txt']
+    assert names(wildcard='cut') == ['line_cut.sgy']
+    path, stat = next(dirs.walk_files(tmp_path, pattern='a.*', stat=True))
+    assert path == tmp_path / 'a.sgy' and stat.st_size == 5
+
+
+def test_walk_files_symlinks(tmp_path):
+    root = tmp_path / 'root'
+    _tree(root)
+    (tmp_path / 'other').mkdir()
+    (tmp_path / 'other' / 'g.sgy').write_text('g')
+    (root / 'other').symlink_to(tmp_path / 'other')
+    (root / 'sub' / 'deep' / 'loop').symlink_to(root)
+
+    def names(**kwargs):
+        return sorted(p.name for p in dirs.walk_files(
+            root, recurse=True, extension='.sgy', **kwargs))
+    assert names() == ['a.sgy', 'b.SGY', 'd.sgy', 'line_cut.sgy']
+    assert names(follow_symlinks=True) == ['a.sgy', 'b.SGY', 'd.sgy',
+                                           'g.sgy', 'line_cut.sgy']
+
+
+def test_list_directory(tmp_path):
+    _tree(tmp_path / 'root')
+    files = dirs.list_directory(tmp_path / 'root', recurse=True,
+                                extension='.txt', out_folder=tmp_path)
+    assert sorted(files) == [tmp_path / 'root' / 'notes.txt',
+                             tmp_path / 'root' / 'sub' / 'deep' / 'f.txt']
+    listing = (tmp_path / 'File_listing.txt').read_text().splitlines()
+    assert sorted(listing[-2:]) == sorted(str(p) for p in files)
+    assert all(isinstance(p, pathlib.Path) for p in files)
+    files = dirs.list_directory(tmp_path / 'root', recurse=True,
+                                extension=['sgy', '*.segy'],
+                                out_folder=tmp_path)
+    assert sorted(p.name for p in files) == ['a.sgy', 'b.SGY', 'd.sgy',
+                                             'e.segy', 'line_cut.sgy']
+    listing = (tmp_path / 'File_listing.txt').read_text()
+    assert 'restricted to .sgy, .segy files' in listing
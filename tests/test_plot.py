@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+Run tests for the plot module of vmlib
+"""
+
+import matplotlib
+import matplotlib.figure
+import numpy as np
+from vmlib import plot as _plot
+
+matplotlib.use('Agg')
+
+
+def test_shot_gather_template(tmp_path):
+    rng = np.random.default_rng(0)
+    shot = {'src': 12, 'data': rng.normal(size=(10, 50)),
+            'offsets': np.arange(-50, 50, 10), 'rcvs': np.arange(7, 17),
+            'twt': np.arange(50)}
+    template = _plot.seis.ShotGatherTemplate(styles=False)
+    fig = template.fig
+    outfiles = [tmp_path / 'a.jpg', tmp_path / 'b.jpg']
+    template.render_all([(1, shot), (2, dict(shot, src=13))], outfiles)
+    # Same figure and artists, updated for the last item
+    assert template.fig is fig
+    assert len(template['ax'].images) == 1
+    assert template.title.get_text() == 'FFID 2 - Station 13'
+    assert template['ax2'].get_ylim() == (0, 50)
+    assert all(f.exists() for f in outfiles)
+    template.close()
+
+
+def test_short_gathers(tmp_path):
+    # Rendered in 2 worker processes, with the vmlib plot styles
+    rng = np.random.default_rng(0)
+    shots = {ffid: {'src': 10 + ffid, 'data': rng.normal(size=(10, 50)),
+                    'offsets': np.arange(-50, 50, 10),
+                    'rcvs': np.arange(7, 17), 'twt': np.arange(50)}
+             for ffid in range(1, 4)}
+    outfiles = _plot.seis.short_gathers(None, shots, tmp_path,
+                                        {'n_workers': 2})
+    assert [f.name for f in outfiles] == [
+        f'SRC_{ffid}_short_offsets.jpg' for ffid in shots]
+    assert all(f.exists() and f.stat().st_size > 0 for f in outfiles)
+
+
+def test_bin_points():
+    x = np.array([0., 0.2, 0.9, 1., 0.6])
+    y = np.array([0., 0.1, 0.9, 1., 0.2])
+    z = np.array([1., 3., 5., 7., 2.])
+    grid, extent = _plot.density.bin_points(x, y, bins=(2, 2))
+    assert extent == [0., 1., 0., 1.]
+    assert np.array_equal(grid, [[2, 1], [np.nan, 2]], equal_nan=True)
+    grid, _ = _plot.density.bin_points(x, y, z, reduce='mean', bins=(2, 2))
+    assert np.array_equal(grid, [[2, 2], [np.nan, 6]], equal_nan=True)
+    grid, _ = _plot.density.bin_points(x, y, z, reduce='max', bins=(2, 2))
+    assert np.array_equal(grid, [[3, 2], [np.nan, 7]], equal_nan=True)
+
+
+def test_density_scatter():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 1000, 5000)
+    y = rng.uniform(0, 100, 5000)
+    fig = matplotlib.figure.Figure(figsize=(8, 6))
+    ax = fig.add_subplot(1, 1, 1)
+    img = _plot.density.scatter(ax, x, y, c=x, threshold=100,
+                                label='Midpoints', aspect=1)
+    # Square pixels, and a legend entry for the rasterized points
+    ny, nx = img.get_array().shape
+    assert np.isclose(np.ptp(x) / nx, np.ptp(y) / ny, rtol=0.1)
+    assert ax.get_aspect() == 1
+    handles, labels = ax.get_legend_handles_labels()
+    assert labels == ['Midpoints']
+
+
+def test_station_grid():
+    rcv = np.array([10, 12, 14, 10, 14, 14])
+    src = np.array([1.5, 1.5, 1.5, 2.5, 2.5, 2.5])
+    z = np.array([1., 2., 3., 4., 5., 7.])
+    grid, extent = _plot.density.station_grid(rcv, src, z)
+    assert extent == [9., 15., 1., 3.]
+    assert np.array_equal(grid, [[1, 2, 3], [4, np.nan, 6]], equal_nan=True)
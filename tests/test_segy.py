@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+
+"""
+Run tests for the segy module of vmlib
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.signal
+import segyio
+import vmlib as vm
+from vmlib import seis as _seis
+from vmlib.seis import segy as _segy
+
+
+@pytest.fixture(params=[1, 5])
+def segyfile(tmp_path, request):
+    path = tmp_path / f'test_{request.param}.sgy'
+    data = np.random.default_rng(0).standard_normal((40, 101))
+    data = (100 * data).astype(np.float32)
+    spec = segyio.spec()
+    spec.format = request.param
+    spec.samples = list(range(101))
+    spec.tracecount = 40
+    with segyio.create(path, spec) as f:
+        f.bin.update(hdt=2000, hns=101)
+        for i in range(40):
+            f.header[i] = {segyio.su.tracl: i + 1,
+                           segyio.su.fldr: 100 + i // 10,
+                           segyio.su.tracf: i % 10 + 1,
+                           segyio.su.cdp: i // 2 + i % 10,
+                           segyio.su.offset: (i % 10 - 5) * 10,
+                           segyio.su.scalco: -100,
+                           segyio.su.cdpx: 250000000 + i * 250,
+                           segyio.su.cdpy: 120000000,
+                           segyio.su.ns: 101,
+                           segyio.su.dt: 2000}
+            f.trace[i] = data[i]
+    return path, data
+
+
+def test_memmap(segyfile):
+    path, data = segyfile
+    traces = _segy.io.Segy(path).traces
+    assert isinstance(traces, _segy.memmap.TraceArray)
+    assert traces.shape == data.shape
+    assert np.array_equal(traces[:], data)
+    assert np.array_equal(traces[5:9, 10:20], data[5:9, 10:20])
+    assert np.array_equal(_segy.io.Segy(path, mmap=False).traces, data)
+
+
+def test_read_trace_headers(segyfile):
+    path, data = segyfile
+    headers = _segy.headers.read_trace_headers(path, block_size=7)
+    with segyio.open(path, ignore_geometry=True) as f:
+        for k, v in segyio.tracefield.keys.items():
+            assert np.array_equal(headers[k], f.attributes(v)[:])
+    headers = _segy.headers.read_trace_headers(path, ['CDP', 'offset'],
+                                               memory=6 * 240)
+    assert headers.dtype.names == ('CDP', 'offset')
+    assert headers['offset'][0] == -50
+    cdp = np.arange(40) // 2 + np.arange(40) % 10
+    assert np.array_equal(headers['CDP'], cdp)
+
+
+@pytest.mark.parametrize('scalar', [-100, 10, 0])
+def test_midpoints_scalar(monkeypatch, scalar):
+    # Nav-merge line classes are still looked up as vmlib.seismic
+    monkeypatch.setattr(vm, 'seismic', _seis, raising=False)
+    n = 6
+    navmerge = vm.io.segy.Seis_navmerge()
+    navmerge._trace_header = pd.DataFrame(
+        {'TRACE_SEQUENCE_LINE': np.arange(1, n + 1),
+         'ShotPoint': np.full(n, 10), 'CROSSLINE_3D': np.arange(n),
+         'CDP': np.arange(n) // 2, 'offset': np.arange(n) * 25,
+         'SourceGroupScalar': np.full(n, scalar),
+         'CDP_X': np.full(n, 3000), 'CDP_Y': np.full(n, 500),
+         'SourceX': np.full(n, 2000), 'SourceY': np.full(n, 400),
+         'GroupX': np.full(n, 4000), 'GroupY': np.full(n, 600)},
+        index=pd.RangeIndex(1, n + 1))
+    navmerge.get_midpoints()
+    factor = {-100: 0.01, 10: 10., 0: 1.}[scalar]
+    df = navmerge.midpoints.data
+    assert np.allclose(df['cdp_x'], 3000 * factor)
+    assert np.allclose(df['cdp_y'], 500 * factor)
+    assert np.allclose(df['x'], 3000 * factor)
+    assert np.allclose(df['y'], 500 * factor)
+
+
+def test_header_cache(segyfile, tmp_path):
+    path, data = segyfile
+    cache = _segy.cache.HeaderCache(tmp_path / 'cache')
+    first = _segy.io.Segy(path, fields=['CDP'], cache=cache).trace_header
+    cached = cache.get(path, 'trace')
+    assert list(cached.columns) == ['CDP']
+    assert cached.equals(first)
+    table = _segy.io.Segy(path, fields=['CDP', 'offset'], cache=cache)
+    assert table.trace_header['offset'].iloc[0] == -50
+    assert list(cache.get(path, 'trace').columns) == ['CDP', 'offset']
+    with open(path, 'ab') as f:
+        f.write(b'\x00')
+    assert cache.get(path, 'trace') is None
+
+
+def test_trace_stats(segyfile):
+    path, data = segyfile
+    stats = _segy.io.Segy(path).get_trace_stats(block_size=16)
+    assert list(stats.index[[0, -1]]) == [1, 40]
+    assert np.allclose(stats['amplitude'], np.ptp(data, axis=1))
+    assert np.allclose(stats['rms'], data.std(axis=1), rtol=1e-5)
+    assert np.allclose(stats['rms_top'], data[:, :50].std(axis=1), rtol=1e-5)
+    assert np.allclose(stats['peak'], np.abs(data).max(axis=1))
+    assert (stats['clipped'] == 0).all()
+    assert (stats['zero_fraction'] == 0).all()
+    block = data[:2].copy()
+    block[1, 10:13] = block[1].max() * 2
+    clipped = _segy.stats.block_stats(block)['clipped']
+    assert list(clipped) == [0, 3]
+    assert _segy.stats.block_stats(block, clip=0)['clipped'][0] == 101
+
+
+def test_amplitude_sketch(segyfile, tmp_path, monkeypatch):
+    path, data = segyfile
+    monkeypatch.setattr(_segy.cache, 'CACHE_DIR', tmp_path / 'default')
+    sketch = _segy.stats.amplitude_sketch(path)
+    assert np.isclose(sketch.percentile(50), np.percentile(data, 50),
+                      rtol=0.02, atol=1)
+    # Nothing is written while the cache is disabled
+    assert not (tmp_path / 'default').exists()
+    cache = _segy.cache.HeaderCache(tmp_path / 'cache')
+    sketch = _segy.stats.amplitude_sketch(path, cache)
+    assert cache.get(path, 'sketch_0.01') == sketch.to_dict()
+    pyramid = _seis.plot.pyramid.get_pyramid(path, None, min_size=16)
+    clip = _seis.plot.pyramid.clip_value(path, pyramid, 99)
+    assert clip == np.percentile(pyramid.level(len(pyramid) - 1), 99)
+    clip = _seis.plot.pyramid.clip_value(path, pyramid, 99, cache)
+    assert clip == sketch.percentile(99)
+
+
+def test_gather(segyfile):
+    path, data = segyfile
+    segy = _segy.io.Segy(path)
+    traces, header = segy.gather('ffid', 102)
+    assert np.array_equal(traces, data[20:30])
+    assert list(header['FieldRecord'].unique()) == [102]
+    segy = _segy.io.Segy(path, mmap=False)
+    traces, header = segy.gather('ffid', 102)
+    assert np.array_equal(traces, data[20:30])
+    assert list(header['FieldRecord'].unique()) == [102]
+    assert segy._traces is None
+    index = segy.gather_index('cdp')
+    for cdp in index.keys:
+        positions = np.flatnonzero(segy.trace_header['CDP'] == cdp)
+        assert np.array_equal(index.traces(cdp), positions)
+
+
+def test_pyramid(segyfile, tmp_path):
+    path, data = segyfile
+    pyramid = _seis.plot.pyramid.Pyramid.build(path, tmp_path / 'pyr',
+                                               min_size=16, memory=2000)
+    # 40 x 101 -> 20 x 51 -> 10 x 26 -> 10 x 13
+    assert [lev['shape'] for lev in pyramid.meta['levels']] == \
+        [[40, 101], [20, 51], [10, 26], [10, 13]]
+    level = pyramid.level(1)
+    padded = np.pad(data, ((0, 0), (0, 1)), mode='edge')
+    assert np.allclose(level, padded.reshape(20, 2, 51, 2).mean(axis=(1, 3)),
+                       atol=1e-4)
+    # Level selection from the output size
+    window, covered = pyramid.window((4, 36), (0, 101), width=8, height=25)
+    assert covered == [4, 36, 0, 101]
+    assert window.shape == (8, 26)
+    window, covered = pyramid.window((5, 9), (10, 20), width=100, height=100)
+    assert np.array_equal(window, data[5:9, 10:20])
+    reopened = _seis.plot.pyramid.Pyramid.open(path, tmp_path / 'pyr')
+    assert np.array_equal(reopened.level(3), pyramid.level(3))
+
+
+def test_pyramid_without_cache(tmp_path):
+    # 4-byte integer samples: no memory map, level 0 read through segyio
+    path = tmp_path / 'int.sgy'
+    data = np.arange(60 * 30, dtype=np.int32).reshape(60, 30)
+    spec = segyio.spec()
+    spec.format = 2
+    spec.samples = list(range(30))
+    spec.tracecount = 60
+    with segyio.create(path, spec) as f:
+        f.trace.raw[:] = data
+    pyramid = _seis.plot.pyramid.get_pyramid(path, None, min_size=16)
+    folder = pyramid.folder
+    assert pyramid.meta['levels'][0]['file'] is None
+    assert not folder.joinpath('pyramid_0.npy').exists()
+    assert np.array_equal(pyramid.level(0)[10:12, 5:9], data[10:12, 5:9])
+    assert np.allclose(pyramid.level(1),
+                       data.reshape(30, 2, 30).mean(axis=1))
+    del pyramid
+    assert not folder.exists()
+
+
+def test_cut(segyfile, tmp_path):
+    path, data = segyfile
+    destination = _segy.io.Segy(path).cut(cut_time=60, outpath=tmp_path)
+    with segyio.open(destination, ignore_geometry=True) as f:
+        assert f.bin[segyio.BinField.Samples] == 30
+        assert set(f.attributes(segyio.su.ns)[:]) == {30}
+        assert list(f.attributes(segyio.su.fldr)[:]) == \
+            [100 + i // 10 for i in range(40)]
+        assert np.array_equal(f.trace.raw[:], data[:, :30])
+
+
+@pytest.mark.parametrize('method', ['fft', 'polyphase'])
+def test_resample(segyfile, tmp_path, method):
+    path, data = segyfile
+    destination = _segy.io.Segy(path).resample(
+        sample_rate=4, outpath=tmp_path, method=method, workers=2,
+        memory=16 * 101 * 4)
+    if method == 'fft':
+        expected = scipy.signal.resample(data, 50, axis=1)
+    else:
+        expected = scipy.signal.resample_poly(data, 1, 2, axis=1)
+    with segyio.open(destination, ignore_geometry=True) as f:
+        assert f.bin[segyio.BinField.Samples] == expected.shape[1]
+        assert f.bin[segyio.BinField.Interval] == 4000
+        assert set(f.attributes(segyio.su.ns)[:]) == {expected.shape[1]}
+        assert set(f.attributes(segyio.su.dt)[:]) == {4000}
+        assert list(f.attributes(segyio.su.fldr)[:]) == \
+            [100 + i // 10 for i in range(40)]
+        assert np.allclose(f.trace.raw[:], expected, rtol=1e-5, atol=1e-3)
+
+
+def test_edit_pipeline(segyfile, tmp_path):
+    path, data = segyfile
+    segy = _segy.io.Segy(path)
+    pipeline = segy.edit().cut(120).resample(4, method='polyphase') \
+        .gain(2., tpow=1).patch('TRACE_SEQUENCE_FILE', 7) \
+        .patch('CDP', lambda df: df['FieldRecord'] + 1000)
+    assert pipeline.n_samples == 30
+    destination = pipeline.run(tmp_path / 'edit.sgy', workers=2,
+                               memory=16 * 101 * 4)
+    expected = scipy.signal.resample_poly(data[:, :60], 1, 2, axis=1)
+    expected *= 2 * np.arange(30) * 0.004
+    with segyio.open(destination, ignore_geometry=True) as f:
+        assert f.bin[segyio.BinField.Samples] == 30
+        assert f.bin[segyio.BinField.Interval] == 4000
+        assert set(f.attributes(segyio.su.ns)[:]) == {30}
+        assert set(f.attributes(segyio.su.dt)[:]) == {4000}
+        assert set(f.attributes(segyio.su.tracr)[:]) == {7}
+        assert list(f.attributes(segyio.su.cdp)[:]) == \
+            [1100 + i // 10 for i in range(40)]
+        assert list(f.attributes(segyio.su.tracf)[:]) == \
+            [i % 10 + 1 for i in range(40)]
+        assert np.allclose(f.trace.raw[:], expected, rtol=1e-5, atol=1e-3)
+
+
+def test_spectra(segyfile):
+    path, data = segyfile
+    offsets = np.array([(i % 10 - 5) * 100 for i in range(40)])
+    groups = {'shot': 100 + np.arange(40) // 10,
+              'offset': _segy.spectra.offset_classes(offsets, (0, 200)),
+              'line': np.zeros(40)}
+    blocks = _segy.blocks.iter_blocks(path, block_size=16)
+    result = _segy.spectra.spectra(blocks, np.arange(101) * 2., groups,
+                                   window=(20, 180),
+                                   percentiles={'offset': (10, 50, 90),
+                                                'line': (10, 50, 90)})
+    window = data[:, 10:90] * scipy.signal.windows.tukey(80, 0.1)
+    amplitude = np.abs(np.fft.rfft(window, n=80, axis=1))
+    assert np.allclose(result['line']['mean'].columns,
+                       np.fft.rfftfreq(80, 0.002))
+    assert list(result['offset']['count']) == [12, 28]
+    # Shots: count and mean spectra only, without amplitude histograms
+    assert list(result['shot']) == ['count', 'mean']
+    for level, labels in groups.items():
+        for label in np.unique(labels):
+            spectra = amplitude[labels == label]
+            assert np.allclose(result[level]['mean'].loc[label],
+                               spectra.mean(axis=0), rtol=1e-4)
+            if level == 'shot':
+                continue
+            for q in [10, 50, 90]:
+                expected = np.percentile(spectra, q, axis=0,
+                                         method='inverted_cdf')
+                error = 20 * np.log10(result[level][f'p{q}'].loc[label] /
+                                      expected)
+                assert np.abs(error).max() <= 0.25 + 1e-6
+
+
+def test_catalog(segyfile, tmp_path):
+    path, _ = segyfile
+    folder = tmp_path / 'survey'
+    (folder / 'sub').mkdir(parents=True)
+    first = folder / 'L1.sgy'
+    second = folder / 'sub' / 'L2.SEGY'
+    first.write_bytes(path.read_bytes())
+    second.write_bytes(path.read_bytes())
+    (folder / 'notes.txt').write_text('not a segy')
+    (folder / 'broken.sgy').write_bytes(b'not a segy')
+    database = tmp_path / 'catalog.sqlite'
+    with _segy.catalog.build_catalog(folder, database) as catalog:
+        assert len(catalog) == 3
+        assert list(catalog.errors().index) == [str(folder / 'broken.sgy')]
+        df = catalog.query()
+        assert list(df['name']) == ['L1', 'L2']
+        row = df.iloc[0]
+        assert row['n_traces'] == 40 and row['n_samples'] == 101
+        assert row['sample_rate'] == 2
+        assert (row['ffid_min'], row['ffid_max']) == (100, 103)
+        assert (row['cdp_min'], row['cdp_max']) == (0, 28)
+        assert (row['xmin'], row['xmax']) == (2500000, 2500097.5)
+        assert (row['ymin'], row['ymax']) == (1200000, 1200000)
+        assert len(catalog.query(bbox=(2500090, 1199990, 2500100,
+                                       1200010))) == 2
+        assert len(catalog.query(bbox=(2500100, 1199990, 2500200,
+                                       1200010))) == 0
+        assert len(catalog.query(where='name = ?', params=('L2',))) == 1
+        assert catalog.headers(first)[1]['Interval'] == 2000
+    # Incremental re-scan: one file modified, one removed, one new (broken)
+    with open(second, 'r+b') as f:
+        f.seek(3600 + 8)
+        f.write((200).to_bytes(4, 'big'))
+    (folder / 'broken.sgy').unlink()
+    (folder / 'new.sgy').write_bytes(b'not a segy either')
+    with _segy.catalog.Catalog(database) as catalog:
+        counts = catalog.scan(folder)
+        assert counts == {'added': 0, 'updated': 1, 'unchanged': 1,
+                          'failed': 1, 'removed': 1}
+        assert list(catalog.errors().index) == [str(folder / 'new.sgy')]
+        assert catalog.query(where='name = ?',
+                             params=('L2',))['ffid_max'].iloc[0] == 200
+
+
+def test_export_headers(segyfile, tmp_path, monkeypatch):
+    path, _ = segyfile
+    fields = ['FieldRecord', 'TraceNumber', 'CDP', 'offset']
+    expected = _segy.headers.trace_header_table(
+        segyio.open(path, ignore_geometry=True), fields)
+    outfile = _segy.export.export_trace_headers(
+        path, tmp_path / 'headers', fields, format='csv',
+        compression='gzip', block_size=7)
+    assert outfile.name == 'headers.csv.gz'
+    df = pd.read_csv(outfile, index_col='trace')
+    pd.testing.assert_frame_equal(df, expected.rename_axis('trace'),
+                                  check_dtype=False, check_index_type=False)
+    # Extensions are appended: names differing after a dot are kept apart
+    for name in ['L1.final', 'L1.raw', 'L1.raw.csv']:
+        written = _segy.export.export_trace_headers(path, tmp_path / name,
+                                                    fields, format='csv')
+        assert written.name == name.replace('.csv', '') + '.csv'
+    written = _segy.io.Segy(path).export_headers(tmp_path / 'default')
+    assert written.name == 'default.csv'
+    with monkeypatch.context() as m:
+        m.setattr(_segy.export, '_pyarrow', lambda: None)
+        with pytest.raises(ImportError, match='pyarrow'):
+            _segy.export.export_trace_headers(path, tmp_path / 'headers',
+                                              fields)
+    pytest.importorskip('pyarrow')
+    for format, read in [('parquet', pd.read_parquet),
+                         ('feather', pd.read_feather)]:
+        outfile = _segy.io.Segy(path).export_headers(
+            tmp_path / 'headers', format=format, fields=fields)
+        assert outfile.suffix == f'.{format}'
+        df = read(outfile).set_index('trace')
+        pd.testing.assert_frame_equal(df, expected.rename_axis('trace'),
+                                      check_index_type=False)
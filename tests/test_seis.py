@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""
+Run tests for the seis module of vmlib
+"""
+
+import numpy as np
+import pandas as pd
+from vmlib import seis as _seis
+
+
+def test_fold():
+    cdp = np.array([3, 1, 3, 2, 3, 1])
+    offset = np.array([10, -20, 30, -40, 50, 60])
+    table = _seis.cdp.fold(cdp)
+    assert list(table.index) == [1, 2, 3]
+    assert list(table['fold']) == [2, 1, 3]
+    assert list(_seis.cdp.trace_fold(cdp)) == [3, 2, 3, 1, 3, 2]
+    table = _seis.cdp.fold(cdp, offset, offset_range=[20, 50])
+    assert list(table['fold']) == [1, 1, 2]
+
+
+def test_aggregate():
+    df = pd.DataFrame({'ffid': [2, 1, 2, 1, 2],
+                       'rcv': [5, 3, 4, 6, 7],
+                       'z': [1., 2., 3., 4., 5.]})
+    out = _seis.gathers.aggregate(df, 'ffid', {'n': ('ffid', 'count'),
+                                               'first': ('rcv', 'min'),
+                                               'last': ('rcv', 'max'),
+                                               'z': ('z', 'mean'),
+                                               'z0': ('z', 'first')})
+    expected = df.groupby('ffid').agg(n=('ffid', 'count'),
+                                      first=('rcv', 'min'),
+                                      last=('rcv', 'max'),
+                                      z=('z', 'mean'),
+                                      z0=('z', 'first'))
+    assert out.index.name == 'ffid'
+    assert (out.to_numpy() == expected.to_numpy()).all()
+
+
+def test_hillshade():
+    import matplotlib.colors as mcolors
+    from scipy.ndimage import uniform_filter1d
+    from sklearn.preprocessing import robust_scale
+    rng = np.random.default_rng(0)
+    data = np.cumsum(rng.standard_normal((120, 80)), axis=0)
+    # Full-array reference pipeline
+    sc = robust_scale(data, axis=1, with_centering=False, with_scaling=True,
+                      quantile_range=(0.2, 0.9))
+    hs = mcolors.LightSource(0, 80).hillshade(sc)
+    hs = uniform_filter1d(hs, 9, axis=0)
+    hs = robust_scale(hs, axis=1, with_centering=True, with_scaling=False)
+    for memory in [None, 80 * 8 * 8 * 7]:
+        result = _seis.rx_sect_plot.hillshade_section(data, 9, memory=memory)
+        assert result.dtype == np.float32
+        assert np.allclose(result, hs, atol=1e-6)
+
+
+def test_line_metrics():
+    df = pd.DataFrame({'CDP_X': [0, 300, 600, 600], 'CDP_Y': [0, 400, 400, 0],
+                       'SourceGroupScalar': [-100] * 4})
+    x, y = _seis.geometry.scaled_coordinates(df)
+    metrics = _seis.geometry.line_metrics(x, y, spacing=4.)
+    assert np.allclose(metrics['spacing'], [np.nan, 5, 3, 4], equal_nan=True)
+    assert np.allclose(metrics['chainage'], [0, 5, 8, 12])
+    assert np.allclose(metrics['deviation'], [0, 1, 0, 0])
+    assert np.allclose(metrics['heading'].iloc[2:], [90, 180])
+    assert np.allclose(metrics['heading_change'].iloc[2:], [53.13, 90],
+                       atol=0.01)
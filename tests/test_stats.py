@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+"""
+Run tests for the stats module of vmlib
+"""
+
+import numpy as np
+from vmlib import stats as _stats
+
+
+def test_quantile_sketch():
+    values = np.random.default_rng(0).standard_normal(100000) * 50
+    values[:1000] = 0
+    sketch = _stats.sketch.QuantileSketch(alpha=0.01)
+    for block in np.split(values, 10):
+        sketch.update(block)
+    assert len(sketch) == len(values)
+    for p in [1, 25, 75, 98, 99.9]:
+        expected = np.percentile(values, p)
+        assert abs(sketch.percentile(p) - expected) <= 0.02 * abs(expected)
+    assert sketch.percentile(50) == 0
+    # Merge and serialization are exact
+    merged = _stats.sketch.QuantileSketch().update(values[:30000])
+    merged.merge(_stats.sketch.QuantileSketch().update(values[30000:]))
+    assert np.array_equal(merged.positive, sketch.positive)
+    restored = _stats.sketch.QuantileSketch.from_dict(sketch.to_dict())
+    assert restored.percentile(99) == sketch.percentile(99)
+    assert np.isnan(_stats.sketch.QuantileSketch().quantile(0.5))
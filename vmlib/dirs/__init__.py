@@ -10,6 +10,7 @@ Directory function to manipulate files and directories
 Directory
 =========================
 list_directory
+walk_files
 
 File
 =========================
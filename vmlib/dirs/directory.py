@@ -1,8 +1,105 @@
 # -*- coding: utf-8 -*-
+import fnmatch
 import logging
 import os
 import pathlib
-import re
+
+
+def _extensions(extension):
+    # Normalize extensions ('sgy', '.sgy', '*.sgy' or a list) to '.sgy'
+    if isinstance(extension, str):
+        extension = [extension] if extension else []
+    return tuple('.' + e.strip().lstrip('*').lstrip('.').lower()
+                 for e in extension)
+
+
+def walk_files(folder=pathlib.Path.cwd(),
+               recurse=False,
+               extension='',
+               pattern='',
+               wildcard='',
+               stat=False,
+               follow_symlinks=False):
+    '''
+    Stream the files of a folder, optionally recursing into subfolders.
+
+    Folders are read with os.scandir, one at a time, and files are yielded
+    as they are found (no full listing is built). Subfolders are not read
+    at all unless recurse is True. Unreadable folders are logged and
+    skipped.
+
+    Parameters
+    ----------
+    folder: pathlib.Path or str
+        Root folder path to be listed. Defaults to current working directory
+
+    recurse: boolean
+        Does the function recursively list all subfolder? Defaults to False
+
+    extension: str or list
+        File extension(s) to look for, e.g. '.sgy' or ['.sgy', '.segy'],
+        case insensitive. Defaults to '' (ie all files are listed)
+
+    pattern: str
+        Glob pattern the file name has to match, e.g. '*_cut.sgy'.
+        Defaults to '' (no pattern)
+
+    wildcard: str
+        String that has to be in the selected file. Defaults to ''.
+
+    stat: boolean
+        Also yield the os.stat_result of each file (cached by os.scandir
+        when possible). Defaults to False
+
+    follow_symlinks: boolean
+        Recurse into symbolic links to folders. Each folder is read once,
+        so that symbolic link loops are not followed. Defaults to False
+
+    Yields
+    ------
+    path: pathlib.Path
+        file path, or (path, os.stat_result) tuple if stat is True
+
+    '''
+    extensions = _extensions(extension)
+    stack = [os.fspath(folder)]
+    # (device, inode) of the folders read, when following symbolic links
+    visited = set()
+    while stack:
+        current = stack.pop()
+        try:
+            if follow_symlinks:
+                st = os.stat(current)
+                if (st.st_dev, st.st_ino) in visited:
+                    continue
+                visited.add((st.st_dev, st.st_ino))
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError as e:
+            logging.warning(f'Cannot list {current} - {e}')
+            continue
+        subfolders = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=follow_symlinks):
+                    if recurse:
+                        subfolders.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            name = entry.name
+            if extensions and not name.lower().endswith(extensions):
+                continue
+            if pattern and not fnmatch.fnmatch(name, pattern):
+                continue
+            if wildcard not in name:
+                continue
+            path = pathlib.Path(entry.path)
+            yield (path, entry.stat()) if stat else path
+        # Depth-first, subfolders in listing order
+        stack.extend(reversed(subfolders))
 
 
 def list_directory(folder=pathlib.Path.cwd(),
@@ -10,7 +107,8 @@ def list_directory(folder=pathlib.Path.cwd(),
                    extension='',
                    wildcard='',
                    print_log=False,
-                   out_folder=pathlib.Path.cwd()):
+                   out_folder=pathlib.Path.cwd(),
+                   pattern=''):
     '''
     List all files in a root folder.root
 
@@ -22,8 +120,9 @@ def list_directory(folder=pathlib.Path.cwd(),
     recurse: boolean
         Does the function recursively list all subfolder? Defaults to False
 
-    extension: str
-        File extension to look for. Defaults to '' (ie all files are listed)
+    extension: str or list
+        File extension(s) to look for, e.g. '.sgy' or ['.sgy', '.segy'],
+        case insensitive. Defaults to '' (ie all files are listed)
 
     wildcard: str
         String that has to be in the selected file. Defaults to ''.
@@ -35,6 +134,9 @@ def list_directory(folder=pathlib.Path.cwd(),
         Output folder for the file list text file. No text file created
         if empty. Defaults to current workind directory.
 
+    pattern: str
+        Glob pattern the file name has to match. Defaults to ''.
+
     Returns
     -------
     file_list: list
@@ -52,31 +154,20 @@ def list_directory(folder=pathlib.Path.cwd(),
         out_folder = pathlib.Path(out_folder)
         if not out_folder.exists():
             raise AttributeError(f'{out_folder} is not a valid folder.')
-    # Check and format extension and wildcard
-    if extension != '':
-        extension = re.sub('.*\s', '', extension)
+    # Check and format extensions ('.sgy' form, see walk_files)
+    extensions = _extensions(extension)
     # Check recurse and print_log param
     if not isinstance(recurse, bool):
         raise AttributeError('recurse parameter is not a valid boolean.')
     if not isinstance(print_log, bool):
         raise AttributeError('print_log parameter is not a valid boolean.')
     # Get file list
-    file_list = []
-    for ra, dirs, files in os.walk(root, topdown=False):
-        for name in files:
-            # filter wildcard
-            if wildcard in name and extension in name:
-                if not recurse:
-                    if pathlib.Path(ra) == root:
-                        path = pathlib.Path(ra, name)
-                        file_list.append(path)
-                elif recurse:
-                    path = pathlib.Path(ra, name)
-                    file_list.append(path)
+    file_list = list(walk_files(root, recurse, extensions, pattern,
+                                wildcard))
     # Prepare output string
     ext_string, wild_string = '', ''
-    if len(extension) > 0:
-        ext_string = f' restricted to {extension} files'
+    if len(extensions) > 0:
+        ext_string = f" restricted to {', '.join(extensions)} files"
     if len(wildcard) > 0:
         wild_string = f' with filename containing {wildcard}'
     header = f'LIST ALL FILES for folder {root}{ext_string}{wild_string}'
@@ -88,10 +179,10 @@ def list_directory(folder=pathlib.Path.cwd(),
             print(str(item))
     # Output to text
     if out_folder:
-        f = open(pathlib.Path(out_folder, 'File_listing.txt'), 'w')
-        f.write(header)
-        f.write(40*'-' + '\n\n')
-        for item in file_list:
-            f.write(str(item)+'\n')
+        with open(pathlib.Path(out_folder, 'File_listing.txt'), 'w') as f:
+            f.write(header)
+            f.write(40*'-' + '\n\n')
+            for item in file_list:
+                f.write(str(item)+'\n')
     logging.info('END - File listing extraction')
     return file_list
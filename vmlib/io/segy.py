@@ -1,31 +1,59 @@
 # -*- coding: utf-8 -*-
 import re
-import numpy as np
 import pandas as pd
 import segyio
 import vmlib as vm
 
+# Trace header fields unused by the nav-merge QC
+DROPPED_FIELDS = ['CDP_TRACE', 'NSummedTraces', 'SourceDepth',
+                  'ReceiverDatumElevation', 'SourceDatumElevation',
+                  'SourceWaterDepth', 'GroupWaterDepth', 'WeatheringVelocity',
+                  'SubWeatheringVelocity', 'SourceUpholeTime',
+                  'GroupUpholeTime', 'SourceStaticCorrection',
+                  'GroupStaticCorrection', 'TotalStaticApplied', 'LagTimeA',
+                  'LagTimeB', 'DelayRecordingTime', 'MuteTimeStart',
+                  'MuteTimeEND', 'InstrumentGainConstant',
+                  'InstrumentInitialGain', 'Correlated', 'SweepFrequencyStart',
+                  'SweepFrequencyEnd', 'SweepLength', 'SweepType',
+                  'SweepTraceTaperLengthStart', 'SweepTraceTaperLengthEnd',
+                  'TaperType', 'AliasFilterFrequency', 'AliasFilterSlope',
+                  'NotchFilterFrequency', 'NotchFilterSlope',
+                  'LowCutFrequency', 'HighCutFrequency', 'LowCutSlope',
+                  'HighCutSlope', 'TraceWeightingFactor',
+                  'GeophoneGroupNumberRoll1',
+                  'GeophoneGroupNumberFirstTraceOrigField',
+                  'GeophoneGroupNumberLastTraceOrigField', 'GapSize',
+                  'OverTravel', 'ShotPointScalar', 'TraceValueMeasurementUnit',
+                  'TransductionConstantMantissa', 'TransductionConstantPower',
+                  'TransductionUnit', 'TraceIdentifier', 'SourceType',
+                  'SourceEnergyDirectionMantissa',
+                  'SourceEnergyDirectionExponent', 'SourceMeasurementMantissa',
+                  'SourceMeasurementExponent', 'SourceMeasurementUnit',
+                  'UnassignedInt1', 'UnassignedInt2']
+# Trace header fields decoded by import_navmerge
+NAVMERGE_FIELDS = [k for k in segyio.tracefield.keys
+                   if k not in DROPPED_FIELDS]
+
 
 class Segy():
 
     def __init__(self):
-        self.bin_header = {}
-        self.text_header = {}
-        self.trace_header = ''
         self.data = []
         self.stats = {}
+        self.fields = None
+        self.cache = None
+        self._gathers = {}
+        self._bin_header = None
+        self._text_header = None
+        self._trace_header = None
 
     def __str__(self):
         s = self.stats
         return f"SEGY data - {s['filename']} - {s['n_traces']} traces"
 
-    def load(self, filename, data=True):
+    def load(self, filename, data=True, fields=None, cache=None):
         with segyio.open(filename, 'r', ignore_geometry=True) as f:
-            # Load bin headers
-            self.bin_header = f.bin
-            # Load text headers
-            self.text_header = self.parse_text_header(f)
-            # Load stats
+            # Load stats (headers are decoded lazily, on first access)
             self.stats = {
                 'filename': filename,
                 'n_traces': f.tracecount,
@@ -33,19 +61,93 @@ class Segy():
                 'n_samples': f.samples.size,
                 'twt': f.samples,
             }
-            # Load trace headers
-            self.trace_header = self.parse_trace_headers(f)
-
-    def parse_trace_headers(self, segyfile):
-        # Get all header keys
-        headers = segyio.tracefield.keys
-        # Initialize dataframe with trace id as index and headers as columns
-        df = pd.DataFrame(index=range(1, self.stats['n_traces'] + 1),
-                          columns=headers.keys())
-        # Fill dataframe with all header values
-        for k, v in headers.items():
-            df[k] = segyfile.attributes(v)[:]
-        return df
+        # Restrict trace header decoding to the requested fields
+        self.fields = fields
+        # Header cache: None (disabled), True (default folder) or HeaderCache
+        if cache is True:
+            cache = vm.seis.segy.cache.HeaderCache()
+        self.cache = cache or None
+        self._gathers = {}
+        self._bin_header = None
+        self._text_header = None
+        self._trace_header = None
+
+    def _open(self):
+        return segyio.open(self.stats['filename'], 'r', ignore_geometry=True)
+
+    @property
+    def bin_header(self):
+        if self._bin_header is None:
+            def decode():
+                with self._open() as f:
+                    return {int(k): v for k, v in f.bin.items()}
+            bin_header = vm.seis.segy.cache.load_item(
+                self.cache, self.stats['filename'], 'bin', decode)
+            self._bin_header = {segyio.BinField(int(k)): v
+                                for k, v in bin_header.items()}
+        return self._bin_header
+
+    @property
+    def text_header(self):
+        if self._text_header is None:
+            def decode():
+                with self._open() as f:
+                    return self.parse_text_header(f)
+            self._text_header = vm.seis.segy.cache.load_item(
+                self.cache, self.stats['filename'], 'text_header', decode)
+        return self._text_header
+
+    @property
+    def trace_header(self):
+        if self._trace_header is None:
+            def decode(fields):
+                with self._open() as f:
+                    return self.parse_trace_headers(f, fields)
+            self._trace_header = vm.seis.segy.cache.load_trace_header(
+                self.cache, self.stats['filename'], decode, self.fields)
+        return self._trace_header
+
+    def blocks(self, block_size=None, memory=None, headers=True):
+        '''Stream traces as (trace range, 2-D block, header slice) tuples
+
+        See vmlib.seis.segy.blocks.iter_blocks. Block size is set in traces
+        (block_size) or as a memory budget in bytes (memory).
+        '''
+        return vm.seis.segy.blocks.iter_blocks(
+            self.stats['filename'],
+            self.trace_header if headers else None,
+            block_size, memory)
+
+    def gather_index(self, key):
+        '''Gather index of a trace header key or alias (e.g. 'ffid')'''
+        field = vm.seis.gathers.GATHER_KEYS.get(key, key)
+        if field not in self._gathers:
+            def decode():
+                if field in self.trace_header.columns:
+                    values = self.trace_header[field]
+                else:
+                    with self._open() as f:
+                        values = self.parse_trace_headers(f, [field])[field]
+                return vm.seis.gathers.GatherIndex.build(values).runs
+            runs = vm.seis.segy.cache.load_item(
+                self.cache, self.stats['filename'], f'gather_{field}', decode)
+            self._gathers[field] = vm.seis.gathers.GatherIndex(runs)
+        return self._gathers[field]
+
+    def gather(self, key, value):
+        '''Read a single gather: (2-D traces array, trace headers)'''
+        index = self.gather_index(key)
+        try:
+            traces = vm.seis.segy.memmap.TraceArray(self.stats['filename'])
+            data = index.read(traces, value)
+        except ValueError:
+            with self._open() as f:
+                data = index.read(f.trace.raw, value)
+        return data, self.trace_header.iloc[index.traces(value)]
+
+    def parse_trace_headers(self, segyfile, fields=None):
+        # Decode header keys in a single pass, one typed column per key
+        return vm.seis.segy.headers.trace_header_table(segyfile, fields)
 
     def parse_text_header(self, segyfile):
         '''
@@ -100,7 +202,8 @@ class Segy():
         f.close()
         vm.utils.print.info('Bin header', 3)
 
-    def export_trace_header(self, output='root'):
+    def export_trace_header(self, output='root', format='csv',
+                            columns=None, compression='default'):
         # Resolve output filename
         filename = self.stats['filename']
         if output == 'root':
@@ -109,70 +212,38 @@ class Segy():
             out = filename.parent.joinpath('Trace headers')
             out.mkdir(parents=True, exist_ok=True)
         # Save image
-        outfile = out.joinpath(f'{filename.stem}_trace_header.txt')
-        # Write to file
-        self.trace_header.to_csv(outfile)
-        vm.utils.print.info('Trace header', 3   )
+        outfile = out.joinpath(f'{filename.stem}_trace_header')
+        # Write to file, in blocks of traces (Parquet, Feather or CSV)
+        outfile = vm.seis.segy.export.export_table(
+            self.trace_header.rename_axis('trace'), outfile, format,
+            compression, columns)
+        vm.utils.print.info('Trace header', 3)
+        return outfile
 
 
 class Seis_navmerge(Segy):
 
     def __init__(self):
-        pass
+        super().__init__()
 
     def clean_trace_headers(self):
-        dropped = ['CDP_TRACE', 'NSummedTraces', 'SourceDepth',
-                                'ReceiverDatumElevation',
-                                'SourceDatumElevation', 'SourceWaterDepth',
-                                'GroupWaterDepth', 'WeatheringVelocity',
-                                'SubWeatheringVelocity', 'SourceUpholeTime',
-                                'GroupUpholeTime', 'SourceStaticCorrection',
-                                'GroupStaticCorrection', 'TotalStaticApplied',
-                                'LagTimeA', 'LagTimeB', 'DelayRecordingTime',
-                                'MuteTimeStart', 'MuteTimeEND',
-                                'InstrumentGainConstant',
-                                'InstrumentInitialGain', 'Correlated',
-                                'SweepFrequencyStart', 'SweepFrequencyEnd',
-                                'SweepLength', 'SweepType',
-                                'SweepTraceTaperLengthStart',
-                                'SweepTraceTaperLengthEnd', 'TaperType',
-                                'AliasFilterFrequency', 'AliasFilterSlope',
-                                'NotchFilterFrequency', 'NotchFilterSlope',
-                                'LowCutFrequency', 'HighCutFrequency',
-                                'LowCutSlope', 'HighCutSlope',
-                                'TraceWeightingFactor',
-                                'GeophoneGroupNumberRoll1',
-                                'GeophoneGroupNumberFirstTraceOrigField',
-                                'GeophoneGroupNumberLastTraceOrigField',
-                                'GapSize', 'OverTravel', 'ShotPointScalar',
-                                'TraceValueMeasurementUnit',
-                                'TransductionConstantMantissa',
-                                'TransductionConstantPower',
-                                'TransductionUnit', 'TraceIdentifier',
-                                'SourceType', 'SourceEnergyDirectionMantissa',
-                                'SourceEnergyDirectionExponent',
-                                'SourceMeasurementMantissa',
-                                'SourceMeasurementExponent',
-                                'SourceMeasurementUnit', 'UnassignedInt1',
-                                'UnassignedInt2']
+        dropped = [k for k in DROPPED_FIELDS
+                   if k in self.trace_header.columns]
         self.trace_header.drop(dropped, axis=1, inplace=True)
 
     def get_receivers(self, header='CROSSLINE_3D'):
-        # From traces headers, group on rcv_station
-        groupings = {'ReceiverGroupElevation': 'mean',
-                     'ElevationScalar': 'mean',
-                     'GroupX': 'mean',
-                     'GroupY': 'mean',
-                     'SourceGroupScalar': 'mean'}
-        df = self.trace_header.groupby(header).agg(groupings).copy()
+        # From traces headers, group on rcv_station (single sort)
+        groupings = {k: (k, 'mean') for k in ['ReceiverGroupElevation',
+                                              'ElevationScalar', 'GroupX',
+                                              'GroupY', 'SourceGroupScalar']}
+        df = vm.seis.gathers.aggregate(self.trace_header, header, groupings)
         # Compute XYZ from raw and scalar
-        df['x'] = df['GroupX'] / (-df['SourceGroupScalar'])
-        df['y'] = df['GroupY'] / (-df['SourceGroupScalar'])
-        df['z'] = df['ReceiverGroupElevation'] / (-df['ElevationScalar'])
+        scale = vm.seis.segy.headers.apply_scalar
+        df['x'] = scale(df['GroupX'], df['SourceGroupScalar'])
+        df['y'] = scale(df['GroupY'], df['SourceGroupScalar'])
+        df['z'] = scale(df['ReceiverGroupElevation'], df['ElevationScalar'])
         # Clean and format returned dataframe
-        dropped = ['ReceiverGroupElevation', 'ElevationScalar', 'GroupX',
-                   'GroupY', 'ElevationScalar', 'SourceGroupScalar']
-        df.drop(dropped, axis=1, inplace=True)
+        df = df[['x', 'y', 'z']]
         df.index.name = 'rcv_station'
         # Set as instance variable
         self.receivers = vm.seismic.rcv.RCV_line(df)
@@ -181,54 +252,46 @@ class Seis_navmerge(Segy):
 
     def get_shots(self, src_between_rcv=True, rcv_header='CROSSLINE_3D',
                   src_header='ShotPoint'):
-        # Group on FFID
+        # Group on FFID, all per-shot attributes from a single sort
         groupings = {'SourceSurfaceElevation': 'mean',
                      'ElevationScalar': 'mean',
                      'SourceX': 'mean',
                      'SourceY': 'mean',
                      'SourceGroupScalar': 'mean',
                      'EnergySourcePoint': 'mean',
-                     src_header: 'mean',
                      'YearDataRecorded': 'mean',
                      'DayOfYear': 'mean',
                      'HourOfDay': 'mean',
                      'MinuteOfHour': 'mean',
                      'SecondOfMinute': 'mean'}
-        df = self.trace_header.groupby('FieldRecord').agg(groupings).copy()
+        groupings = {k: (k, v) for k, v in groupings.items()}
+        groupings.update({'src_station': (src_header, 'mean'),
+                          'first_rcv_station': (rcv_header, 'min'),
+                          'last_rcv_station': (rcv_header, 'max'),
+                          'n_traces': ('FieldRecord', 'count'),
+                          'first_channel': ('TraceNumber', 'min'),
+                          'last_channel': ('TraceNumber', 'max')})
+        df = vm.seis.gathers.aggregate(self.trace_header, 'FieldRecord',
+                                       groupings)
         # Compute XYZ from raw and scalar
-        df['x'] = df['SourceX'] / (-df['SourceGroupScalar'])
-        df['y'] = df['SourceY'] / (-df['SourceGroupScalar'])
-        df['z'] = df['SourceSurfaceElevation'] / (-df['ElevationScalar'])
+        scale = vm.seis.segy.headers.apply_scalar
+        df['x'] = scale(df['SourceX'], df['SourceGroupScalar'])
+        df['y'] = scale(df['SourceY'], df['SourceGroupScalar'])
+        df['z'] = scale(df['SourceSurfaceElevation'], df['ElevationScalar'])
         # Format datetime of shoot from date / time headers
-        df = df.rename(columns={'YearDataRecorded': 'year',
-                                'DayOfYear': 'doy',
-                                'HourOfDay': 'hour',
-                                'MinuteOfHour': 'minute',
-                                'SecondOfMinute': 'second',
-                                'EnergySourcePoint': 'src_inline',
-                                src_header: 'src_station'
-                                })
-        df['date'] = pd.to_datetime(df['year'],
-                                    format='%Y') + pd.to_timedelta(df['doy']-1,
-                                                                   unit='D')
-        df['date'] += pd.to_timedelta(df['hour'], unit='H')
-        df['date'] += pd.to_timedelta(df['minute'], unit='m')
-        df['date'] += pd.to_timedelta(df['second'], unit='S')
-        # Extract active stations
-        df['first_rcv_station'] = self.trace_header.groupby('FieldRecord').agg({rcv_header: 'min'})
-        df['last_rcv_station'] = self.trace_header.groupby('FieldRecord').agg({rcv_header: 'max'})
-        df['n_traces'] = self.trace_header.groupby(['FieldRecord']).agg({'FieldRecord': 'count'})
-        # Extract traces
-        df['first_channel'] = self.trace_header.groupby('FieldRecord').agg({'TraceNumber': 'min'})
-        df['last_channel'] = self.trace_header.groupby('FieldRecord').agg({'TraceNumber': 'max'})
+        seconds = (df['DayOfYear'] - 1) * 86400 + df['HourOfDay'] * 3600 + \
+            df['MinuteOfHour'] * 60 + df['SecondOfMinute']
+        year = df['YearDataRecorded'].astype(int).astype(str)
+        df['date'] = pd.to_datetime(year, format='%Y') + \
+            pd.to_timedelta(seconds, unit='s')
         # If shot between rcv, then postfix 0.5
         if src_between_rcv:
             df['src_station'] += 0.5
         # Clean and format returned dataframe
-        dropped = ['SourceSurfaceElevation', 'ElevationScalar', 'SourceX',
-                   'SourceY', 'ElevationScalar', 'SourceGroupScalar', 'year',
-                   'doy', 'hour', 'minute', 'second']
-        df.drop(dropped, axis=1, inplace=True)
+        df = df.rename(columns={'EnergySourcePoint': 'src_inline'})
+        df = df[['src_inline', 'src_station', 'x', 'y', 'z', 'date',
+                 'first_rcv_station', 'last_rcv_station', 'n_traces',
+                 'first_channel', 'last_channel']]
         df.index.name = 'ffid'
         # Set as instance variable
         self.shots = vm.seismic.src.SRC_line(df)
@@ -245,24 +308,27 @@ class Seis_navmerge(Segy):
         if src_between_rcv:
             df['src_station'] += 0.5
         df['cdp_num'] = self.trace_header['CDP']
-        df['cdp_x'] = self.trace_header['CDP_X'] / (-self.trace_header['SourceGroupScalar'])
-        df['cdp_y'] = self.trace_header['CDP_Y'] / (-self.trace_header['SourceGroupScalar'])
+
+        def scaled(field):
+            # Coordinate from raw and scalar, aligned on the trace index
+            values = vm.seis.segy.headers.apply_scalar(
+                self.trace_header[field],
+                self.trace_header['SourceGroupScalar'])
+            return pd.Series(values, index=self.trace_header.index)
+
+        df['cdp_x'] = scaled('CDP_X')
+        df['cdp_y'] = scaled('CDP_Y')
         df['offset'] = self.trace_header['offset']
         # Get midpoint x, y
-        df['src_x'] = self.trace_header['SourceX'] / (-self.trace_header['SourceGroupScalar'])
-        df['src_y'] = self.trace_header['SourceY'] / (-self.trace_header['SourceGroupScalar'])
-        df['rcv_x'] = self.trace_header['GroupX'] / (-self.trace_header['SourceGroupScalar'])
-        df['rcv_y'] = self.trace_header['GroupY'] / (-self.trace_header['SourceGroupScalar'])
+        df['src_x'] = scaled('SourceX')
+        df['src_y'] = scaled('SourceY')
+        df['rcv_x'] = scaled('GroupX')
+        df['rcv_y'] = scaled('GroupY')
         df['x'] = 0.5*(df['src_x'] + df['rcv_x'])
         df['y'] = 0.5*(df['src_y'] + df['rcv_y'])
         df.drop(['src_x', 'src_y', 'rcv_x', 'rcv_y'], axis=1, inplace=True)
-        # Compute CDP Fold
-
-        def _get_fold(row, df):
-            return np.in1d(df['cdp_num'].reset_index(drop=True),
-                           row['cdp_num']).sum()
-
-        df['fold'] = df.apply(lambda row: _get_fold(row, df), axis=1)
+        # Compute CDP Fold (trace count per CDP number)
+        df['fold'] = vm.seis.cdp.trace_fold(df['cdp_num'])
         # Set as instance variable
         self.midpoints = vm.seismic.cdp.CDP_line(df)
         vm.utils.print.info('Midpoints extracted', 3)
@@ -284,13 +350,10 @@ class Seis_navmerge(Segy):
         df['trace_id_code'] = self.trace_header['TraceIdentificationCode']
         df = df[df['trace_id_code'] == 1] # Keep only valid seismic traces
         df.drop(['trace_id_code'], axis=1, inplace=True)
-        # Get trace data
-        with segyio.open(self.stats['filename'], ignore_geometry=True) as f:
-            for ix, trace in enumerate(f.trace):
-                df.loc[ix+1, 'amplitude'] = trace.max() - trace.min()
-                df.loc[ix+1, 'rms'] = trace.std()
-                df.loc[ix+1, 'rms_top'] = trace[:int(len(trace)/2)].std()
-                df.loc[ix+1, 'rms_bkg'] = trace[int(len(trace)/2):-1].std()
+        # Get trace statistics, reduced block by block (index = trace seq.)
+        stats = vm.seis.segy.stats.trace_stats(self.blocks(headers=False),
+                                               self.stats['n_traces'])
+        df = df.join(stats)
         # Set as instance variable
         self.traces = vm.seismic.traces.Line(df)
         vm.utils.print.info('Traces extracted', 3)
@@ -328,33 +391,36 @@ class Seis_navmerge(Segy):
             vm.seismic.navmerge.amplitude_offset(self, par['output_type'])
             vm.seismic.navmerge.rms_map(self, par['output_type'])
             vm.seismic.navmerge.gathers_short(self, par)
+            vm.seismic.navmerge.spectra(self, par)
 
 
-            # Spectra (average, short & long offsets)
             # Export shots, offset classes
 
 
 class Seis_shot(Segy):
 
     def __init__(self):
-        pass
+        super().__init__()
 
 
 class Seis_section(Segy):
 
     def __init__(self):
-        pass
+        super().__init__()
 
 
-def import_section(filename, data=True):
+def import_section(filename, data=True, fields=None, cache=True):
     segy = Seis_section()
-    segy.load(filename, data)
+    segy.load(filename, data, fields, cache)
     return segy
 
 def import_navmerge(filename, data=False, rcv_header='CROSSLINE_3D',
-                    src_header='ShotPoint', src_between_rcv=True, epsg='2056'):
+                    src_header='ShotPoint', src_between_rcv=True, epsg='2056',
+                    cache=True):
     navmerge = Seis_navmerge()
-    navmerge.load(filename, data)
+    fields = NAVMERGE_FIELDS + [k for k in (rcv_header, src_header)
+                                if k not in NAVMERGE_FIELDS]
+    navmerge.load(filename, data, fields, cache)
     # Get line attributes from headers
     navmerge.get_attributes(epsg)
     # Extract RCV, SRC and CDP
@@ -18,7 +18,8 @@ distribution
 
 """
 
-__all__ = ['boxplot', 'hist', 'lines', 'scatter', 'seis', 'styles']
+__all__ = ['boxplot', 'density', 'hist', 'lines', 'scatter', 'seis',
+           'styles', 'templates']
 
 
 from .hist import distribution
@@ -26,6 +27,8 @@ from .lines import generic, fill
 from .scatter import xy_map
 from .seis import basemap_line, elevation, offset_cdp_fold, amplitude_offset
 from .seis import stacking, fold, cdp_spacing, rms_map, short_gathers
+from .seis import attribute_map
 
 
 from .styles import set_plot_styles
+from .templates import FigureTemplate
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+'''
+Density rasterization of large scatter plots (binned into a single image)
+'''
+import matplotlib as mpl
+import numpy as np
+
+# Number of points above which scatter plots are rasterized
+DENSITY_THRESHOLD = 100000
+
+# Scatter-only keywords, dropped when drawing an image
+_SCATTER_KWARGS = ['s', 'marker', 'linewidths', 'edgecolors']
+
+
+def bin_points(x, y, z=None, reduce='count', bins=(800, 600), extent=None):
+    '''Bin points into a regular 2-D grid
+
+    Parameters
+    ----------
+    x, y : np.array
+        point coordinates
+    z : np.array, optional
+        point values (required for all reductions but 'count')
+    reduce : str, optional
+        'count', 'sum', 'mean', 'min' or 'max' (defaults to 'count')
+    bins : tuple, optional
+        number of (x, y) bins (defaults to (800, 600))
+    extent : list, optional
+        [xmin, xmax, ymin, ymax] of the grid (defaults to the data bounds)
+
+    Returns
+    -------
+    np.array
+        2-D (y bins x x bins) grid, NaN where no point falls
+    list
+        [xmin, xmax, ymin, ymax] of the grid
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    nx, ny = int(bins[0]), int(bins[1])
+    if extent is None:
+        extent = [x.min(), x.max(), y.min(), y.max()]
+    xmin, xmax, ymin, ymax = extent
+    # Widen degenerate (single valued) axes
+    if xmax == xmin:
+        xmin, xmax = xmin - 0.5, xmax + 0.5
+    if ymax == ymin:
+        ymin, ymax = ymin - 0.5, ymax + 0.5
+    # Bin index of each point (points outside the extent are dropped)
+    ix = np.floor((x - xmin) / (xmax - xmin) * nx).astype(np.int64)
+    iy = np.floor((y - ymin) / (ymax - ymin) * ny).astype(np.int64)
+    ix[x == xmax] = nx - 1
+    iy[y == ymax] = ny - 1
+    inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+    flat = iy[inside] * nx + ix[inside]
+    count = np.bincount(flat, minlength=nx * ny).astype(np.float64)
+    if reduce == 'count':
+        grid = count
+    elif reduce in ['sum', 'mean']:
+        z = np.asarray(z, dtype=np.float64)[inside]
+        grid = np.bincount(flat, weights=z, minlength=nx * ny)
+        if reduce == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                grid = grid / count
+    elif reduce in ['min', 'max']:
+        z = np.asarray(z, dtype=np.float64)[inside]
+        # Sort once on the bin index and reduce each bin segment
+        order = np.argsort(flat, kind='stable')
+        flat, z = flat[order], z[order]
+        starts = np.flatnonzero(np.r_[True, flat[1:] != flat[:-1]])
+        grid = np.empty(nx * ny)
+        if len(starts) > 0:
+            ufunc = np.minimum if reduce == 'min' else np.maximum
+            grid[flat[starts]] = ufunc.reduceat(z, starts)
+    else:
+        raise ValueError(f'Unknown reduction: {reduce}')
+    grid = np.where(count > 0, grid, np.nan)
+    return grid.reshape(ny, nx), [xmin, xmax, ymin, ymax]
+
+
+def _pixel_bins(ax, x, y, aspect=None):
+    # Number of (x, y) bins at the axes pixel resolution, square in display
+    # units when the axes aspect is fixed
+    width, height = max(1., ax.bbox.width), max(1., ax.bbox.height)
+    if aspect is None:
+        return int(width), int(height)
+    dx = np.ptp(np.asarray(x, dtype=np.float64))
+    dy = np.ptp(np.asarray(y, dtype=np.float64)) * aspect
+    size = max(dx / width, dy / height)
+    if size == 0:
+        return 1, 1
+    return max(1, int(np.ceil(dx / size))), max(1, int(np.ceil(dy / size)))
+
+
+def scatter(ax, x, y, c=None, reduce='mean', threshold=DENSITY_THRESHOLD,
+            bins=None, aspect=None, **kwargs):
+    '''Scatter plot that is rasterized into a density image for many points
+
+    Up to threshold points, this is ax.scatter. Above it, points are binned
+    at the axes pixel resolution (reducing c per pixel, or counting points
+    if c is None) and drawn as a single image, so that rendering time does
+    not depend on the number of points.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        axes to draw on
+    x, y : array-like
+        point coordinates
+    c : array-like, optional
+        point values (colors)
+    reduce : str, optional
+        reduction of c per pixel: 'mean', 'sum', 'min' or 'max' (defaults
+        to 'mean'), ignored if c is None (points are counted)
+    threshold : int, optional
+        number of points above which the plot is rasterized
+    bins : tuple, optional
+        number of (x, y) pixels (defaults to the axes size in pixels)
+    aspect : float, optional
+        axes aspect (e.g. 1 for maps), set before the pixel grid is sized so
+        that rasterized pixels are square
+    kwargs
+        ax.scatter keywords (cmap, norm, alpha... are passed to the image as
+        well, label to an empty proxy scatter for the legend)
+
+    Returns
+    -------
+    matplotlib.collections.PathCollection or matplotlib.image.AxesImage
+        mappable, usable for colorbars
+    '''
+    if aspect is not None:
+        ax.set_aspect(aspect)
+    if len(x) <= threshold:
+        return ax.scatter(x, y, c=c, **kwargs)
+    if bins is None:
+        bins = _pixel_bins(ax, x, y, aspect)
+    if c is None:
+        reduce = 'count'
+        kwargs.setdefault('norm', mpl.colors.LogNorm())
+    grid, extent = bin_points(x, y, c, reduce=reduce, bins=bins)
+    for k in _SCATTER_KWARGS:
+        kwargs.pop(k, None)
+    label = kwargs.pop('label', None)
+    img = ax.imshow(grid, extent=extent, origin='lower',
+                    aspect='auto' if aspect is None else aspect,
+                    interpolation='nearest', **kwargs)
+    if label is not None:
+        # Images have no legend entry: empty scatter as a proxy handle
+        ax.scatter([], [], marker='s', color=img.cmap(0.5), label=label,
+                   alpha=kwargs.get('alpha'))
+    # Keep the limits of other artists already on the axes
+    ax.autoscale_view()
+    return img
+
+
+def _axis_index(values):
+    # Regular axis over station values (step = smallest station increment)
+    stations = np.unique(values)
+    steps = np.diff(stations)
+    step = steps.min() if len(steps) > 0 else 1.
+    index = np.rint((values - stations[0]) / step).astype(np.int64)
+    return index, stations[0], step
+
+
+def station_grid(x, y, z, reduce='mean'):
+    '''Grid values on a regular station matrix (e.g. receiver x source)
+
+    Parameters
+    ----------
+    x, y : array-like
+        station numbers of each value (e.g. rcv_station, src_station)
+    z : array-like
+        values (e.g. a trace attribute)
+    reduce : str, optional
+        reduction of values sharing a station pair: 'mean', 'sum', 'min' or
+        'max' (defaults to 'mean')
+
+    Returns
+    -------
+    np.array
+        2-D (y stations x x stations) grid, NaN where no value falls
+    list
+        [xmin, xmax, ymin, ymax] extent of the grid cells
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    ix, x0, dx = _axis_index(x)
+    iy, y0, dy = _axis_index(y)
+    nx, ny = ix.max() + 1, iy.max() + 1
+    grid, _ = bin_points(ix, iy, z, reduce=reduce, bins=(nx, ny),
+                         extent=[-0.5, nx - 0.5, -0.5, ny - 0.5])
+    extent = [x0 - dx / 2, x0 + (nx - 0.5) * dx,
+              y0 - dy / 2, y0 + (ny - 0.5) * dy]
+    return grid, extent
@@ -1,9 +1,15 @@
-import math
+import pathlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import matplotlib.gridspec as gridspec
 import numpy as np
+import vmlib as vm
+from . import density
 from . styles import set_plot_styles
+from .templates import FigureTemplate
+from ..stats.sketch import QuantileSketch
 from ..plot import hist
 
 
@@ -31,8 +37,8 @@ def basemap_line(file, outfile, src, rcv, cdp, midpoints):
         y = file.midpoints.data['y']
         z = abs(file.midpoints.data['offset'])
         cmap = mpl.cm.get_cmap('viridis')
-        scat = ax.scatter(x, y, c=z, cmap=cmap, label='Midpoints',
-                          s=0.5, alpha=0.8)
+        scat = density.scatter(ax, x, y, c=z, cmap=cmap, label='Midpoints',
+                               s=0.5, alpha=0.8, aspect=1.0)
         fig.colorbar(scat, ax=ax, label='Absolute offset [m]', fraction=0.046,
                      pad=0.04)
     # Tuning labels and titles
@@ -82,7 +88,7 @@ def offset_cdp_fold(file, outfile):
     y = file.midpoints.data['offset']
     z = file.midpoints.data['fold']
     cmap = mpl.cm.get_cmap('viridis')
-    scat = ax.scatter(x, y, c=z, cmap=cmap, s=1)
+    scat = density.scatter(ax, x, y, c=z, reduce='max', cmap=cmap, s=1)
     fig.colorbar(scat, ax=ax, label='CDP Fold', fraction=0.046,
                  pad=0.04)
     # Tuning labels and titles
@@ -105,7 +111,7 @@ def amplitude_offset(file, outfile):
     # Plot variables
     x = file.traces.data['offset']
     y = file.traces.data['amplitude']
-    ax.scatter(x, y, s=1)
+    density.scatter(ax, x, y, s=1)
     ax.set_ylim([0, max(y)])
     # Tuning labels and titles
     ax.set_xlabel('Offset [m]')
@@ -129,7 +135,7 @@ def stacking(file, outfile):
     y = file.midpoints.data['src_station']
     z = file.midpoints.data['offset']
     cmap = mpl.cm.get_cmap('viridis')
-    scat = ax.scatter(x, y, c=z, cmap=cmap, s=1)
+    scat = density.scatter(ax, x, y, c=z, cmap=cmap, s=1)
     fig.colorbar(scat, ax=ax, label='Offset [m]', fraction=0.046,
                  pad=0.04)
     # Tuning labels and titles
@@ -149,11 +155,9 @@ def fold(file, outfile):
     # Create figure
     fig = plt.figure(figsize=(14, 8))
     ax = fig.add_subplot(1, 1, 1)
-    # Plot variables
-    # Remove duplicates and sort
-    df = file.midpoints.data[['cdp_num', 'fold']].copy()
-    df.drop_duplicates(inplace=True)
-    x = df['cdp_num']
+    # Plot variables (fold per CDP table)
+    df = file.midpoints.fold()
+    x = df.index
     y = df['fold']
     ax.fill_between(x, y1=y, y2=0, alpha=0.6, linewidth=0.25)
     ax.plot(x, y, '-k', linewidth=0.25)
@@ -173,12 +177,9 @@ def cdp_spacing(file, outfile):
     # Get CDP and drop duplicates
     df = file.midpoints.data[['cdp_num', 'cdp_x', 'cdp_y']].copy()
     df.drop_duplicates(inplace=True)
-    cdp_x = list(df['cdp_x'])
-    cdp_y = list(df['cdp_y'])
     # Compute spacing
-    dx = [(cdp_x[i] - cdp_x[i - 1]) for i in range(1, len(cdp_x))]
-    dy = [(cdp_y[i] - cdp_y[i - 1]) for i in range(1, len(cdp_y))]
-    spacing = [math.sqrt(dx[i]**2 + dy[i]**2) for i in range(len(dx))]
+    metrics = vm.seis.geometry.line_metrics(df['cdp_x'], df['cdp_y'])
+    spacing = metrics['spacing'].dropna()
     # Plot and save
     hist.distribution(var=spacing,
                       bins=20,
@@ -189,85 +190,244 @@ def cdp_spacing(file, outfile):
                       out=outfile)
 
 
+# Trace attribute -> title of the RMS maps
+RMS_MAPS = {'rms': 'Whole trace',
+            'rms_top': 'Top half of each trace',
+            'rms_bkg': 'Bottom half of each trace'}
+
+
 def rms_map(file, outfile):
+    attribute_map(file, outfile, RMS_MAPS, 'RMS Maps')
+
+
+def attribute_map(file, outfile, attributes, title, reduce='mean',
+                  norm=mpl.colors.LogNorm):
+    '''Receiver station x source station maps of trace attributes
+
+    Parameters
+    ----------
+    file : vmlib.io.segy.Segy
+        loaded file, with trace attributes in file.traces.data
+    outfile : pathlib.Path or str
+        output image file
+    attributes : dict
+        trace attribute column -> map title, one map per attribute
+    title : str
+        figure title
+    reduce : str, optional
+        reduction of traces sharing a station pair (defaults to 'mean')
+    norm : matplotlib.colors.Normalize, optional
+        color normalization class (defaults to LogNorm), None for linear
+    '''
     # Reset styles and apply vmlib ones
     plt.style.use('ggplot')
     set_plot_styles()
     # Create figure
-    fig, axs = plt.subplots(3, 1, figsize=(15, 20))
-    # Plot heat map
-    x, y = [], []
-    rms, rms_top, rms_bot = [], [], []
-    for index, row in file.traces.data.iterrows():
-        x.append(row['rcv_station'])
-        y.append(row['src_station'])
-        rms.append(row['rms'])
-        rms_top.append(row['rms_top'])
-        rms_bot.append(row['rms_bkg'])
-    # Plot main rms
+    n = len(attributes)
+    fig, axs = plt.subplots(n, 1, figsize=(15, 20 * n / 3), squeeze=False)
+    axs = axs[:, 0]
+    df = file.traces.data
+    x = df['rcv_station'].to_numpy()
+    y = df['src_station'].to_numpy()
+    # Plot heat maps
     cmap = mpl.cm.get_cmap('jet')
-    axs[0].scatter(x, y, c=rms, cmap=cmap, linewidths=0,
-                   norm=mpl.colors.LogNorm())
-    axs[1].scatter(x, y, c=rms_top, cmap=cmap, linewidths=0,
-                   norm=mpl.colors.LogNorm())
-    axs[2].scatter(x, y, c=rms_bot, cmap=cmap, linewidths=0,
-                   norm=mpl.colors.LogNorm())
+    for ax, (column, subtitle) in zip(axs, attributes.items()):
+        grid, extent = density.station_grid(x, y, df[column].to_numpy(),
+                                            reduce=reduce)
+        ax.imshow(grid, extent=extent, origin='lower', cmap=cmap,
+                  norm=norm() if norm is not None else None,
+                  interpolation='nearest')
+        ax.set_title(subtitle)
     # Tuning labels and titles
     for ax in axs:
         ax.set_xlabel('RCV Station')
         ax.set_ylabel('SRC Station')
         ax.set_aspect(1)
-        ax.set_xlim(min(x),max(x))
-        ax.set_ylim(min(y),max(y))
-    axs[0].set_title('Whole trace')
-    axs[1].set_title('Top half of each trace')
-    axs[2].set_title('Bottom half of each trace')
-    fig.suptitle(f"RMS Maps - {file.attributes['line']}")
+        ax.grid(False)
+    fig.suptitle(f"{title} - {file.attributes['line']}")
     # Save
     fig.savefig(outfile)
     plt.close(fig)
 
 
-def short_gathers(file, shots, out_folder, par):
+def spectra(file, result, outfile, offset_edges=None):
+    '''Amplitude spectra of the line, per offset class and per shot
+
+    Parameters
+    ----------
+    file : vmlib.io.segy.Segy
+        loaded file
+    result : dict
+        spectra per grouping level ('line', 'offset' and 'shot'), as
+        returned by vmlib.seis.segy.spectra.spectra
+    outfile : pathlib.Path or str
+        output image file
+    offset_edges : tuple, optional
+        offset class edges of the result (defaults to
+        vmlib.seis.segy.spectra.OFFSET_CLASSES), for the legend
+    '''
     # Reset styles and apply vmlib ones
     plt.style.use('ggplot')
     set_plot_styles()
-    for ffid in shots.keys():
-        shot = shots[ffid]
-        # Create figure
-        fig = plt.figure(figsize=(14, 8))
-        gs = gridspec.GridSpec(4,4)
-        ax = fig.add_subplot(gs[1::, :])
-        ax2 = fig.add_subplot(gs[0, :])
-        # Display seismic shot
-        extent = [shot['rcvs'][0], shot['rcvs'][-1],
-                  shot['twt'][-1], shot['twt'][0]]
-        img = shot['data'].T
-        img = img / img.max(axis=0)
-        vm = np.percentile(img, 98)
-        ax.imshow(img, cmap="Greys", vmin=-vm, vmax=vm, extent=extent,
-                  aspect='auto')
-        # Display shot position
-        ax.axvline(shot['src'], color='r')
+    # Create figure
+    fig = plt.figure(figsize=(14, 16))
+    gs = gridspec.GridSpec(3, 1, figure=fig)
+    ax1 = fig.add_subplot(gs[0])
+    ax2 = fig.add_subplot(gs[1], sharex=ax1)
+    ax3 = fig.add_subplot(gs[2], sharex=ax1)
+    # Amplitudes in dB, relative to the peak of the line mean spectrum
+    line = result['line']
+    ref = np.nanmax(line['mean'].to_numpy())
+
+    def db(values):
+        with np.errstate(divide='ignore'):
+            return 20 * np.log10(np.asarray(values) / ref)
+    freqs = line['mean'].columns.to_numpy()
+    # Line: mean spectrum and percentile band
+    pct = sorted((k for k in line if k.startswith('p')),
+                 key=lambda k: float(k[1:]))
+    if len(pct) > 1:
+        ax1.fill_between(freqs, db(line[pct[0]].iloc[0]),
+                         db(line[pct[-1]].iloc[0]), alpha=0.3,
+                         label=f'{pct[0][1:]}-{pct[-1][1:]}th percentiles')
+    ax1.plot(freqs, db(line['mean'].iloc[0]), '-k', label='Mean')
+    ax1.set_ylabel('Amplitude [dB]')
+    ax1.set_title('Average spectrum')
+    ax1.legend()
+    # Offset classes: mean spectra
+    classes = result['offset']['mean']
+    if offset_edges is None:
+        offset_edges = vm.seis.segy.spectra.OFFSET_CLASSES
+    edges = list(offset_edges)
+    for lower in classes.index:
+        upper = [e for e in edges if e > lower]
+        label = f'{lower:g}-{upper[0]:g} m' if upper else f'> {lower:g} m'
+        ax2.plot(freqs, db(classes.loc[lower]), label=label)
+    ax2.set_ylabel('Amplitude [dB]')
+    ax2.set_title('Average spectrum per offset class')
+    ax2.legend()
+    # Shots: mean spectra as a (shot x frequency) image
+    shots = result['shot']['mean']
+    df = freqs[1] - freqs[0] if len(freqs) > 1 else 1.
+    img = ax3.imshow(db(shots.to_numpy()), aspect='auto', origin='lower',
+                     interpolation='nearest', cmap='jet',
+                     extent=[freqs[0] - df / 2, freqs[-1] + df / 2,
+                             -0.5, len(shots) - 0.5])
+    # Label a subset of shots with their FFID
+    ticks = np.unique(np.linspace(0, len(shots) - 1, 10).astype(int))
+    ax3.set_yticks(ticks)
+    ax3.set_yticklabels(shots.index[ticks])
+    fig.colorbar(img, ax=ax3, label='Amplitude [dB]', pad=0.01)
+    ax3.set_xlabel('Frequency [Hz]')
+    ax3.set_ylabel('FFID')
+    ax3.set_title('Average spectrum per shot')
+    ax3.grid(False)
+    ax1.set_xlim([freqs[0], freqs[-1]])
+    fig.suptitle(f"Amplitude spectra - {file.attributes['line']}")
+    # Save
+    fig.savefig(outfile)
+    plt.close(fig)
+
+
+def short_gathers(file, shots, out_folder, par):
+    '''Render one short-offset gather image per FFID
+
+    Gathers are rendered in a pool of par['n_workers'] processes (Agg
+    backend, one ShotGatherTemplate per worker). Gather samples are handed
+    to the workers through a temporary memory-mapped .npy file instead of
+    pickled arrays. Output files are named SRC_<ffid>_short_offsets.jpg.
+    '''
+    out_folder = pathlib.Path(out_folder)
+    n_workers = par.get('n_workers', 1)
+    ffids = list(shots.keys())
+    outfiles = [out_folder.joinpath(f'SRC_{ffid}_short_offsets.jpg')
+                for ffid in ffids]
+    if len(ffids) == 0:
+        return outfiles
+    # Serial rendering, reusing a single figure
+    if n_workers <= 1:
+        with ShotGatherTemplate() as template:
+            template.render_all([(ffid, shots[ffid]) for ffid in ffids],
+                                outfiles)
+        return outfiles
+    # Parallel rendering, gathers stacked in a shared memmap
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp).joinpath('gathers.npy')
+        n_traces = sum(len(shots[ffid]['data']) for ffid in ffids)
+        n_samples = len(shots[ffids[0]]['twt'])
+        data = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                         shape=(n_traces, n_samples))
+        tasks, start = [], 0
+        for ffid, outfile in zip(ffids, outfiles):
+            shot = shots[ffid]
+            stop = start + len(shot['data'])
+            data[start:stop] = shot['data']
+            meta = {k: v for k, v in shot.items() if k != 'data'}
+            tasks.append((ffid, meta, str(path), start, stop, outfile))
+            start = stop
+        data.flush()
+        del data
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 initializer=_init_worker) as pool:
+            list(pool.map(_render_task, tasks))
+    return outfiles
+
+
+# Figure template reused by each rendering worker process
+_WORKER = {}
+
+
+def _init_worker():
+    mpl.use('Agg')
+    _WORKER['template'] = ShotGatherTemplate()
+
+
+def _render_task(task):
+    ffid, shot, path, start, stop, outfile = task
+    shot = dict(shot, data=np.load(path, mmap_mode='r')[start:stop])
+    return _WORKER['template'].render((ffid, shot), outfile)
+
+
+class ShotGatherTemplate(FigureTemplate):
+    '''Short-offset gather figure, rendered for (ffid, shot) items'''
+
+    def __init__(self, styles=True):
+        super().__init__(figsize=(14, 8), styles=styles)
+
+    def build(self):
+        gs = gridspec.GridSpec(4, 4)
+        ax = self.add('ax', self.fig.add_subplot(gs[1::, :]))
+        ax2 = self.add('ax2', self.fig.add_subplot(gs[0, :]))
+        self.add('img', ax.imshow(np.zeros((2, 2)), cmap="Greys",
+                                  aspect='auto'))
+        self.add('src', ax.axvline(0, color='r'))
+        self.add('offsets', ax2.plot([], [])[0])
         # Adapt ticks
         ax.ticklabel_format(useOffset=False)
         ax2.ticklabel_format(useOffset=False)
-        # Display offset curve on top
-        ax2.plot(shot['rcvs'], [abs(x) for x in shot['offsets']])
         # Axes & Co
         ax.set_xlabel('RCV Stations')
         ax.set_ylabel('Samples')
         ax2.set_ylabel('Offsets [m]')
         ax2.set_xticks([])
         ax2.spines['bottom'].set_visible(False)
-        ax2.set_xlim(min(shot['rcvs'])-0.5, max(shot['rcvs'])+0.5)
-        ax2.set_ylim(0, max(shot['offsets']))
-        fig.suptitle(f"FFID {ffid} - Station {shot['src']}")
         ax.xaxis.grid(False)
         ax.yaxis.grid(False)
-        # Save
-        outfile = f"{out_folder}\SRC_{ffid}_short_offsets.jpg"
-        fig.savefig(outfile)
-        plt.close(fig)
-
 
+    def update(self, item):
+        ffid, shot = item
+        # Display seismic shot
+        extent = [shot['rcvs'][0], shot['rcvs'][-1],
+                  shot['twt'][-1], shot['twt'][0]]
+        img = shot['data'].T
+        img = img / img.max(axis=0)
+        clip = QuantileSketch().update(img).percentile(98)
+        self.set_image('img', img, extent=extent, clim=(-clip, clip))
+        # Display shot position and offset curve on top
+        self['src'].set_xdata([shot['src'], shot['src']])
+        offsets = np.abs(shot['offsets'])
+        self.set_line('offsets', shot['rcvs'], offsets)
+        self.set_limits('ax2',
+                        xlim=(min(shot['rcvs'])-0.5, max(shot['rcvs'])+0.5),
+                        ylim=(0, max(offsets)))
+        self.set_title(f"FFID {ffid} - Station {shot['src']}")
@@ -83,7 +83,9 @@ def saveParameter(dpi):
     '''
     mpl.rcParams['savefig.dpi'] = dpi
     mpl.rcParams['savefig.pad_inches'] = 0.1
-    mpl.rcParams['savefig.jpeg_quality'] = 95
+    # Removed in matplotlib 3.3 (JPEG quality is then a Pillow option)
+    if 'savefig.jpeg_quality' in mpl.rcParams:
+        mpl.rcParams['savefig.jpeg_quality'] = 95
 
 
 def textParameter(size):
@@ -137,7 +139,7 @@ def lineParameter():
     mpl.rcParams['lines.linewidth'] = 0.75
     mpl.rcParams['lines.linestyle'] = '-'
     mpl.rcParams['lines.color'] = 'E24A33'
-    mpl.rcParams['lines.marker'] = None
+    mpl.rcParams['lines.marker'] = 'None'
     mpl.rcParams['lines.markeredgewidth'] = 0.5
     mpl.rcParams['lines.markersize'] = 2
     mpl.rcParams['lines.markerfacecolor'] = 'auto'
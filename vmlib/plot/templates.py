@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+'''
+Reusable figure templates for series of similar plots (per shot, per line)
+'''
+import matplotlib.pyplot as plt
+from .styles import set_plot_styles
+
+
+class FigureTemplate():
+    '''Figure layout built once and re-rendered for each item of a series
+
+    Subclasses implement build (create the axes and artists of the figure,
+    registered with add) and update (swap data, limits and titles for one
+    item). Styles are applied and the figure is created once, so that each
+    rendered item only costs the artist updates and the save.
+
+    Parameters
+    ----------
+    figsize : tuple, optional
+        figure size in inches (defaults to (12, 8))
+    styles : bool, optional
+        apply the ggplot and vmlib styles before building (defaults to True)
+    '''
+
+    def __init__(self, figsize=(12, 8), styles=True):
+        if styles:
+            # Reset styles and apply vmlib ones
+            plt.style.use('ggplot')
+            set_plot_styles()
+        self.fig = plt.figure(figsize=figsize)
+        self.artists = {}
+        self.title = self.fig.suptitle('')
+        self.build()
+
+    def __getitem__(self, name):
+        return self.artists[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def build(self):
+        '''Create the axes and artists of the figure'''
+        raise NotImplementedError
+
+    def update(self, item):
+        '''Swap data, limits and titles for one item'''
+        raise NotImplementedError
+
+    def add(self, name, artist):
+        '''Register an artist (or axes) under a name, returns the artist'''
+        self.artists[name] = artist
+        return artist
+
+    def render(self, item, outfile):
+        '''Update the figure for an item and save it to outfile'''
+        self.update(item)
+        self.fig.savefig(outfile)
+        return outfile
+
+    def render_all(self, items, outfiles):
+        '''Render a series of items to their matching output files'''
+        return [self.render(item, outfile)
+                for item, outfile in zip(items, outfiles)]
+
+    def close(self):
+        plt.close(self.fig)
+
+    def set_image(self, name, data, extent=None, clim=None):
+        '''Swap the data (and optionally extent and color limits) of an image
+        '''
+        img = self.artists[name]
+        img.set_data(data)
+        if extent is not None:
+            img.set_extent(extent)
+        if clim is not None:
+            img.set_clim(*clim)
+        return img
+
+    def set_line(self, name, x, y):
+        '''Swap the data of a line'''
+        line = self.artists[name]
+        line.set_data(x, y)
+        return line
+
+    def set_limits(self, name, xlim=None, ylim=None):
+        '''Set the x and/or y limits of an axes'''
+        ax = self.artists[name]
+        if xlim is not None:
+            ax.set_xlim(*xlim)
+        if ylim is not None:
+            ax.set_ylim(*ylim)
+        return ax
+
+    def set_title(self, text):
+        '''Set the figure title'''
+        self.title.set_text(text)
+        return self.title
@@ -12,8 +12,8 @@ distance
 
 """
 
-__all__ = ['cdp', 'navmerge', 'rcv', 'src', 'traces',
-           'rx_sect_plot', 'rx_sect_qc', 'segy']
+__all__ = ['cdp', 'gathers', 'geometry', 'navmerge', 'rcv', 'src',
+           'traces', 'rx_sect_plot', 'rx_sect_qc', 'segy']
 
 from .cdp import CDP_line
 from .navmerge import basemap, elevation, offset_cdp_fold, amplitude_offset
@@ -26,6 +26,8 @@ from .src import SRC_line
 from .traces import Line
 
 
+from . import gathers
+from . import geometry
 from . import plot
 from . import qc
 from . import segy
@@ -1,7 +1,55 @@
+import numpy as np
+import pandas as pd
+
+
 class CDP_line():
     # 2D single line dataframe
 
     def __init__(self, data):
         self.data = data
 
+    def fold(self, offset_range=None):
+        '''Fold per CDP, optionally restricted to an absolute offset range'''
+        return fold(self.data['cdp_num'], self.data['offset'], offset_range)
+
 # 2D multiline dataframe
+
+
+def _count(cdp, offset=None, offset_range=None):
+    # Sort-based CDP numbering, then a single bincount over the traces
+    cdps, inverse = np.unique(np.asarray(cdp), return_inverse=True)
+    inverse = inverse.ravel()
+    weights = None
+    if offset_range is not None:
+        offset = np.abs(np.asarray(offset))
+        weights = (offset >= offset_range[0]) & (offset <= offset_range[1])
+    counts = np.bincount(inverse, weights=weights, minlength=len(cdps))
+    return cdps, counts.astype(int), inverse
+
+
+def fold(cdp, offset=None, offset_range=None):
+    '''Count traces per CDP number
+
+    Parameters
+    ----------
+    cdp : np.array or pd.Series
+        CDP number of each trace
+    offset : np.array or pd.Series, optional
+        offset of each trace (required if offset_range is set)
+    offset_range : list, optional
+        [min, max] absolute offsets (inclusive) of the counted traces
+
+    Returns
+    -------
+    pd.DataFrame
+        fold column, index = sorted CDP numbers (cdp_num)
+    '''
+    cdps, counts, _ = _count(cdp, offset, offset_range)
+    return pd.DataFrame({'fold': counts},
+                        index=pd.Index(cdps, name='cdp_num'))
+
+
+def trace_fold(cdp, offset=None, offset_range=None):
+    '''Fold of the CDP of each trace (aligned on the input traces)'''
+    _, counts, inverse = _count(cdp, offset, offset_range)
+    return counts[inverse]
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+'''
+Sort-once segment reductions of trace tables (shots, receivers, CDPs)
+'''
+import numpy as np
+import pandas as pd
+
+_REDUCERS = {'sum': np.add, 'min': np.minimum, 'max': np.maximum}
+
+
+def segments(keys):
+    '''Sort trace keys once and locate the segment of each key
+
+    Parameters
+    ----------
+    keys : np.array or pd.Series
+        gather key of each trace (e.g. FieldRecord)
+
+    Returns
+    -------
+    np.array
+        stable sort order of the traces
+    np.array
+        unique (sorted) keys
+    np.array
+        start position of each key segment in the sorted traces
+    '''
+    keys = np.asarray(keys)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    return order, sorted_keys[starts], starts
+
+
+def aggregate(df, key, aggregations):
+    '''Group a trace table on a key with a single sort
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        trace table (e.g. trace headers)
+    key : str
+        column to group on
+    aggregations : dict
+        output column -> (input column, reduction), where reduction is one
+        of 'mean', 'sum', 'min', 'max', 'count', 'first' or 'last'
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per key value (sorted), index named after key
+    '''
+    order, keys, starts = segments(df[key])
+    counts = np.diff(np.r_[starts, len(order)])
+    result = {}
+    for name, (column, how) in aggregations.items():
+        if how == 'count':
+            result[name] = counts
+            continue
+        values = df[column].to_numpy()[order]
+        if how == 'first':
+            result[name] = values[starts]
+        elif how == 'last':
+            result[name] = values[starts + counts - 1]
+        elif how == 'mean':
+            result[name] = np.add.reduceat(values.astype(np.float64),
+                                           starts) / counts
+        else:
+            result[name] = _REDUCERS[how].reduceat(values, starts)
+    return pd.DataFrame(result, index=pd.Index(keys, name=key))
+
+
+# Gather key aliases -> trace header fields
+GATHER_KEYS = {'ffid': 'FieldRecord', 'shot': 'FieldRecord', 'cdp': 'CDP',
+               'channel': 'TraceNumber', 'offset': 'offset'}
+
+
+class GatherIndex():
+    '''Map each gather key value to its sorted trace-index ranges
+
+    Parameters
+    ----------
+    runs : pd.DataFrame
+        one row per run of consecutive traces, sorted on (key, start), with
+        columns key, start and stop (0-based trace positions, stop excluded)
+    '''
+
+    def __init__(self, runs):
+        self.runs = runs
+        self._keys = runs['key'].to_numpy()
+        self._start = runs['start'].to_numpy()
+        self._stop = runs['stop'].to_numpy()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, value):
+        return len(self.ranges(value)) > 0
+
+    @classmethod
+    def build(cls, values):
+        '''Build the index from the key value of each trace (file order)'''
+        order, _, _ = segments(values)
+        sorted_keys = np.asarray(values)[order]
+        # A new run starts at each key change or trace position jump
+        breaks = np.r_[True, (sorted_keys[1:] != sorted_keys[:-1]) |
+                       (np.diff(order) != 1)]
+        run_starts = np.flatnonzero(breaks)
+        run_stops = np.r_[run_starts[1:], len(order)]
+        return cls(pd.DataFrame({'key': sorted_keys[run_starts],
+                                 'start': order[run_starts],
+                                 'stop': order[run_stops - 1] + 1}))
+
+    @property
+    def keys(self):
+        '''Sorted unique key values'''
+        return np.unique(self._keys)
+
+    def ranges(self, value):
+        '''List of (start, stop) trace ranges of a key value'''
+        lo = np.searchsorted(self._keys, value, side='left')
+        hi = np.searchsorted(self._keys, value, side='right')
+        return list(zip(self._start[lo:hi], self._stop[lo:hi]))
+
+    def traces(self, value):
+        '''Sorted trace positions (0-based) of a key value'''
+        ranges = self.ranges(value)
+        if len(ranges) == 0:
+            return np.array([], dtype=int)
+        return np.concatenate([np.arange(a, b) for a, b in ranges])
+
+    def read(self, traces, value):
+        '''Read the traces of a key value from a sliceable 2-D trace array
+
+        Parameters
+        ----------
+        traces : vmlib.seis.segy.memmap.TraceArray or np.array
+            traces x samples array (only the gather ranges are read)
+        value : int
+            key value
+
+        Returns
+        -------
+        np.array
+            2-D (gather traces x samples) array
+        '''
+        ranges = self.ranges(value)
+        if len(ranges) == 0:
+            raise KeyError(f'{value} not in gather index')
+        return np.concatenate([traces[a:b] for a, b in ranges])
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+'''
+Geometry metrics of seismic lines (CDP, receiver or source points)
+'''
+import numpy as np
+import pandas as pd
+from .segy.headers import apply_scalar
+
+
+def scaled_coordinates(df, x='CDP_X', y='CDP_Y', scalar='SourceGroupScalar'):
+    '''Coordinates from trace headers, with the coordinate scalar applied
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        trace header table
+    x, y : str, optional
+        coordinate fields (defaults to CDP_X and CDP_Y)
+    scalar : str, optional
+        coordinate scalar field (defaults to SourceGroupScalar)
+
+    Returns
+    -------
+    np.array
+        scaled x coordinates
+    np.array
+        scaled y coordinates
+    '''
+    return (apply_scalar(df[x], df[scalar]),
+            apply_scalar(df[y], df[scalar]))
+
+
+def line_metrics(x, y, spacing=None):
+    '''Spacing, chainage, deviation and heading of consecutive line points
+
+    Parameters
+    ----------
+    x, y : array-like
+        point coordinates, in line order
+    spacing : float, optional
+        theoretical point spacing, for the chainage deviation
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per point, with columns:
+        - x, y: coordinates
+        - spacing: distance to the previous point (NaN for the first one)
+        - chainage: cumulative distance along the line (0 at the first one)
+        - deviation: chainage minus theoretical chainage (if spacing is set)
+        - heading: azimuth of the segment from the previous point, in
+          degrees clockwise from north
+        - heading_change: heading difference with the previous segment,
+          in degrees within [-180, 180)
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    dx, dy = np.diff(x), np.diff(y)
+    step = np.hypot(dx, dy)
+    heading = np.degrees(np.arctan2(dx, dy)) % 360
+    turn = (np.diff(heading) + 180) % 360 - 180
+    df = pd.DataFrame({'x': x, 'y': y,
+                       'spacing': np.r_[np.nan, step],
+                       'chainage': np.r_[0., np.cumsum(step)]})
+    if spacing is not None:
+        df['deviation'] = df['chainage'] - spacing * np.arange(len(x))
+    df['heading'] = np.r_[np.nan, heading]
+    df['heading_change'] = np.r_[np.nan, np.nan, turn][:len(x)]
+    return df
@@ -1,5 +1,4 @@
 import numpy as np
-import segyio
 import vmlib as vm
 
 
@@ -75,6 +74,27 @@ def rms_map(file, output='root'):
     return outfile
 
 
+def spectra(file, par):
+    outfile = _get_outfilename(file, par['output_type'], 'Spectra',
+                               'spectra')
+    # Grouping levels: whole line, offset classes and shots
+    df = file.trace_header
+    edges = par.get('spectra_offsets', vm.seis.segy.spectra.OFFSET_CLASSES)
+    groups = {'line': np.zeros(len(df), dtype=np.int64),
+              'offset': vm.seis.segy.spectra.offset_classes(df['offset'],
+                                                            edges),
+              'shot': df['FieldRecord'].to_numpy()}
+    # Single streaming pass over the traces, percentile spectra of the whole
+    # line only (shots and offset classes are displayed as mean spectra)
+    result = vm.seis.segy.spectra.spectra(
+        file.blocks(headers=False), file.stats['twt'], groups,
+        window=par.get('spectra_window'),
+        percentiles={'line': (10, 50, 90)})
+    vm.plot.seis.spectra(file, result, outfile, edges)
+    vm.utils.print.info('Spectra created', 3)
+    return outfile
+
+
 def gathers_short(file, par):
     # General parameters
     out_folder = _get_outfolder(file, 'Shot Gathers')
@@ -82,21 +102,24 @@ def gathers_short(file, par):
     # Get list of all FFIDs and create dict
     ffids = file.trace_header['FieldRecord'].unique()
     shots = {k:{'src': 0, 'data': [], 'offsets': [], 'rcvs': [], 'twt': twt} for k in ffids}
-    # Open file and loop on each trace
-    with segyio.open(file.stats['filename'], ignore_geometry=True) as f:
-        for ix, trace in enumerate(f.trace):
-            off = file.traces.data.loc[ix+1, 'offset']
-            if abs(off) <= par['short_offset_lim']:
-                tr_ffid = file.trace_header.loc[ix + 1, 'FieldRecord']
-                src = file.traces.data.loc[ix+1, 'src_station']
-                rcv = file.traces.data.loc[ix+1, 'rcv_station']
-                shots[tr_ffid]['src'] = src
-                shots[tr_ffid]['data'].append(trace[:len(twt)].copy())
-                shots[tr_ffid]['offsets'].append(off)
-                shots[tr_ffid]['rcvs'].append(rcv)
-    # Format to np.array
+    # Stream trace blocks and keep short offset traces, grouped by FFID
+    lim = par['short_offset_lim']
+    for _, block, header in file.blocks():
+        data = file.traces.data.reindex(header.index)
+        keep = (data['offset'].abs() <= lim).to_numpy()
+        block = block[keep, :len(twt)]
+        data = data[keep]
+        block_ffids = header['FieldRecord'].to_numpy()[keep]
+        for ffid in np.unique(block_ffids):
+            sel = block_ffids == ffid
+            shots[ffid]['src'] = data['src_station'].to_numpy()[sel][-1]
+            shots[ffid]['data'].append(block[sel])
+            shots[ffid]['offsets'].extend(data['offset'].to_numpy()[sel])
+            shots[ffid]['rcvs'].extend(data['rcv_station'].to_numpy()[sel])
+    # Format to np.array, dropping shots without short offset traces
+    shots = {k: v for k, v in shots.items() if len(v['data']) > 0}
     for ffid in shots.keys():
-        shots[ffid]['data'] = np.stack(t for t in shots[ffid]['data'])
+        shots[ffid]['data'] = np.concatenate(shots[ffid]['data'])
     # Send to plotting
     vm.plot.seis.short_gathers(file, shots, out_folder, par)
 
@@ -6,6 +6,7 @@ Seismic plot module
 Submodules for each type of dataset/representation/analytics
 '''
 
-__all__ = ['section']
+__all__ = ['pyramid', 'section']
 
+from . import pyramid
 from . import section
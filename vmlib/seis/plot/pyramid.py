@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+'''
+Multi-resolution pyramid of a seismic section for fast display
+
+Each level halves the trace count of the previous one, and its sample count
+once samples outnumber traces (anti-alias box filter). Levels are stored on
+disk as .npy files (in the header cache, or a temporary folder when it is
+disabled) and read back as memory maps. The renderer picks the
+coarsest level that still has one trace/sample per output pixel, and only
+reads the requested window.
+'''
+import json
+import math
+import pathlib
+import tempfile
+import numpy as np
+import segyio
+import vmlib as vm
+
+# Levels are decimated until both dimensions are below this size
+PYRAMID_MIN_SIZE = 512
+
+
+def _decimate(block, ft, fs):
+    # Box filter decimation of a 2-D block by (ft, fs), edges are repeated
+    pt, ps = -block.shape[0] % ft, -block.shape[1] % fs
+    if pt or ps:
+        block = np.pad(block, ((0, pt), (0, ps)), mode='edge')
+    nt, ns = block.shape[0] // ft, block.shape[1] // fs
+    return block.reshape(nt, ft, ns, fs).mean(axis=(1, 3), dtype=np.float32)
+
+
+class SegyioTraces():
+    '''Lazy 2-D (traces x samples) array of a SEG-Y read through segyio
+
+    Fallback of memmap.TraceArray for files without fixed-length traces:
+    each slice opens the file and reads the selected traces only.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with segyio.open(path, mode='r', ignore_geometry=True) as f:
+            self.shape = (f.tracecount, f.samples.size)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        traces, samples = key if isinstance(key, tuple) else (key, slice(None))
+        with segyio.open(self.path, mode='r', ignore_geometry=True) as f:
+            return np.atleast_2d(f.trace.raw[traces])[:, samples]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[:]
+        return data if dtype is None else data.astype(dtype)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float32)
+
+
+def _base(path):
+    # Full resolution traces: memory map, or segyio reads as a fallback
+    try:
+        return vm.seis.segy.memmap.TraceArray(path)
+    except ValueError:
+        return SegyioTraces(path)
+
+
+class Pyramid():
+    '''Decimated levels of a section (traces x samples)
+
+    Level 0 is the full resolution section, read from the SEG-Y itself
+    (memory-mapped when possible, see SegyioTraces otherwise). It is never
+    copied next to the decimated levels.
+
+    Parameters
+    ----------
+    folder : pathlib.Path
+        folder holding pyramid.json and the pyramid_<level>.npy files
+    meta : dict
+        pyramid description (shape, and step/shape/file of each level)
+    base : vmlib.seis.segy.memmap.TraceArray or SegyioTraces, optional
+        full resolution traces, if level 0 is not stored in folder
+    tmp : tempfile.TemporaryDirectory, optional
+        temporary folder holding the levels, removed with the pyramid
+    '''
+
+    def __init__(self, folder, meta, base=None, tmp=None):
+        self._tmp = tmp
+        self.folder = pathlib.Path(folder)
+        self.meta = meta
+        self.base = base
+        self._levels = {}
+
+    def __len__(self):
+        return len(self.meta['levels'])
+
+    @property
+    def shape(self):
+        return tuple(self.meta['shape'])
+
+    @classmethod
+    def open(cls, path, folder):
+        '''Open the pyramid of a SEG-Y stored in folder (None if missing)'''
+        meta_file = pathlib.Path(folder).joinpath('pyramid.json')
+        if not meta_file.exists():
+            return None
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+        base = None
+        if meta['levels'][0]['file'] is None:
+            base = _base(path)
+        return cls(folder, meta, base)
+
+    @classmethod
+    def build(cls, path, folder, min_size=PYRAMID_MIN_SIZE, memory=None,
+              tmp=None):
+        '''Build the pyramid of a SEG-Y in folder, streaming trace blocks
+
+        Parameters
+        ----------
+        path : pathlib.Path or str
+            path to the segy file
+        folder : pathlib.Path or str
+            output folder
+        min_size : int, optional
+            dimension size below which a dimension is no longer decimated
+        memory : int, optional
+            memory budget in bytes of a trace block (see
+            vmlib.seis.segy.blocks.get_block_size)
+        tmp : tempfile.TemporaryDirectory, optional
+            temporary folder (holding folder), kept alive with the pyramid
+
+        Returns
+        -------
+        Pyramid
+        '''
+        folder = pathlib.Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        base = source = _base(path)
+        shape = list(source.shape)
+        levels = [{'step': [1, 1], 'shape': shape, 'file': None}]
+        # Decimate level by level, until both dimensions are small enough.
+        # Samples are only decimated once they outnumber traces, as lines
+        # are much longer than deep (displays need coarse trace levels that
+        # keep a fine sample resolution).
+        while shape[0] > min_size or shape[1] > min_size:
+            ft = 2 if shape[0] > min_size else 1
+            fs = 2 if shape[1] > min_size and \
+                shape[1] > shape[0] / ft else 1
+            step = [levels[-1]['step'][0] * ft, levels[-1]['step'][1] * fs]
+            shape = [math.ceil(shape[0] / ft), math.ceil(shape[1] / fs)]
+            name = f'pyramid_{len(levels)}.npy'
+            out = np.lib.format.open_memmap(folder.joinpath(name), mode='w+',
+                                            dtype=np.float32,
+                                            shape=tuple(shape))
+            block_size = vm.seis.segy.blocks.get_block_size(
+                source.shape[1], memory=memory)
+            block_size = max(ft, block_size - block_size % ft)
+            for start in range(0, source.shape[0], block_size):
+                stop = min(start + block_size, source.shape[0])
+                out[start // ft:math.ceil(stop / ft)] = _decimate(
+                    np.asarray(source[start:stop]), ft, fs)
+            out.flush()
+            levels.append({'step': step, 'shape': shape, 'file': name})
+            source = out
+        meta = {'shape': levels[0]['shape'], 'levels': levels}
+        with open(folder.joinpath('pyramid.json'), 'w') as f:
+            json.dump(meta, f)
+        return cls(folder, meta, base, tmp)
+
+    def level(self, i):
+        '''Traces x samples array of a level (memory-mapped)'''
+        if i not in self._levels:
+            file = self.meta['levels'][i]['file']
+            if file is None:
+                self._levels[i] = self.base
+            else:
+                self._levels[i] = np.load(self.folder.joinpath(file),
+                                          mmap_mode='r')
+        return self._levels[i]
+
+    def select(self, n_traces, n_samples, width, height):
+        '''Coarsest level with at least one trace/sample per pixel
+
+        Parameters
+        ----------
+        n_traces, n_samples : int
+            size of the displayed window (full resolution)
+        width, height : int
+            output size in pixels
+
+        Returns
+        -------
+        int
+            level index
+        '''
+        trace_step = max(1., n_traces / max(1, width))
+        sample_step = max(1., n_samples / max(1, height))
+        selected = 0
+        for i, level in enumerate(self.meta['levels']):
+            if level['step'][0] <= trace_step and \
+                    level['step'][1] <= sample_step:
+                selected = i
+        return selected
+
+    def window(self, traces=None, samples=None, width=1920, height=1080):
+        '''Read a trace/sample window at the resolution of the output size
+
+        Parameters
+        ----------
+        traces : tuple, optional
+            (start, stop) full resolution trace indices (0-based, stop
+            excluded), defaults to all traces
+        samples : tuple, optional
+            (start, stop) full resolution sample indices, defaults to all
+        width, height : int, optional
+            output size in pixels
+
+        Returns
+        -------
+        np.array
+            2-D float32 (traces x samples) window
+        list
+            [trace start, trace stop, sample start, sample stop] covered by
+            the window, in full resolution indices
+        '''
+        n_traces, n_samples = self.shape
+        t0, t1 = traces if traces is not None else (0, n_traces)
+        s0, s1 = samples if samples is not None else (0, n_samples)
+        t0, t1 = max(0, t0), min(n_traces, t1)
+        s0, s1 = max(0, s0), min(n_samples, s1)
+        i = self.select(t1 - t0, s1 - s0, width, height)
+        ft, fs = self.meta['levels'][i]['step']
+        a, b = t0 // ft, math.ceil(t1 / ft)
+        c, d = s0 // fs, math.ceil(s1 / fs)
+        data = np.asarray(self.level(i)[a:b, c:d], dtype=np.float32)
+        return data, [a * ft, min(b * ft, n_traces),
+                      c * fs, min(d * fs, n_samples)]
+
+
+def get_pyramid(path, cache=None, min_size=PYRAMID_MIN_SIZE, memory=None):
+    '''Pyramid of a SEG-Y, opened from the cache or built on first use
+
+    Parameters
+    ----------
+    path : pathlib.Path or str
+        path to the segy file
+    cache : vmlib.seis.segy.cache.HeaderCache, optional
+        cache holding the pyramid levels, invalidated with the other cached
+        items. If None (cache disabled), the pyramid is built in a temporary
+        folder, removed with the returned pyramid.
+    min_size : int, optional
+        dimension size below which a dimension is no longer decimated
+    memory : int, optional
+        memory budget in bytes of a trace block while building
+
+    Returns
+    -------
+    Pyramid
+    '''
+    if not cache:
+        tmp = tempfile.TemporaryDirectory(prefix='vmlib_pyramid_')
+        return Pyramid.build(path, tmp.name, min_size, memory, tmp)
+    folder = cache.entry(path)
+    pyramid = Pyramid.open(path, folder)
+    if pyramid is None:
+        pyramid = Pyramid.build(path, folder, min_size, memory)
+        cache.evict(keep=folder)
+    return pyramid
+
+
+def clip_value(path, pyramid, q=99, cache=None):
+    '''Amplitude percentile of a SEG-Y, for display clipping
+
+    Read from the amplitude sketch of the file when it is cached (see
+    vmlib.seis.segy.stats.amplitude_sketch), else from the coarsest pyramid
+    level, so that no extra pass is made over the traces.
+
+    Parameters
+    ----------
+    path : pathlib.Path or str
+        path to the segy file
+    pyramid : Pyramid
+        section pyramid of the file
+    q : float, optional
+        percentile (defaults to 99)
+    cache : vmlib.seis.segy.cache.HeaderCache, optional
+        header cache (None if disabled)
+
+    Returns
+    -------
+    float
+    '''
+    if cache:
+        sketch = vm.seis.segy.stats.amplitude_sketch(path, cache)
+        return sketch.percentile(q)
+    return float(np.percentile(pyramid.level(len(pyramid) - 1), q))
+
+
+def render(ax, pyramid, traces=None, samples=None, twt=None, clip=None,
+           **kwargs):
+    '''Display a section window from a pyramid
+
+    The level is selected from the pixel size of ax, so that rendering time
+    depends on the output size only.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        axes to draw on
+    pyramid : Pyramid
+        section pyramid
+    traces, samples : tuple, optional
+        (start, stop) full resolution trace/sample indices (see
+        Pyramid.window)
+    twt : np.array, optional
+        time of each sample (y axis in samples if None)
+    clip : float, optional
+        symmetric color limit (defaults to the 99th percentile of the window)
+    kwargs
+        ax.imshow keywords (cmap, interpolation...)
+
+    Returns
+    -------
+    matplotlib.image.AxesImage
+    '''
+    width, height = int(ax.bbox.width), int(ax.bbox.height)
+    data, (t0, t1, s0, s1) = pyramid.window(traces, samples, width, height)
+    if clip is None:
+        clip = np.percentile(data, 99)
+    # Extent in trace numbers (from 1) and sample times (cell edges)
+    if twt is None:
+        twt = np.arange(pyramid.shape[1], dtype=np.float64)
+    dt = twt[1] - twt[0] if len(twt) > 1 else 1.
+    extent = [t0 + 0.5, t1 + 0.5, twt[s1 - 1] + dt / 2, twt[s0] - dt / 2]
+    kwargs.setdefault('aspect', 'auto')
+    return ax.imshow(data.T, vmin=-clip, vmax=clip, extent=extent, **kwargs)
@@ -2,14 +2,12 @@
 import pathlib
 import matplotlib.pyplot as plt
 import numpy as np
-import segyio
 import vmlib as vm
 
 
-def section(s, outpath=None):
+def section(s, outpath=None, traces=None, twt=None):
 
     # Additional args
-        # Cut time
         # Colormap
         # Clip value
         # Orientation (from s.info)
@@ -19,22 +17,25 @@ def section(s, outpath=None):
         # Display spectra
 
 
-    # Load data
-    with segyio.open(s.info['file'], ignore_geometry=True) as f:
-        data = f.trace.raw[:]
     # Reset styles and apply vmlib ones
     plt.style.use('ggplot')
     vm.plot.styles.set_plot_styles()
     # Create figure
     fig = plt.figure(figsize=(18, 8))
     ax = fig.add_subplot(1, 1, 1)
-    # Define clip and extent
-    clip = np.percentile(data, 99)
-    extent = [1, s.info['n_traces'],
-              s.info['twt'][-1], s.info['twt'][0]]  # define extent
-    # Plot and customize
-    ax.imshow(data.T, cmap="RdBu", vmin=-clip, vmax=clip, aspect='auto',
-              extent=extent)
+    # Trace (0-based) and time windows, displayed at the figure resolution
+    # from the section pyramid
+    samples = None
+    if twt is not None:
+        samples = (np.searchsorted(s.info['twt'], twt[0], side='left'),
+                   np.searchsorted(s.info['twt'], twt[1], side='right'))
+    # Clip value from the cached amplitude sketch of the file, or from the
+    # coarsest pyramid level if the cache is disabled
+    pyramid = s.pyramid()
+    clip = vm.seis.plot.pyramid.clip_value(s.info['file'], pyramid, 99,
+                                           s.cache)
+    vm.seis.plot.pyramid.render(ax, pyramid, traces, samples,
+                                s.info['twt'], clip, cmap="RdBu")
     ax.set_xlabel('CDP number')
     ax.set_ylabel('TWT [ms]')
     ax.set_title(f"{s.info['file']}")
@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
-import math
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 import numpy as np
 from scipy.ndimage import uniform_filter1d
-from sklearn.preprocessing import robust_scale
 from ..plot import hist, lines
+from . import geometry
+from .plot.pyramid import clip_value, get_pyramid
+from .segy.blocks import MEMORY_BUDGET
 
 
 def section(section='', timerange=[], tracerange=[],
@@ -16,29 +17,31 @@ def section(section='', timerange=[], tracerange=[],
     '''
     Display section
     '''
-    # transpose data and get sample depths, fold
-    data = section.data.T
+    # Get sample depths, fold
     twt = section.stats['twt']
+    n_traces = section.stats['n_traces']
     fold_data = section.trace_header['NStackedTraces']
     # Check CDP orientation, reverse if cdp are reverse-ordered
     cdp_id = list(section.trace_header['CDP'])
-    if cdp_id[0] > cdp_id[-1]:
-        data = data[:, ::-1]
+    reverse = cdp_id[0] > cdp_id[-1]
     # Cut time region
+    samples = None
     if timerange != []:
-        dd = (twt > timerange[0]) & (twt < timerange[1])
-        data = data[dd, :]
-        twt = twt[dd]
+        dd = np.flatnonzero((twt > timerange[0]) & (twt < timerange[1]))
+        samples = (dd[0], dd[-1] + 1)
     # Cut trace region
-    ntraces = np.shape(data)[1]
+    ntraces = n_traces
     cdp_range = range(0, ntraces)
+    traces = None
     if tracerange != []:
-        if tracerange[1] > np.shape(data)[1]:
-            tracerange[1] = np.shape(data)[1]
-        data = data[:, tracerange[0]:tracerange[1]]
+        if tracerange[1] > n_traces:
+            tracerange[1] = n_traces
         cdp_range = range(tracerange[0], tracerange[1])
         ntraces = len(cdp_range)
         fold_data = fold_data.iloc[tracerange[0] - 1:tracerange[1] - 1]
+        traces = tuple(tracerange)
+        if reverse:
+            traces = (n_traces - tracerange[1], n_traces - tracerange[0])
     # Get fold curve for relevant CDPs
     if fold:
         fold_x = list(fold_data.index)
@@ -57,54 +60,49 @@ def section(section='', timerange=[], tracerange=[],
     figsize = (18, 10)
 
     # Initialize figure
+    fig, ax = plt.subplots(figsize=figsize)
     if fold:
         pass
         # SET PLOT STYLES
 
-    else:
-        fig, ax = plt.subplots(figsize=figsize)
-
+    # Read the displayed window at the figure resolution from the section
+    # pyramid (samples x traces)
+    pyramid = get_pyramid(section.stats['filename'], section.cache)
+    data, (t0, t1, s0, s1) = pyramid.window(
+        traces, samples, int(ax.bbox.width), int(ax.bbox.height))
+    data = data.T
+    if reverse:
+        data = data[:, ::-1]
+        t0, t1 = n_traces - t1, n_traces - t0
+    twt = twt[s0:s1]
+    # Image extent from the trace and sample window actually read
+    extent = (t0, t1, twt[-1], twt[0])
+    sample_rate = section.stats['sample_rate'] * (s1 - s0) / data.shape[0]
+    # Clip value from the cached amplitude sketch of the file, or from the
+    # coarsest pyramid level if the cache is disabled
+    clip_val = abs(clip_value(section.stats['filename'], pyramid, 0.999,
+                              section.cache))
     # Plot image
     if hillshade:
-        # Create light source
-        ls = mcolors.LightSource(0, 80)
-        # Get color map
-        cmap = plt.get_cmap(cm)
-        # Normalize
-        sc = robust_scale(data, axis=1,
-                          with_centering=False,
-                          with_scaling=True,
-                          quantile_range=(0.2, 0.9),
-                          )
-        # Create HS
-        hs = ls.hillshade(sc)
-        size = int(50 / section.stats['sample_rate'])
-        hs = uniform_filter1d(hs, size,
-                              axis=0)
-        hs = robust_scale(hs, axis=1,
-                          with_centering=True,
-                          with_scaling=False,
-                          quantile_range=(0.01, 0.99),
-                          )
-        clip_val = abs(np.percentile(data, 0.999))
+        # Create HS (row-scaled, smoothed along time and centered)
+        hs = hillshade_section(data, max(1, int(50 / sample_rate)))
         ax.imshow(data, interpolation='bilinear',
                   aspect='auto', cmap=cm,
-                  extent=(0, ntraces, twt[-1], twt[0]),
+                  extent=extent,
                   vmin=-clip_val, vmax=clip_val)
         ax.imshow(hs, cmap='binary', norm=None, aspect='auto',
-                  interpolation=None, alpha=0.2, extent=(0, ntraces, twt[-1], twt[0]))
+                  interpolation=None, alpha=0.2, extent=extent)
     else:
-        clip_val = abs(np.percentile(data, 0.999))
         im = ax.imshow(data, interpolation='bilinear',
                        aspect='auto', cmap=cm,
-                       extent=(0, ntraces, twt[-1], twt[0]),
+                       extent=extent,
                        vmin=-clip_val, vmax=clip_val)
     # Set tick number to CDP range
     n_ticks = 20
     round_to = 10
     x_step = int(round_to * round(float(ntraces / n_ticks) / round_to))
     # pixel count at label position
-    x_positions = np.arange(0, ntraces, x_step)
+    x_positions = np.arange(cdp_range.start, cdp_range.stop, x_step)
     x_labels = cdp_range[::x_step]  # labels you want to see
     ax.set_xticks(x_positions)
     ax.set_xticklabels(x_labels)
@@ -125,18 +123,82 @@ def section(section='', timerange=[], tracerange=[],
     plt.close(fig)
 
 
+def hillshade_section(data, size, azdeg=0, altdeg=80, memory=None):
+    '''Hillshade overlay of a section, computed in float32 row chunks
+
+    Equivalent to robust scaling each row (0.2-0.9 % quantile range),
+    LightSource(azdeg, altdeg).hillshade, a uniform filter of size samples
+    along time and median centering of each row, without full-size float64
+    temporaries. Rows (samples) are processed in chunks, with halo rows for
+    the gradient and the filter; only the float32 result is full size.
+
+    Parameters
+    ----------
+    data : np.array
+        2-D (samples x traces) section, or any sliceable 2-D array (memmap)
+    size : int
+        length of the smoothing filter along time, in samples
+    azdeg, altdeg : float, optional
+        light source azimuth and altitude in degrees (defaults to 0, 80)
+    memory : int, optional
+        memory budget in bytes of a chunk (defaults to 256 MB)
+
+    Returns
+    -------
+    np.array
+        2-D float32 (samples x traces) hillshade
+    '''
+    n_rows, n_cols = data.shape
+    halo = size // 2 + 1
+    # Rows per chunk (about 8 float64 temporaries per value)
+    step = max(halo, (memory or MEMORY_BUDGET) // (n_cols * 8 * 8))
+    direction = mcolors.LightSource(azdeg, altdeg).direction
+    hs = np.empty((n_rows, n_cols), dtype=np.float32)
+    # Raw intensity of the row-scaled section (1 halo row for the gradient)
+    imin, imax = np.inf, -np.inf
+    for start in range(0, n_rows, step):
+        stop = min(start + step, n_rows)
+        lo, hi = max(0, start - 1), min(n_rows, stop + 1)
+        chunk = np.asarray(data[lo:hi], dtype=np.float64)
+        q = np.nanpercentile(chunk, [0.2, 0.9], axis=1)
+        scale = q[1] - q[0]
+        scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.
+        chunk /= scale[:, np.newaxis]
+        e_dy, e_dx = np.gradient(chunk, -1, 1)
+        intensity = (direction[2] - e_dx * direction[0] -
+                     e_dy * direction[1])
+        intensity /= np.sqrt(e_dx**2 + e_dy**2 + 1)
+        intensity = intensity[start - lo:stop - lo]
+        imin = min(imin, intensity.min())
+        imax = max(imax, intensity.max())
+        hs[start:stop] = intensity
+    # Normalize to 0-1, smooth along time and center each row on its median.
+    # Rows above the chunk were already overwritten, their raw values are
+    # kept from the previous chunk.
+    tail = None
+    for start in range(0, n_rows, step):
+        stop = min(start + step, n_rows)
+        lo, hi = max(0, start - halo), min(n_rows, stop + halo)
+        chunk = hs[lo:hi].astype(np.float64)
+        if start > lo:
+            chunk[:start - lo] = tail[len(tail) - (start - lo):]
+        tail = hs[max(0, stop - halo):stop].copy()
+        if imax - imin > 1e-6:
+            chunk -= imin
+            chunk /= imax - imin
+        np.clip(chunk, 0, 1, out=chunk)
+        chunk = uniform_filter1d(chunk, size, axis=0)[start - lo:stop - lo]
+        chunk -= np.nanmedian(chunk, axis=1, keepdims=True)
+        hs[start:stop] = chunk
+    return hs
+
+
 def basemap(section='', output='root'):
     '''
     Plot CDPX-CDPY
     '''
-    # Get scalar and compute cdp_x/y
-    scalar = section.trace_header['SourceGroupScalar'].mean()
-    if scalar < 0:
-        cdp_x = list(section.trace_header['CDP_X'] / abs(scalar))
-        cdp_y = list(section.trace_header['CDP_Y'] / abs(scalar))
-    else:
-        cdp_x = list(section.trace_header['CDP_X'])
-        cdp_y = list(section.trace_header['CDP_Y'])
+    # Get scaled cdp_x/y
+    cdp_x, cdp_y = geometry.scaled_coordinates(section.trace_header)
     # Resolve output filename
     filename = section.stats['filename']
     if output == 'root':
@@ -160,18 +222,10 @@ def cdp_spacing(section='', output='root'):
     '''
     Plot CDP spacing histogram
     '''
-    # Get scalar and compute cdp_x/y
-    scalar = section.trace_header['SourceGroupScalar'].mean()
-    if scalar < 0:
-        cdp_x = list(section.trace_header['CDP_X'] / abs(scalar))
-        cdp_y = list(section.trace_header['CDP_Y'] / abs(scalar))
-    else:
-        cdp_x = list(section.trace_header['CDP_X'])
-        cdp_y = list(section.trace_header['CDP_Y'])
     # Compute spacing
-    dx = [(cdp_x[i] - cdp_x[i - 1]) for i in range(1, len(cdp_x))]
-    dy = [(cdp_y[i] - cdp_y[i - 1]) for i in range(1, len(cdp_y))]
-    spacing = [math.sqrt(dx[i]**2 + dy[i]**2) for i in range(len(dx))]
+    df = geometry.line_metrics(
+        *geometry.scaled_coordinates(section.trace_header))
+    spacing = df['spacing'].dropna()
     # Resolve output filename
     filename = section.stats['filename']
     if output == 'root':
@@ -194,22 +248,10 @@ def distances(section='', inter_cdp=2.5, output='root'):
     '''
     Plot Cumulative versus Theoretical distances
     '''
-    # Get scalar and compute cdp_x/y
-    scalar = section.trace_header['SourceGroupScalar'].mean()
-    if scalar < 0:
-        cdp_x = list(section.trace_header['CDP_X'] / abs(scalar))
-        cdp_y = list(section.trace_header['CDP_Y'] / abs(scalar))
-    else:
-        cdp_x = list(section.trace_header['CDP_X'])
-        cdp_y = list(section.trace_header['CDP_Y'])
-    # Compute spacing
-    dx = [(cdp_x[i] - cdp_x[i - 1]) for i in range(1, len(cdp_x))]
-    dy = [(cdp_y[i] - cdp_y[i - 1]) for i in range(1, len(cdp_y))]
-    spacing = [math.sqrt(dx[i]**2 + dy[i]**2) for i in range(len(dx))]
-    # Compute distances
-    dist_cum = [sum(spacing[0:i]) for i in range(len(spacing))]
-    dist_theo = [inter_cdp * (i) for i in range(len(spacing))]
-    delta = [dist_cum[i] - dist_theo[i] for i in range(len(dist_cum))]
+    # Compute distances (cumulative minus theoretical)
+    df = geometry.line_metrics(
+        *geometry.scaled_coordinates(section.trace_header), inter_cdp)
+    delta = df['deviation']
     # Resolve output filename
     filename = section.stats['filename']
     if output == 'root':
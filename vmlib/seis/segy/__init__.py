@@ -6,8 +6,17 @@ SEGY tools
 IO / Editing / File Info submodules
 '''
 
-__all__ = ['edit', 'io', 'info']
+__all__ = ['blocks', 'cache', 'catalog', 'edit', 'export', 'headers', 'io',
+           'info', 'memmap', 'spectra', 'stats']
 
+from . import blocks
+from . import cache
+from . import catalog
 from . import edit
+from . import export
+from . import headers
 from . import io
 from . import info
+from . import memmap
+from . import spectra
+from . import stats
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+'''
+Block-streaming trace iterator with bounded memory
+'''
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import segyio
+from .memmap import TraceArray
+
+# Default memory budget of a single decoded block (bytes)
+MEMORY_BUDGET = 256 * 1024**2
+
+
+def get_block_size(n_samples, block_size=None, memory=None):
+    '''Number of traces per block, from block_size or a memory budget'''
+    if block_size is None:
+        memory = memory or MEMORY_BUDGET
+        block_size = memory // (n_samples * np.dtype(np.float32).itemsize)
+    return max(1, int(block_size))
+
+
+def iter_blocks(path, headers=None, block_size=None, memory=None):
+    '''Stream a SEG-Y file as consecutive blocks of traces
+
+    Fixed-length files are read through the memory-mapped TraceArray, other
+    files through segyio, so that only one block is decoded at a time.
+
+    Parameters
+    ----------
+    path : pathlib.Path or str
+        path to the segy file
+    headers : pd.DataFrame or np.array, optional
+        trace header table (one row per trace, in file order), sliced along
+        with each block
+    block_size : int, optional
+        number of traces per block (overrides memory)
+    memory : int, optional
+        memory budget in bytes of a decoded float32 block (defaults to 256 MB)
+
+    Yields
+    ------
+    range
+        trace indices (0-based) of the block
+    np.array
+        2-D float32 block (traces x samples)
+    pd.DataFrame, np.array or None
+        matching header slice (None if headers is None)
+    '''
+    try:
+        traces = TraceArray(path)
+    except ValueError:
+        traces = None
+    if traces is not None:
+        yield from _iter(traces.__getitem__, traces.shape, headers,
+                         block_size, memory)
+    else:
+        with segyio.open(path, mode='r', ignore_geometry=True) as f:
+            shape = (f.tracecount, f.samples.size)
+            yield from _iter(lambda key: f.trace.raw[key], shape, headers,
+                             block_size, memory)
+
+
+def _iter(read, shape, headers, block_size, memory):
+    n_traces, n_samples = shape
+    step = get_block_size(n_samples, block_size, memory)
+    for start in range(0, n_traces, step):
+        stop = min(start + step, n_traces)
+        if headers is None:
+            header = None
+        elif hasattr(headers, 'iloc'):
+            header = headers.iloc[start:stop]
+        else:
+            header = headers[start:stop]
+        yield range(start, stop), read(slice(start, stop)), header
+
+
+def map_blocks(func, blocks, workers=1):
+    '''Apply a function to streamed trace blocks, optionally in threads
+
+    Results are yielded in block order. With several workers, at most
+    2 * workers blocks are in flight at a time, so that memory stays bounded
+    by the block size (numpy and scipy release the GIL in most array
+    operations).
+
+    Parameters
+    ----------
+    func : callable
+        function of a 2-D (traces x samples) block, returning a 2-D block
+    blocks : iterable
+        (trace range, block, header slice) tuples, as from iter_blocks
+    workers : int, optional
+        number of threads (defaults to 1, processed in the calling thread)
+
+    Yields
+    ------
+    range
+        trace indices (0-based) of the block
+    np.array
+        processed block
+    '''
+    if workers <= 1:
+        for traces, block, _ in blocks:
+            yield traces, func(block)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for traces, block, _ in blocks:
+            pending.append((traces, executor.submit(func, block)))
+            if len(pending) >= 2 * workers:
+                traces, future = pending.popleft()
+                yield traces, future.result()
+        while pending:
+            traces, future = pending.popleft()
+            yield traces, future.result()
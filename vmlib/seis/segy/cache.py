@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+'''
+Persistent on-disk cache for decoded SEG-Y headers
+
+Entries are keyed by file path, size, mtime and a content fingerprint
+(text/bin headers and file tail), so any change to the SEG-Y invalidates
+them. The cache folder is size-limited with least-recently-used eviction.
+'''
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import numpy as np
+import pandas as pd
+import segyio
+
+CACHE_DIR = pathlib.Path.home().joinpath('.vmlib', 'segy_cache')
+FINGERPRINT_SIZE = 65536
+
+
+def _fingerprint(path, size):
+    # Hash the text/bin headers and the file tail (last trace headers)
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        h.update(f.read(3600))
+        if size > 3600:
+            f.seek(max(3600, size - FINGERPRINT_SIZE))
+            h.update(f.read(FINGERPRINT_SIZE))
+    return h.hexdigest()
+
+
+def _folder_size(folder):
+    return sum(f.stat().st_size for f in folder.iterdir() if f.is_file())
+
+
+class HeaderCache():
+    '''Size-limited LRU cache of decoded headers, one folder per SEG-Y
+
+    Parameters
+    ----------
+    folder : pathlib.Path or str, optional
+        cache folder (defaults to ~/.vmlib/segy_cache). Use a folder next to
+        the data (e.g. path.parent / '.vmlib') to keep the cache with it.
+    max_size : int, optional
+        maximum total cache size in bytes (defaults to 2 GB)
+    '''
+
+    def __init__(self, folder=None, max_size=2 * 1024**3):
+        self.folder = pathlib.Path(folder) if folder else CACHE_DIR
+        self.max_size = max_size
+
+    def entry(self, path):
+        '''Resolve the cache folder of a SEG-Y, dropping stale entries'''
+        path = pathlib.Path(path).resolve()
+        stat = path.stat()
+        file_key = hashlib.sha1(str(path).encode()).hexdigest()[:16]
+        state = f'{stat.st_size}|{stat.st_mtime_ns}|'
+        state += _fingerprint(path, stat.st_size)
+        state_key = hashlib.sha1(state.encode()).hexdigest()[:16]
+        entry = self.folder.joinpath(f'{file_key}_{state_key}')
+        # Invalidate entries of previous versions of the same file
+        if self.folder.exists():
+            for stale in self.folder.glob(f'{file_key}_*'):
+                if stale != entry:
+                    shutil.rmtree(stale, ignore_errors=True)
+        return entry
+
+    def get(self, path, name):
+        '''Cached item stored under name for a SEG-Y (None if not cached)
+
+        Parameters
+        ----------
+        path : pathlib.Path or str
+            path to the segy file
+        name : str
+            item name (e.g. 'trace', 'text', 'bin')
+
+        Returns
+        -------
+        pd.DataFrame, dict or None
+            cached table (stored as .npz) or dict (stored as .json)
+        '''
+        entry = self.entry(path)
+        table = entry.joinpath(f'{name}.npz')
+        items = entry.joinpath(f'{name}.json')
+        if table.exists():
+            with np.load(table, allow_pickle=False) as npz:
+                columns = [k for k in npz.files if k != '__index__']
+                value = pd.DataFrame({k: npz[k] for k in columns},
+                                     index=npz['__index__'])
+        elif items.exists():
+            with open(items, 'r') as f:
+                value = json.load(f)
+        else:
+            return None
+        # Mark entry as recently used
+        os.utime(entry)
+        return value
+
+    def put(self, path, name, value):
+        '''Store a DataFrame (numeric columns) or a JSON-able dict
+
+        Parameters
+        ----------
+        path : pathlib.Path or str
+            path to the segy file
+        name : str
+            item name (e.g. 'trace', 'text', 'bin')
+        value : pd.DataFrame or dict
+            item to store
+        '''
+        entry = self.entry(path)
+        entry.mkdir(parents=True, exist_ok=True)
+        if isinstance(value, pd.DataFrame):
+            columns = {str(k): v.to_numpy() for k, v in value.items()}
+            np.savez(entry.joinpath(f'{name}.npz'),
+                     __index__=value.index.to_numpy(), **columns)
+        else:
+            with open(entry.joinpath(f'{name}.json'), 'w') as f:
+                json.dump(value, f)
+        os.utime(entry)
+        self.evict(keep=entry)
+
+    def evict(self, keep=None):
+        '''Remove least recently used entries above the size limit'''
+        entries = [e for e in self.folder.iterdir() if e.is_dir()]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        sizes = {e: _folder_size(e) for e in entries}
+        total = sum(sizes.values())
+        for e in entries:
+            if total <= self.max_size:
+                break
+            if e != keep:
+                shutil.rmtree(e, ignore_errors=True)
+                total -= sizes[e]
+
+    def clear(self):
+        '''Remove all cached entries'''
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def load_item(cache, path, name, decode):
+    '''Item from cache, decoded with decode() and stored on a miss'''
+    value = cache.get(path, name) if cache else None
+    if value is None:
+        value = decode()
+        if cache:
+            cache.put(path, name, value)
+    return value
+
+
+def load_trace_header(cache, path, decode, fields=None):
+    '''Trace header table from cache, decoding only missing fields
+
+    Parameters
+    ----------
+    cache : HeaderCache or None
+        header cache (no caching if None)
+    path : pathlib.Path or str
+        path to the segy file
+    decode : callable
+        decode(fields) returns the trace header DataFrame for fields
+    fields : list, optional
+        trace header field names, defaults to all fields
+
+    Returns
+    -------
+    pd.DataFrame
+        trace header table restricted to fields
+    '''
+    fields = list(fields or segyio.tracefield.keys)
+    df = cache.get(path, 'trace') if cache else None
+    if df is None:
+        df = decode(fields)
+    else:
+        missing = [k for k in fields if k not in df.columns]
+        if not missing:
+            return df[fields]
+        df = df.join(decode(missing))
+    if cache:
+        cache.put(path, 'trace', df)
+    return df[fields]
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+'''
+SQLite catalog of the SEG-Y files of a directory tree
+
+One row per file, with its headers, trace counts, sampling, FFID/CDP/station
+extents, bounding box and EPSG code. Re-scans only read new or modified
+files (size or mtime changed), and drop the rows of deleted files.
+'''
+import json
+import logging
+import pathlib
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+import segyio
+import vmlib as vm
+from .headers import apply_scalar, trace_header_table
+from .info import _parse_text_header
+
+# Default SEG-Y file extensions (case insensitive)
+SEGY_EXTENSIONS = ('.sgy', '.segy')
+
+# Station header fields (source and receiver), as in the navmerge flow
+STATION_FIELDS = {'src': 'ShotPoint', 'rcv': 'CROSSLINE_3D'}
+
+# Coordinate header field pairs of the bounding box
+COORDINATE_FIELDS = [('SourceX', 'SourceY'), ('GroupX', 'GroupY'),
+                     ('CDP_X', 'CDP_Y')]
+
+_COLUMNS = {'path': 'TEXT PRIMARY KEY',
+            'name': 'TEXT',
+            'size': 'INTEGER',
+            'mtime': 'REAL',
+            'scanned': 'REAL',
+            'error': 'TEXT',
+            'text_header': 'TEXT',
+            'bin_header': 'TEXT',
+            'epsg': 'INTEGER',
+            'n_traces': 'INTEGER',
+            'n_samples': 'INTEGER',
+            'sample_rate': 'REAL',
+            'ffid_min': 'INTEGER',
+            'ffid_max': 'INTEGER',
+            'cdp_min': 'INTEGER',
+            'cdp_max': 'INTEGER',
+            'src_min': 'REAL',
+            'src_max': 'REAL',
+            'rcv_min': 'REAL',
+            'rcv_max': 'REAL',
+            'xmin': 'REAL',
+            'xmax': 'REAL',
+            'ymin': 'REAL',
+            'ymax': 'REAL'}
+
+_INDEXES = {'idx_x': ['xmin', 'xmax'],
+            'idx_y': ['ymin', 'ymax'],
+            'idx_epsg': ['epsg'],
+            'idx_name': ['name']}
+
+
+def _extent(values):
+    values = np.asarray(values)
+    if values.size == 0:
+        return None, None
+    return values.min().item(), values.max().item()
+
+
+def file_metadata(path, stations=STATION_FIELDS):
+    '''Catalog metadata of a SEG-Y file
+
+    Parameters
+    ----------
+    path : pathlib.Path or str
+        path to the segy file
+    stations : dict, optional
+        source ('src') and receiver ('rcv') station header fields
+
+    Returns
+    -------
+    dict
+        catalog columns (see Catalog), without path, size and times
+    '''
+    coordinates = [k for pair in COORDINATE_FIELDS for k in pair]
+    fields = ['FieldRecord', 'CDP', 'SourceGroupScalar'] + \
+        list(stations.values()) + coordinates
+    fields = list(dict.fromkeys(fields))
+    with segyio.open(path, mode='r', ignore_geometry=True) as f:
+        text_header, crs = _parse_text_header(f)
+        bin_header = {str(k): v for k, v in f.bin.items()}
+        df = trace_header_table(f, fields)
+        meta = {'text_header': json.dumps(text_header),
+                'bin_header': json.dumps(bin_header),
+                'epsg': crs,
+                'n_traces': f.tracecount,
+                'n_samples': f.samples.size,
+                'sample_rate': segyio.tools.dt(f) / 1000.}
+    meta['ffid_min'], meta['ffid_max'] = _extent(df['FieldRecord'])
+    meta['cdp_min'], meta['cdp_max'] = _extent(df['CDP'])
+    for key in ['src', 'rcv']:
+        meta[f'{key}_min'], meta[f'{key}_max'] = _extent(df[stations[key]])
+    # Bounding box of all non-null source, receiver and CDP positions
+    xs, ys = [], []
+    for x, y in COORDINATE_FIELDS:
+        valid = (df[x] != 0) | (df[y] != 0)
+        xs.append(apply_scalar(df[x][valid], df['SourceGroupScalar'][valid]))
+        ys.append(apply_scalar(df[y][valid], df['SourceGroupScalar'][valid]))
+    meta['xmin'], meta['xmax'] = _extent(np.concatenate(xs))
+    meta['ymin'], meta['ymax'] = _extent(np.concatenate(ys))
+    return meta
+
+
+class Catalog():
+    '''Indexed SQLite catalog of SEG-Y files
+
+    Parameters
+    ----------
+    database : pathlib.Path or str
+        path to the SQLite database (created if missing)
+    stations : dict, optional
+        source ('src') and receiver ('rcv') station header fields
+
+    Examples
+    --------
+    >>> with Catalog('survey.sqlite') as catalog:
+    ...     catalog.scan('/data/survey')
+    ...     lines = catalog.query(bbox=(2600000, 1200000, 2601000, 1201000))
+    '''
+
+    def __init__(self, database, stations=STATION_FIELDS):
+        self.database = pathlib.Path(database)
+        self.stations = stations
+        self.connection = sqlite3.connect(str(self.database))
+        columns = ', '.join(f'{k} {v}' for k, v in _COLUMNS.items())
+        with self.connection:
+            self.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS segy ({columns})')
+            for name, keys in _INDEXES.items():
+                self.connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS {name} ON segy '
+                    f'({", ".join(keys)})')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM segy').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def _states(self):
+        # path -> (size, mtime) of the cataloged files
+        rows = self.connection.execute('SELECT path, size, mtime FROM segy')
+        return {path: (size, mtime) for path, size, mtime in rows}
+
+    def scan(self, folder, recurse=True, extensions=SEGY_EXTENSIONS,
+             remove=True, batch_size=100):
+        '''Add new and modified SEG-Y files of a folder to the catalog
+
+        Files are streamed with vmlib.dirs.walk_files. Files whose size
+        and mtime match their catalog entry are skipped, others are read
+        (headers only) and upserted. Files that cannot be read are kept with
+        their error, and retried once modified.
+
+        Parameters
+        ----------
+        folder : pathlib.Path or str
+            root folder
+        recurse : bool, optional
+            scan subfolders (defaults to True)
+        extensions : tuple, optional
+            file extensions to catalog (case insensitive)
+        remove : bool, optional
+            drop entries of files of the folder that no longer exist
+            (defaults to True)
+        batch_size : int, optional
+            number of files per committed transaction
+
+        Returns
+        -------
+        dict
+            number of added, updated, unchanged, failed and removed files
+            (each listed file is counted once, failed files are kept with
+            their error)
+        '''
+        folder = pathlib.Path(folder).resolve()
+        states = self._states()
+        counts = dict.fromkeys(['added', 'updated', 'unchanged', 'failed',
+                                'removed'], 0)
+        listed, rows = set(), []
+        for path, stat in vm.dirs.walk_files(folder, recurse, extensions,
+                                             stat=True):
+            listed.add(str(path))
+            state = states.get(str(path))
+            if state == (stat.st_size, stat.st_mtime):
+                counts['unchanged'] += 1
+                continue
+            row = dict.fromkeys(_COLUMNS)
+            row.update({'path': str(path), 'name': path.stem,
+                        'size': stat.st_size, 'mtime': stat.st_mtime,
+                        'scanned': time.time()})
+            try:
+                row.update(file_metadata(path, self.stations))
+                counts['updated' if state is not None else 'added'] += 1
+            except Exception as e:
+                logging.warning(f'{path} - {e}')
+                row['error'] = str(e)
+                counts['failed'] += 1
+            rows.append(row)
+            if len(rows) >= batch_size:
+                self._upsert(rows)
+                rows = []
+        self._upsert(rows)
+        if remove:
+            removed = [p for p in states if p not in listed and
+                       folder in pathlib.Path(p).parents and
+                       (recurse or pathlib.Path(p).parent == folder)]
+            with self.connection:
+                self.connection.executemany('DELETE FROM segy WHERE path = ?',
+                                            [(p,) for p in removed])
+            counts['removed'] = len(removed)
+        return counts
+
+    def _upsert(self, rows):
+        if len(rows) == 0:
+            return
+        keys = list(_COLUMNS)
+        with self.connection:
+            self.connection.executemany(
+                f'INSERT OR REPLACE INTO segy ({", ".join(keys)}) '
+                f'VALUES ({", ".join("?" * len(keys))})',
+                [tuple(row[k] for k in keys) for row in rows])
+
+    def query(self, bbox=None, epsg=None, where=None, params=(),
+              columns=None):
+        '''Cataloged files matching a bounding box and/or conditions
+
+        Parameters
+        ----------
+        bbox : tuple, optional
+            (xmin, ymin, xmax, ymax), files whose bounding box intersects it
+        epsg : int, optional
+            files with this EPSG code
+        where : str, optional
+            additional SQL condition, e.g. 'n_traces > ?'
+        params : tuple, optional
+            parameters of the where condition
+        columns : list, optional
+            returned columns (defaults to all but the text and bin headers)
+
+        Returns
+        -------
+        pd.DataFrame
+            one row per file, index = path
+        '''
+        if columns is None:
+            columns = [k for k in _COLUMNS
+                       if k not in ['text_header', 'bin_header']]
+        columns = ['path'] + [k for k in columns if k != 'path']
+        conditions, values = ['error IS NULL'], []
+        if bbox is not None:
+            conditions.append('xmax >= ? AND xmin <= ? AND '
+                              'ymax >= ? AND ymin <= ?')
+            values += [bbox[0], bbox[2], bbox[1], bbox[3]]
+        if epsg is not None:
+            conditions.append('epsg = ?')
+            values.append(epsg)
+        if where is not None:
+            conditions.append(f'({where})')
+            values += list(params)
+        sql = f'SELECT {", ".join(columns)} FROM segy ' \
+            f'WHERE {" AND ".join(conditions)} ORDER BY path'
+        return pd.read_sql_query(sql, self.connection, params=values,
+                                 index_col='path')
+
+    def headers(self, path):
+        '''Text and bin headers of a cataloged file, as dicts'''
+        row = self.connection.execute(
+            'SELECT text_header, bin_header FROM segy WHERE path = ?',
+            (str(pathlib.Path(path).resolve()),)).fetchone()
+        if row is None:
+            raise KeyError(f'{path} is not cataloged')
+        return tuple(json.loads(v) if v else {} for v in row)
+
+    def errors(self):
+        '''Files that could not be read, with their error'''
+        return pd.read_sql_query(
+            'SELECT path, error FROM segy WHERE error IS NOT NULL '
+            'ORDER BY path', self.connection, index_col='path')
+
+
+def build_catalog(folder, database=None, recurse=True,
+                  extensions=SEGY_EXTENSIONS, stations=STATION_FIELDS):
+    '''Build or update the SEG-Y catalog of a folder
+
+    Parameters
+    ----------
+    folder : pathlib.Path or str
+        root folder
+    database : pathlib.Path or str, optional
+        path to the SQLite database (defaults to segy_catalog.sqlite in
+        folder)
+    recurse, extensions
+        see Catalog.scan
+    stations : dict, optional
+        source ('src') and receiver ('rcv') station header fields
+
+    Returns
+    -------
+    Catalog
+        updated catalog (to be closed by the caller)
+    '''
+    folder = pathlib.Path(folder)
+    if database is None:
+        database = folder.joinpath('segy_catalog.sqlite')
+    catalog = Catalog(database, stations)
+    counts = catalog.scan(folder, recurse, extensions)
+    logging.info(f'SEG-Y catalog {database} - ' +
+                 ', '.join(f'{v} {k}' for k, v in counts.items()))
+    return catalog
@@ -1,26 +1,38 @@
+# -*- coding: utf-8 -*-
+'''
+Edition of SEG-Y files (time cut, resampling, single-pass edit pipelines)
+'''
+import math
 import pathlib
+import numpy as np
 import scipy.signal as sps
 import segyio
+from .blocks import MEMORY_BUDGET, map_blocks
+from .headers import header_dtype
+from .memmap import layout, ieee2ibm, TRACE_HEADER_SIZE
 
 
 def cut(segy, cut_time=1000, outpath=pathlib.Path.cwd()):
-    '''[summary]
+    '''Create a time-cut segy file (shorter record length)
 
-    [description]
+    Fixed-length files are cut by raw byte copy: file headers, then each
+    trace header and its first samples, in large blocks, with the sample
+    counts patched in the bin and trace headers. Other files are rewritten
+    through segyio.
 
     Parameters
     ----------
-    segy : {[type]}
-        [description]
-    cut_time : {number}, optional
-        [description] (the default is 1000, which [default_description])
-    outpath : {[type]}, optional
-        [description] (the default is pathlib.Path.cwd(), which [default_description])
+    segy : vmlib.seis.segy.io.Segy()
+        instance of the source segyfile as loaded by vmlib.seis.segy.io
+    cut_time : float, optional
+        record length of the cut file in milliseconds (defaults to 1000 [ms])
+    outpath : pathlib.Path, optional
+        path to destination folder (defaults is pathlib.Path.cwd())
 
     Returns
     -------
-    [type]
-        [description]
+    pathlib.Path
+        path to the created, cut, segy file
     '''
     # Resolve destination file
     filename, extension = segy.info['filename'].split('.')
@@ -29,6 +41,12 @@ def cut(segy, cut_time=1000, outpath=pathlib.Path.cwd()):
     if cut_time > segy.info['trace_length']:
         cut_time = segy.info['trace_length']
     cut_sample = int(cut_time/segy.info['sample_rate'])
+    # Raw byte copy of fixed-length files
+    try:
+        copy_samples(segy.info['file'], destination, cut_sample)
+        return destination
+    except ValueError:
+        pass
     # File opening and processing
     with segyio.open(segy.info['file'], ignore_geometry=True) as src:
         spec = segyio.tools.metadata(src)
@@ -42,12 +60,340 @@ def cut(segy, cut_time=1000, outpath=pathlib.Path.cwd()):
     return destination
 
 
-def resample(segy, sample_rate=4, outpath=pathlib.Path.cwd()):
+def copy_samples(path, destination, n_samples, memory=None):
+    '''Copy a fixed-length segy file, keeping the first n_samples samples
+
+    The file headers and, for each trace, the trace header and the first
+    n_samples samples are copied as raw bytes (no sample decoding), in blocks
+    of traces. Sample counts are patched in the bin header (bytes 3221-3222,
+    and 3269-3272 if set) and in each trace header (bytes 115-116).
+
+    Parameters
+    ----------
+    path : pathlib.Path or str
+        path to the source segy file
+    destination : pathlib.Path or str
+        path to the created segy file
+    n_samples : int
+        number of samples kept in each trace
+    memory : int, optional
+        memory budget in bytes of a trace block (defaults to 256 MB)
+
+    Raises
+    ------
+    ValueError
+        if the source is not a fixed-length SEG-Y file (see memmap.layout)
+        or n_samples is out of range
+    '''
+    lay = layout(path)
+    if not 0 < n_samples <= lay['n_samples']:
+        raise ValueError(f'Cannot keep {n_samples} of {lay["n_samples"]} '
+                         'samples')
+    size = TRACE_HEADER_SIZE + n_samples * lay['dtype'].itemsize
+    traces = np.memmap(path, dtype=np.uint8, mode='r', offset=lay['offset'],
+                       shape=(lay['n_traces'], lay['trace_size']))
+    step = max(1, (memory or MEMORY_BUDGET) // lay['trace_size'])
+    count = n_samples.to_bytes(2, 'big')
+    with open(path, 'rb') as src, open(destination, 'wb') as dst:
+        # Text, bin and extended headers, with patched sample counts
+        headers = bytearray(src.read(lay['offset']))
+        headers[3220:3222] = count
+        if any(headers[3268:3272]):
+            headers[3268:3272] = n_samples.to_bytes(4, 'big')
+        dst.write(headers)
+        # Trace headers and first samples, block by block
+        for start in range(0, lay['n_traces'], step):
+            block = np.array(traces[start:start + step, :size])
+            block[:, 114:116] = np.frombuffer(count, dtype=np.uint8)
+            dst.write(block.tobytes())
+
+
+def write_blocks(path, destination, blocks, n_samples, interval=None,
+                 patch=None):
+    '''Write processed trace blocks of a fixed-length segy to a new file
+
+    The file headers and trace headers are copied from the source as raw
+    bytes, with the sample count (and interval) patched in the bin header
+    and in each trace header. Blocks are encoded and written as they come,
+    so that only one block is held in memory. Samples are written as IBM
+    floats if the source is, as IEEE floats otherwise (format code 5).
+
+    Parameters
+    ----------
+    path : pathlib.Path or str
+        path to the source segy file
+    destination : pathlib.Path or str
+        path to the created segy file
+    blocks : iterable
+        (trace range, 2-D block) tuples covering the source traces in order,
+        with n_samples samples per trace
+    n_samples : int
+        number of samples per trace of the blocks
+    interval : int, optional
+        sample interval in microseconds (defaults to the source one)
+    patch : callable, optional
+        function of a trace range returning the trace header values to set,
+        as a {field: values} dict (segyio field names, values being scalars
+        or one value per trace of the range)
+
+    Raises
+    ------
+    ValueError
+        if the source is not a fixed-length SEG-Y file (see memmap.layout)
+    '''
+    lay = layout(path)
+    fmt = 1 if lay['format'] == 1 else 5
+    record = np.dtype([('header', np.uint8, TRACE_HEADER_SIZE),
+                       ('samples', '>u4' if fmt == 1 else '>f4',
+                        (n_samples,))])
+    traces = np.memmap(path, dtype=np.uint8, mode='r', offset=lay['offset'],
+                       shape=(lay['n_traces'], lay['trace_size']))
+    count = np.frombuffer(n_samples.to_bytes(2, 'big'), dtype=np.uint8)
+    with open(path, 'rb') as src, open(destination, 'wb') as dst:
+        # Text, bin and extended headers, with patched sample count,
+        # interval and format
+        headers = bytearray(src.read(lay['offset']))
+        headers[3220:3222] = count.tobytes()
+        if any(headers[3268:3272]):
+            headers[3268:3272] = n_samples.to_bytes(4, 'big')
+        if interval is not None:
+            headers[3216:3218] = int(interval).to_bytes(2, 'big')
+        headers[3224:3226] = fmt.to_bytes(2, 'big')
+        dst.write(headers)
+        # Trace headers and encoded samples, block by block
+        for rng, block in blocks:
+            out = np.empty(len(rng), dtype=record)
+            out['header'] = traces[rng.start:rng.stop, :TRACE_HEADER_SIZE]
+            out['header'][:, 114:116] = count
+            if interval is not None:
+                out['header'][:, 116:118] = np.frombuffer(
+                    int(interval).to_bytes(2, 'big'), dtype=np.uint8)
+            if patch is not None:
+                fields = patch(rng)
+                view = out.view(header_dtype(list(fields),
+                                             itemsize=record.itemsize))
+                for field, values in fields.items():
+                    view[field] = values
+            out['samples'] = ieee2ibm(block) if fmt == 1 else block
+            dst.write(out.tobytes())
+
+
+def resampled_size(n_samples, ratio, method='fft'):
+    '''Number of samples of a trace decimated by ratio (see resample_block)
+    '''
+    if method == 'polyphase':
+        return math.ceil(n_samples / ratio)
+    return n_samples // ratio
+
+
+def resample_block(block, ratio, method='fft'):
+    '''Decimate a block of traces by an integer ratio along the time axis
+
+    Parameters
+    ----------
+    block : np.array
+        2-D (traces x samples) block
+    ratio : int
+        decimation ratio (new sample interval / original one)
+    method : str, optional
+        'fft' (Fourier resampling, n_samples // ratio output samples) or
+        'polyphase' (anti-alias FIR low-pass filter and decimation,
+        ceil(n_samples / ratio) output samples, first sample kept),
+        defaults to 'fft'
+
+    Returns
+    -------
+    np.array
+        2-D float32 resampled block
+    '''
+    if method == 'fft':
+        out = sps.resample(block, resampled_size(block.shape[1], ratio),
+                           axis=1)
+    elif method == 'polyphase':
+        out = sps.resample_poly(block, 1, ratio, axis=1)
+    else:
+        raise ValueError(f'Unknown resampling method: {method}')
+    return out.astype(np.float32, copy=False)
+
+
+class Pipeline():
+    '''Chain of trace edits applied in a single read-transform-write pass
+
+    Operations are declared once (each method returns the pipeline, so that
+    calls can be chained) and run block by block: each block of traces is
+    read, transformed by all operations in turn, and written, without any
+    intermediate file. The output sample count and interval are inferred
+    from the operations, and updated in the bin and trace headers.
+
+    Fixed-length files are written with raw header copies (see
+    write_blocks), other files through segyio.
+
+    Parameters
+    ----------
+    segy : vmlib.seis.segy.io.Segy()
+        instance of the source segyfile as loaded by vmlib.seis.segy.io
+
+    Examples
+    --------
+    >>> segy.edit().cut(2000).resample(4).gain(tpow=2).patch(
+    ...     'EnergySourcePoint', 12).run('qc_copy.sgy', workers=4)
+    '''
+
+    def __init__(self, segy):
+        self.segy = segy
+        self.operations = []
+        self.patches = {}
+        # Output sample times (ms) and interval (ms), as edited so far
+        self.samples = np.asarray(segy.info['twt'], dtype=np.float64)
+        self.sample_rate = segy.info['sample_rate']
+
+    @property
+    def n_samples(self):
+        '''Number of samples per output trace'''
+        return self.samples.size
+
+    def apply(self, func):
+        '''Add a block operation (function of a 2-D traces x samples block,
+        keeping the number of samples)'''
+        self.operations.append(func)
+        return self
+
+    def transform(self, block):
+        '''Apply all operations to a block of traces'''
+        for func in self.operations:
+            block = func(block)
+        return np.asarray(block, dtype=np.float32)
+
+    def cut(self, cut_time=1000):
+        '''Keep the first cut_time milliseconds of the traces (see cut)'''
+        cut_time = min(cut_time, self.samples[-1] - self.samples[0])
+        n_samples = int(cut_time/self.sample_rate)
+        self.samples = self.samples[:n_samples]
+        return self.apply(lambda block: block[:, :n_samples])
+
+    def resample(self, sample_rate=4, method='fft'):
+        '''Resample traces to sample_rate milliseconds (see resample_block)
+
+        Raises
+        ------
+        ValueError
+            if the sample rate is not a strict multiple of the current one
+        '''
+        if (sample_rate % self.sample_rate) != 0:
+            raise ValueError('Check sample rate to be multiple of the '
+                             'original')
+        ratio = int(sample_rate/self.sample_rate)
+        n_samples = resampled_size(self.n_samples, ratio, method)
+        self.samples = self.samples[::ratio][:n_samples]
+        self.sample_rate = sample_rate
+        return self.apply(lambda block: resample_block(block, ratio, method))
+
+    def gain(self, factor=1., tpow=0.):
+        '''Scale traces by factor * t**tpow (t: sample time in seconds)'''
+        scale = factor * np.power(self.samples / 1000., tpow)
+        scale = scale.astype(np.float32)
+        return self.apply(lambda block: block * scale)
+
+    def patch(self, field, values):
+        '''Set a trace header field in the output file
+
+        Parameters
+        ----------
+        field : str
+            trace header field (segyio name, e.g. 'EnergySourcePoint')
+        values : scalar, array-like or callable
+            single value, one value per trace, or function of the trace
+            header table slice of a block returning its values
+        '''
+        if not callable(values) and np.ndim(values) > 0:
+            values = np.asarray(values)
+        self.patches[field] = values
+        return self
+
+    def header_values(self, traces):
+        '''Patched trace header values of a trace range'''
+        fields = {}
+        for field, values in self.patches.items():
+            if callable(values):
+                values = values(self.segy.trace_header.iloc[
+                    traces.start:traces.stop])
+            elif np.ndim(values) > 0:
+                values = values[traces.start:traces.stop]
+            fields[field] = np.asarray(values)
+        return fields
+
+    def run(self, destination, workers=1, memory=None):
+        '''Read, transform and write the traces in a single pass
+
+        Parameters
+        ----------
+        destination : pathlib.Path or str
+            path to the created segy file
+        workers : int, optional
+            number of threads transforming blocks (defaults to 1)
+        memory : int, optional
+            memory budget in bytes of a trace block (defaults to 256 MB,
+            shared by the blocks in flight if workers > 1)
+
+        Returns
+        -------
+        pathlib.Path
+            path to the created segy file
+        '''
+        destination = pathlib.Path(destination)
+        interval = int(round(self.sample_rate*1000))
+        if memory is None and workers > 1:
+            # Keep the blocks in flight within the default budget
+            memory = MEMORY_BUDGET // (2 * workers)
+        blocks = map_blocks(self.transform,
+                            self.segy.blocks(memory=memory, headers=False),
+                            workers)
+        patch = self.header_values if self.patches else None
+        # Streaming raw writer for fixed-length files
+        try:
+            layout(self.segy.info['file'])
+        except ValueError:
+            pass
+        else:
+            write_blocks(self.segy.info['file'], destination, blocks,
+                         self.n_samples, interval, patch)
+            return destination
+        # Process file
+        with segyio.open(self.segy.info['file'], ignore_geometry=True) as src:
+            spec = segyio.tools.metadata(src)
+            spec.samples = self.samples
+            with segyio.create(destination, spec) as dst:
+                dst.text[0] = src.text[0]
+                dst.bin = src.bin
+                dst.header = src.header
+                for traces, block in blocks:
+                    dst.trace[traces.start:traces.stop] = block
+                    fields = patch(traces) if patch is not None else {}
+                    for i, trace in enumerate(traces):
+                        dst.header[trace].update({
+                            segyio.TraceField.TRACE_SAMPLE_COUNT:
+                                self.n_samples,
+                            segyio.TraceField.TRACE_SAMPLE_INTERVAL:
+                                interval,
+                            **{segyio.tracefield.keys[k]:
+                               int(v if np.ndim(v) == 0 else v[i])
+                               for k, v in fields.items()}})
+                dst.bin.update(hdt=interval)
+                dst.bin.update(hns=self.n_samples)
+        return destination
+
+
+def resample(segy, sample_rate=4, outpath=pathlib.Path.cwd(), method='fft',
+             workers=1, memory=None):
     '''Create a resample segy file (increase sampling rate)
 
     Creates a resampled segy file from an original segy. Note that the new
     sampling rate has to be a strict multiple of the original one.
 
+    Traces are streamed in blocks, each block being resampled along the time
+    axis in a single call (see resample_block and Pipeline). Blocks can be
+    resampled in several threads, and are written as they come.
+
     Parameters
     ----------
     segy : vmlib.seis.segy.io.Segy()
@@ -56,6 +402,12 @@ def resample(segy, sample_rate=4, outpath=pathlib.Path.cwd()):
         destination sampling rate in milliseconds (defaults to 4 [ms])
     outpath : pathlib.Path, optional
         path to destination folder (defaults is pathlib.Path.cwd())
+    method : str, optional
+        'fft' or 'polyphase' (anti-alias filtered), defaults to 'fft'
+    workers : int, optional
+        number of resampling threads (defaults to 1)
+    memory : int, optional
+        memory budget in bytes of a trace block (defaults to 256 MB)
 
     Returns
     -------
@@ -70,22 +422,5 @@ def resample(segy, sample_rate=4, outpath=pathlib.Path.cwd()):
     # Resolve destination file
     filename, extension = segy.info['filename'].split('.')
     destination = outpath.joinpath(f'{filename}_resample.{extension}')
-    # Check new sampling rate
-    if (sample_rate % segy.info['sample_rate']) == 0:
-        ratio = int(sample_rate/segy.info['sample_rate'])
-        # Process file
-        with segyio.open(segy.info['file'], ignore_geometry=True) as src:
-            spec = segyio.tools.metadata(src)
-            spec.samples = spec.samples[:int(src.samples.size/ratio)-1]
-            with segyio.create(destination, spec) as dst:
-                dst.text[0] = src.text[0]
-                dst.bin = src.bin
-                for ix, trace in enumerate(src.trace):
-                    dst.trace[ix] = sps.resample(trace,
-                                                 int(len(trace)/ratio))
-                dst.bin.update(hdt=sample_rate*1000)
-                dst.bin.update(hns=len(spec.samples))
-                dst.header = src.header
-        return destination
-    else:
-        raise ValueError('Check sample rate to be multiple of the original')
+    pipeline = Pipeline(segy).resample(sample_rate, method)
+    return pipeline.run(destination, workers, memory)
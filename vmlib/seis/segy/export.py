@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+'''
+Chunked export of trace header tables (Parquet, Feather or CSV)
+
+Tables are written block by block: one Parquet row group or Feather record
+batch per block, or appended CSV rows. Parquet and Feather need the optional
+pyarrow (pip install vmlib[parquet]), CSV has no extra dependency.
+'''
+import bz2
+import gzip
+import lzma
+import pathlib
+from .headers import iter_trace_headers
+
+# Output format -> file extension
+EXPORT_FORMATS = {'parquet': '.parquet', 'feather': '.feather', 'csv': '.csv'}
+
+# Default compression codec of each format
+DEFAULT_COMPRESSION = {'parquet': 'zstd', 'feather': 'lz4', 'csv': None}
+
+# CSV compression codec -> (text file opener, file extension suffix)
+CSV_COMPRESSION = {'gzip': (gzip.open, '.gz'),
+                   'bz2': (bz2.open, '.bz2'),
+                   'xz': (lzma.open, '.xz')}
+
+# Number of rows per block of in-memory tables
+CHUNK_SIZE = 100000
+
+
+def _pyarrow():
+    # Optional dependency, None if not installed
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        return None
+
+
+def _output_path(outfile, format, compression):
+    # Append the format (and CSV compression) extension, unless the name
+    # already ends with it: 'L1.final' -> 'L1.final.parquet'
+    outfile = pathlib.Path(outfile)
+    suffix = EXPORT_FORMATS[format]
+    if format == 'csv' and compression in CSV_COMPRESSION:
+        suffix += CSV_COMPRESSION[compression][1]
+    if not outfile.name.lower().endswith(suffix):
+        outfile = outfile.with_name(outfile.name + suffix)
+    return outfile
+
+
+def write_table(chunks, outfile, format='parquet', compression='default',
+                columns=None):
+    '''Write DataFrame blocks to a single Parquet, Feather or CSV file
+
+    Each block is written as soon as it comes, so that only one block is
+    held in memory. The index of the blocks is written as the first column.
+
+    Parameters
+    ----------
+    chunks : iterable
+        pd.DataFrame blocks sharing the same columns and dtypes
+    outfile : pathlib.Path or str
+        output file, the format extension is appended unless the name
+        already ends with it
+    format : str, optional
+        'parquet', 'feather' or 'csv' (defaults to 'parquet'). Parquet and
+        Feather need pyarrow (ImportError if it is not installed).
+    compression : str, optional
+        compression codec, 'default' for the format default (zstd for
+        Parquet, lz4 for Feather, none for CSV) or None for no compression.
+        CSV supports 'gzip', 'bz2' and 'xz'.
+    columns : list, optional
+        columns to write (defaults to all columns)
+
+    Returns
+    -------
+    pathlib.Path
+        path to the written file
+    '''
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {format}')
+    pa = _pyarrow()
+    if format != 'csv' and pa is None:
+        raise ImportError(f'pyarrow is required for {format} export (pip '
+                          "install vmlib[parquet]), or use format='csv'")
+    if compression == 'default':
+        compression = DEFAULT_COMPRESSION[format]
+    outfile = _output_path(outfile, format, compression)
+    if format == 'csv':
+        return _write_csv(chunks, outfile, compression, columns)
+    writer = None
+    try:
+        for chunk in chunks:
+            if columns is not None:
+                chunk = chunk[columns]
+            chunk = chunk.reset_index()
+            if writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                schema = table.schema.remove_metadata()
+                if format == 'parquet':
+                    writer = pa.parquet.ParquetWriter(
+                        outfile, schema, compression=compression or 'none')
+                else:
+                    options = pa.ipc.IpcWriteOptions(compression=compression)
+                    writer = pa.ipc.new_file(str(outfile), schema,
+                                             options=options)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=schema,
+                                             preserve_index=False)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f'No data to export to {outfile}')
+    return outfile
+
+
+def _write_csv(chunks, outfile, compression, columns):
+    # Appended CSV blocks, header row written with the first one
+    if compression is None:
+        opener = open
+    elif compression in CSV_COMPRESSION:
+        opener = CSV_COMPRESSION[compression][0]
+    else:
+        raise ValueError(f'Unsupported CSV compression: {compression}')
+    with opener(outfile, 'wt', newline='') as f:
+        for i, chunk in enumerate(chunks):
+            if columns is not None:
+                chunk = chunk[columns]
+            chunk.to_csv(f, header=(i == 0))
+    return outfile
+
+
+def export_table(df, outfile, format='parquet', compression='default',
+                 columns=None, chunk_size=CHUNK_SIZE):
+    '''Export an in-memory table in blocks of rows (see write_table)'''
+    chunks = (df.iloc[start:start + chunk_size]
+              for start in range(0, max(len(df), 1), chunk_size))
+    return write_table(chunks, outfile, format, compression, columns)
+
+
+def export_trace_headers(path, outfile, fields=None, format='parquet',
+                         compression='default', block_size=None,
+                         memory=None):
+    '''Export the trace headers of a SEG-Y while scanning it
+
+    Header blocks are decoded (see headers.iter_trace_headers) and written
+    one at a time, so that the whole header table is never held in memory.
+
+    Parameters
+    ----------
+    path : pathlib.Path or str
+        path to the segy file
+    outfile : pathlib.Path or str
+        output file (see write_table)
+    fields : list, optional
+        trace header fields to export (segyio names), defaults to all
+    format, compression
+        see write_table
+    block_size : int, optional
+        number of traces per block (overrides memory)
+    memory : int, optional
+        memory budget in bytes of the headers read per block
+
+    Returns
+    -------
+    pathlib.Path
+        path to the written file
+    '''
+    chunks = (chunk.rename_axis('trace') for chunk in iter_trace_headers(
+        path, fields, block_size, memory))
+    return write_table(chunks, outfile, format, compression)
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+'''
+Single-pass trace header decoding into typed NumPy / pandas tables
+'''
+import numpy as np
+import pandas as pd
+import segyio
+from .blocks import MEMORY_BUDGET
+from .memmap import layout, TRACE_HEADER_SIZE
+
+# Unsigned trace header fields (as decoded by segyio)
+_UNSIGNED = ['TRACE_SAMPLE_COUNT']
+
+
+def _field_sizes():
+    # Field sizes from consecutive byte positions of the segyio keys
+    keys = sorted(segyio.tracefield.keys.items(), key=lambda kv: kv[1])
+    positions = [v for k, v in keys] + [TRACE_HEADER_SIZE + 1]
+    return {k: positions[i + 1] - v for i, (k, v) in enumerate(keys)}
+
+
+FIELD_SIZES = _field_sizes()
+
+
+def header_dtype(fields=None, itemsize=TRACE_HEADER_SIZE, byteorder='>'):
+    '''Structured dtype mapping trace header fields on a trace record
+
+    Parameters
+    ----------
+    fields : list, optional
+        trace header field names (segyio names), defaults to all fields
+    itemsize : int, optional
+        record size in bytes (240 for headers only, trace size to stride
+        over whole traces)
+    byteorder : str, optional
+        '>' for on-disk (big-endian) or '=' for native byte order
+
+    Returns
+    -------
+    np.dtype
+        structured dtype with one integer field per header key
+    '''
+    keys = segyio.tracefield.keys
+    if fields is None:
+        fields = list(keys.keys())
+    formats = []
+    for k in fields:
+        kind = 'u' if k in _UNSIGNED else 'i'
+        formats.append(f'{byteorder}{kind}{FIELD_SIZES[k]}')
+    return np.dtype({'names': list(fields),
+                     'formats': formats,
+                     'offsets': [keys[k] - 1 for k in fields],
+                     'itemsize': itemsize})
+
+
+def read_trace_headers(path, fields=None, block_size=None, memory=None):
+    '''Decode trace headers of a fixed-length SEG-Y in a single pass
+
+    Only the 240-byte trace headers are read, through a strided memory map
+    of the trace records, in blocks of traces, and every requested field is
+    decoded into a typed column.
+
+    Parameters
+    ----------
+    path : pathlib.Path or str
+        path to the segy file
+    fields : list, optional
+        trace header field names (segyio names), defaults to all fields
+    block_size : int, optional
+        number of traces per block (overrides memory)
+    memory : int, optional
+        memory budget in bytes of the headers read per block (defaults to
+        256 MB)
+
+    Returns
+    -------
+    np.array
+        native-endian structured array, one record per trace
+
+    Raises
+    ------
+    ValueError
+        if the file is not a fixed-length SEG-Y (see memmap.layout)
+    '''
+    lay = layout(path)
+    native = _native_dtype(fields)
+    headers = np.empty(lay['n_traces'], dtype=native)
+    for start, block in _iter_records(path, lay, fields, block_size, memory):
+        for k in native.names:
+            headers[k][start:start + len(block)] = block[k]
+    return headers
+
+
+def _native_dtype(fields):
+    # Packed native-endian dtype of the decoded header fields
+    native = header_dtype(fields, byteorder='=')
+    return np.dtype({'names': native.names,
+                     'formats': [native.fields[k][0]
+                                 for k in native.names]})
+
+
+def _header_block_size(block_size=None, memory=None):
+    # Number of trace headers per block, from block_size or a memory budget
+    if block_size is None:
+        block_size = (memory or MEMORY_BUDGET) // TRACE_HEADER_SIZE
+    return max(1, int(block_size))
+
+
+def _iter_records(path, lay, fields, block_size=None, memory=None):
+    # Header bytes of each block copied out of a strided map of the trace
+    # records (samples are never read), yielding (first trace, on-disk
+    # header records)
+    block_size = _header_block_size(block_size, memory)
+    record = np.dtype({'names': ['header'],
+                       'formats': [f'V{TRACE_HEADER_SIZE}'],
+                       'itemsize': lay['trace_size']})
+    mapped = np.memmap(path, dtype=record, mode='r', offset=lay['offset'],
+                       shape=(lay['n_traces'],))['header']
+    dtype = header_dtype(fields)
+    for start in range(0, lay['n_traces'], block_size):
+        block = np.ascontiguousarray(mapped[start:start + block_size])
+        yield start, block.view(dtype)
+
+
+def iter_trace_headers(path, fields=None, block_size=None, memory=None):
+    '''Stream the trace headers of a SEG-Y as DataFrame blocks
+
+    Only the trace headers of fixed-length big-endian files are read (see
+    read_trace_headers), other files go through segyio, one block at a
+    time.
+
+    Parameters
+    ----------
+    path : pathlib.Path or str
+        path to the segy file
+    fields : list, optional
+        trace header field names (segyio names), defaults to all fields
+    block_size : int, optional
+        number of traces per block (overrides memory)
+    memory : int, optional
+        memory budget in bytes of the headers read per block (defaults to
+        256 MB)
+
+    Yields
+    ------
+    pd.DataFrame
+        one typed column per field, index = trace sequence number (from 1)
+    '''
+    if fields is None:
+        fields = list(segyio.tracefield.keys.keys())
+    with segyio.open(path, mode='r', ignore_geometry=True) as f:
+        try:
+            if f.endian != 'big':
+                raise ValueError('Little-endian SEG-Y')
+            lay = layout(path)
+        except ValueError:
+            lay = None
+        block_size = _header_block_size(block_size, memory)
+        if lay is None:
+            keys = segyio.tracefield.keys
+            for start in range(0, f.tracecount, block_size):
+                stop = min(start + block_size, f.tracecount)
+                yield pd.DataFrame(
+                    {k: f.attributes(keys[k])[start:stop] for k in fields},
+                    index=pd.RangeIndex(start + 1, stop + 1))
+            return
+    native = _native_dtype(fields)
+    for start, block in _iter_records(path, lay, fields, block_size):
+        index = pd.RangeIndex(start + 1, start + len(block) + 1)
+        yield pd.DataFrame({k: block[k].astype(native[k]) for k in fields},
+                           index=index)
+
+
+def trace_header_table(segyfile, fields=None):
+    '''Trace header DataFrame (index = trace sequence number, from 1)
+
+    Uses the single-pass reader, and falls back on segyio per-field reads
+    for files it cannot map (little-endian or variable trace length).
+
+    Parameters
+    ----------
+    segyfile : segyio.SegyFile
+        opened segy file
+    fields : list, optional
+        trace header field names (segyio names), defaults to all fields
+
+    Returns
+    -------
+    pd.DataFrame
+        one typed column per trace header field
+    '''
+    if fields is None:
+        fields = list(segyio.tracefield.keys.keys())
+    index = pd.RangeIndex(1, segyfile.tracecount + 1)
+    try:
+        if segyfile.endian != 'big':
+            raise ValueError('Little-endian SEG-Y')
+        headers = read_trace_headers(segyfile._filename, fields)
+        return pd.DataFrame({k: headers[k] for k in fields}, index=index)
+    except ValueError:
+        keys = segyio.tracefield.keys
+        return pd.DataFrame({k: segyfile.attributes(keys[k])[:]
+                             for k in fields}, index=index)
+
+
+def apply_scalar(values, scalar):
+    '''Apply a SEG-Y coordinate/elevation scalar to raw header values
+
+    Negative scalars divide, positive scalars multiply and zero is ignored.
+
+    Parameters
+    ----------
+    values : np.array or pd.Series
+        raw integer header values
+    scalar : np.array, pd.Series or int
+        matching scalar header values (e.g. SourceGroupScalar)
+
+    Returns
+    -------
+    np.array
+        scaled float64 values
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    scalar = np.asarray(scalar, dtype=np.float64)
+    factor = np.where(scalar > 0, scalar, 1.)
+    divisor = np.where(scalar < 0, -scalar, 1.)
+    return values * factor / divisor
@@ -1,11 +1,16 @@
+import logging
 import re
 import geopandas as gpd
-import pandas as pd
-import shapely as sp
+from pyproj.exceptions import CRSError
 import segyio
+from .export import export_table
+from .headers import apply_scalar, trace_header_table
 
+# Trace header fields needed to build the CDP geometry
+GEOMETRY_FIELDS = ['CDP_X', 'CDP_Y', 'SourceGroupScalar']
 
-def build(segy):
+
+def build(segy, headers=True, fields=None):
     info = {}
     # Get basic statistics
     info['n_traces'] = segy.tracecount
@@ -13,10 +18,11 @@ def build(segy):
     info['n_samples'] = segy.samples.size
     info['trace_length'] = info['sample_rate'] * (info['n_samples'] - 1)
     info['twt'] = segy.samples
-    # Get headers
-    info['bin'] = segy.bin
-    info['text'], info['crs'] = _parse_text_header(segy)
-    info['trace'] = _parse_trace_header(segy, info)
+    # Get headers (skipped for lazy loading, see vmlib.seis.segy.io.Segy)
+    if headers:
+        info['bin'] = dict(segy.bin)
+        info['text'], info['crs'] = _parse_text_header(segy)
+        info['trace'] = _parse_trace_header(segy, info, fields)
     return info
 
 
@@ -42,35 +48,69 @@ def _parse_text_header(segy):
     return clean_header, crs
 
 
-def _parse_trace_header(segy, info):
-    # Get all header keys
-    headers = segyio.tracefield.keys
-    # Initialize dataframe with trace id as index and headers as columns
-    df = pd.DataFrame(index=range(1, info['n_traces'] + 1),
-                      columns=headers.keys())
-    # Fill dataframe with all header values
-    for k, v in headers.items():
-        df[k] = segy.attributes(v)[:]
-    # Fill the geometry
-    x = df['CDP_X'] / (-df['SourceGroupScalar'])
-    y = df['CDP_Y'] / (-df['SourceGroupScalar'])
-    df['geometry'] = [sp.geometry.Point(xy) for xy in zip(x, y)]
-    # Test crs and if valid, convert to geodataframe
+def _parse_trace_header(segy, info, fields=None):
+    # Decode header keys in a single pass, one typed column per key
+    if fields is not None:
+        fields = list(fields) + [k for k in GEOMETRY_FIELDS
+                                 if k not in fields]
+    df = trace_header_table(segy, fields)
+    return _parse_geometry(df, info['crs'])
+
+
+def _parse_geometry(df, crs):
+    # Scale CDP coordinates and build all points in one vectorized call
+    x = apply_scalar(df['CDP_X'], df['SourceGroupScalar'])
+    y = apply_scalar(df['CDP_Y'], df['SourceGroupScalar'])
+    points = gpd.points_from_xy(x, y)
+    # Set crs if valid, else keep the geometry without crs
     try:
-        gdf = gpd.GeoDataFrame(df, geometry=df['geometry'])
-        gdf.crs = {'init': f"epsg:{info['crs']}"}
-        return gdf
-    except:
-        return df
+        return gpd.GeoDataFrame(df, geometry=points,
+                                crs=f'EPSG:{crs}' if crs else None)
+    except CRSError:
+        logging.warning(f'Invalid EPSG code {crs} - geometry without crs')
+        return gpd.GeoDataFrame(df, geometry=points)
+
+
+def export_csv(df, outfile, columns=None, compression=None,
+               chunk_size=100000):
+    '''Export a trace table to CSV, in blocks of rows
 
+    Parameters
+    ----------
+    df : pd.DataFrame
+        trace table (e.g. info['trace'])
+    outfile : pathlib.Path or str
+        output file
+    columns : list, optional
+        columns to export (defaults to all but the geometry)
+    compression : str, optional
+        None, 'gzip', 'bz2' or 'xz' (defaults to None)
+    chunk_size : int, optional
+        number of rows written per block
 
-def export_csv():
-    pass
+    Returns
+    -------
+    pathlib.Path
+        path to the written file
+    '''
+    if columns is None:
+        columns = [k for k in df.columns if k != 'geometry']
+    return export_table(df, outfile, 'csv', compression, columns, chunk_size)
 
 
-def export_shp():
-    pass
+def export_shp(df, outfile, columns=None):
+    '''Export a trace table with geometry (e.g. info['trace']) to a
+    shapefile, keeping the given columns (defaults to all)'''
+    if columns is not None:
+        df = df[[k for k in columns if k != 'geometry'] + ['geometry']]
+    df.to_file(outfile)
+    return outfile
 
 
-def export_xls():
-    pass
+def export_xls(df, outfile, columns=None):
+    '''Export a trace table to an Excel sheet, keeping the given columns
+    (defaults to all but the geometry)'''
+    if columns is None:
+        columns = [k for k in df.columns if k != 'geometry']
+    df[columns].to_excel(outfile)
+    return outfile
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import logging
 import pathlib
 import segyio
 import vmlib as vm
@@ -6,29 +7,237 @@ import vmlib as vm
 
 class Segy():
 
-    def __init__(self, path=''):
+    def __init__(self, path='', mmap=True, fields=None, cache=None):
         with segyio.open(filename=path, mode='r', ignore_geometry=True) as f:
-            self.info = vm.seis.segy.info.build(f)
+            self.info = vm.seis.segy.info.build(f, headers=False)
         self.info['filename'] = pathlib.Path(path).name
         self.info['file'] = pathlib.Path(path)
         self.info['filepath'] = pathlib.Path(path).parent
+        self.mmap = mmap
+        self.fields = fields
+        self._traces = None
+        self._gathers = {}
+        # Header cache: None (disabled), True (default folder) or HeaderCache
+        if cache is True:
+            cache = vm.seis.segy.cache.HeaderCache()
+        self.cache = cache or None
 
     def __str__(self):
         return f"SEGY - {self.info['file']} - {self.info['n_traces']} traces"
 
+    def _open(self):
+        return segyio.open(self.info['file'], mode='r', ignore_geometry=True)
+
+    @property
+    def traces(self):
+        '''Trace samples as a 2-D (traces x samples) array
+
+        In mmap mode (default), a lazy vmlib.seis.segy.memmap.TraceArray is
+        returned: slicing it only reads and decodes the selected window.
+        Otherwise (or for files without fixed-length traces), the whole
+        trace block is loaded in memory on first access.
+        '''
+        if self._traces is None:
+            if self.mmap:
+                try:
+                    self._traces = vm.seis.segy.memmap.TraceArray(
+                        self.info['file'])
+                except ValueError as e:
+                    logging.warning(f'{e} - loading traces in memory')
+            if self._traces is None:
+                with self._open() as f:
+                    self._traces = f.trace.raw[:]
+        return self._traces
+
+    @property
+    def bin_header(self):
+        '''Binary header as a dict (decoded on first access)'''
+        if 'bin' not in self.info:
+            def decode():
+                with self._open() as f:
+                    return {int(k): v for k, v in f.bin.items()}
+            bin_header = vm.seis.segy.cache.load_item(
+                self.cache, self.info['file'], 'bin', decode)
+            self.info['bin'] = {segyio.BinField(int(k)): v
+                                for k, v in bin_header.items()}
+        return self.info['bin']
+
+    @property
+    def text_header(self):
+        '''Text header as a dict of C01-C40 lines (decoded on first access)'''
+        if 'text' not in self.info:
+            def decode():
+                with self._open() as f:
+                    text, crs = vm.seis.segy.info._parse_text_header(f)
+                return {'text': text, 'crs': crs}
+            parsed = vm.seis.segy.cache.load_item(
+                self.cache, self.info['file'], 'text', decode)
+            self.info['text'], self.info['crs'] = parsed['text'], parsed['crs']
+        return self.info['text']
+
+    @property
+    def crs(self):
+        '''EPSG code found in the text header (None if not found)'''
+        self.text_header
+        return self.info['crs']
+
+    @property
+    def trace_header(self):
+        '''Trace header DataFrame, restricted to self.fields if set
+
+        Decoded in a single pass on first access and cached.
+        '''
+        if 'trace' not in self.info:
+            def decode(fields):
+                with self._open() as f:
+                    return vm.seis.segy.headers.trace_header_table(f, fields)
+            self.info['trace'] = vm.seis.segy.cache.load_trace_header(
+                self.cache, self.info['file'], decode, self.fields)
+        return self.info['trace']
+
+    @property
+    def geometry(self):
+        '''Trace header GeoDataFrame with CDP points (built on first access)'''
+        if 'geometry' not in self.info:
+            fields = vm.seis.segy.info.GEOMETRY_FIELDS
+            df = self.trace_header
+            if any(k not in df.columns for k in fields):
+                with self._open() as f:
+                    df = df.join(vm.seis.segy.headers.trace_header_table(
+                        f, [k for k in fields if k not in df.columns]))
+            self.info['geometry'] = vm.seis.segy.info._parse_geometry(
+                df, self.crs)
+        return self.info['geometry']
+
+    def blocks(self, block_size=None, memory=None, headers=True):
+        '''Stream traces as (trace range, 2-D block, header slice) tuples
+
+        See vmlib.seis.segy.blocks.iter_blocks. Block size is set in traces
+        (block_size) or as a memory budget in bytes (memory).
+        '''
+        return vm.seis.segy.blocks.iter_blocks(
+            self.info['file'], self.trace_header if headers else None,
+            block_size, memory)
+
+    def gather_index(self, key):
+        '''Gather index of a trace header key (cached with the headers)
+
+        Parameters
+        ----------
+        key : str
+            trace header field, or alias ('ffid', 'shot', 'cdp', 'channel')
+
+        Returns
+        -------
+        vmlib.seis.gathers.GatherIndex
+            key value -> sorted trace-index ranges
+        '''
+        field = vm.seis.gathers.GATHER_KEYS.get(key, key)
+        if field not in self._gathers:
+            def decode():
+                if field in self.trace_header.columns:
+                    values = self.trace_header[field]
+                else:
+                    with self._open() as f:
+                        values = vm.seis.segy.headers.trace_header_table(
+                            f, [field])[field]
+                return vm.seis.gathers.GatherIndex.build(values).runs
+            runs = vm.seis.segy.cache.load_item(
+                self.cache, self.info['file'], f'gather_{field}', decode)
+            self._gathers[field] = vm.seis.gathers.GatherIndex(runs)
+        return self._gathers[field]
+
+    def gather(self, key, value):
+        '''Read a single gather, e.g. segy.gather('ffid', 1234)
+
+        Only the trace ranges of the gather are read from the file, through
+        the trace memory map or, without it, segyio trace slices.
+
+        Returns
+        -------
+        np.array
+            2-D (gather traces x samples) array
+        pd.DataFrame
+            matching trace headers
+        '''
+        index = self.gather_index(key)
+        if self._traces is None and self.mmap:
+            try:
+                self._traces = vm.seis.segy.memmap.TraceArray(
+                    self.info['file'])
+            except ValueError:
+                pass
+        if self._traces is None:
+            # Do not load the whole file: read the gather runs with segyio
+            with self._open() as f:
+                data = index.read(f.trace.raw, value)
+        else:
+            data = index.read(self._traces, value)
+        return data, self.trace_header.iloc[index.traces(value)]
+
+    def amplitude_sketch(self, memory=None):
+        '''Quantile sketch of the trace samples (cached with the headers)
+
+        See vmlib.seis.segy.stats.amplitude_sketch, e.g.
+        segy.amplitude_sketch().percentile(99) for a clip value.
+        '''
+        return vm.seis.segy.stats.amplitude_sketch(self.info['file'],
+                                                   self.cache, memory)
+
+    def pyramid(self, memory=None):
+        '''Multi-resolution pyramid of the traces, for display
+
+        Built on first use and stored with the header cache, or in a
+        temporary folder if the cache is disabled (see
+        vmlib.seis.plot.pyramid.get_pyramid).
+        '''
+        return vm.seis.plot.pyramid.get_pyramid(self.info['file'], self.cache,
+                                                memory=memory)
+
     def cut(self, cut_time=1000, outpath=pathlib.Path.cwd()):
         cut_file = vm.seis.segy.edit.cut(self, cut_time, outpath)
         return cut_file
 
-    def resample(self, sample_rate=4, outpath=pathlib.Path.cwd()):
-        resampled_file = vm.seis.segy.edit.resample(self, sample_rate, outpath)
+    def resample(self, sample_rate=4, outpath=pathlib.Path.cwd(),
+                 method='fft', workers=1, memory=None):
+        resampled_file = vm.seis.segy.edit.resample(
+            self, sample_rate, outpath, method, workers, memory)
         return resampled_file
 
-    def export_headers(self, format='csv'):
-        pass
+    def edit(self):
+        '''Single-pass edit pipeline on the traces, e.g.
+        segy.edit().cut(2000).resample(4).gain(tpow=2).run(path)
 
-    def get_trace_stats(self):
-        pass
+        See vmlib.seis.segy.edit.Pipeline.
+        '''
+        return vm.seis.segy.edit.Pipeline(self)
+
+    def export_headers(self, outfile=None, format='csv', fields=None,
+                       compression='default', memory=None):
+        '''Export the trace headers while scanning the file
+
+        See vmlib.seis.segy.export.export_trace_headers. Defaults to CSV
+        (Parquet and Feather need pyarrow), to
+        <file stem>_trace_header.<format> next to the file, and to the
+        fields of the instance (all fields if None).
+
+        Returns
+        -------
+        pathlib.Path
+            path to the written file
+        '''
+        if outfile is None:
+            outfile = self.info['filepath'].joinpath(
+                f"{self.info['file'].stem}_trace_header")
+        return vm.seis.segy.export.export_trace_headers(
+            self.info['file'], outfile, fields or self.fields, format,
+            compression, memory=memory)
+
+    def get_trace_stats(self, clip=None, block_size=None, memory=None):
+        '''Per-trace statistics table (see vmlib.seis.segy.stats)'''
+        blocks = self.blocks(block_size, memory, headers=False)
+        return vm.seis.segy.stats.trace_stats(blocks, self.info['n_traces'],
+                                              clip)
 
     def sort(self):
         pass
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+'''
+Memory-mapped, zero-copy access to the trace block of fixed-length SEG-Y
+'''
+import os
+import numpy as np
+
+TEXT_HEADER_SIZE = 3200
+BIN_HEADER_SIZE = 400
+TRACE_HEADER_SIZE = 240
+
+# SEG-Y data sample format code -> big-endian on-disk numpy dtype
+# IBM floats (code 1) are stored as raw words and decoded on access
+SAMPLE_FORMATS = {1: '>u4', 2: '>i4', 3: '>i2', 5: '>f4', 6: '>f8',
+                  8: 'i1', 9: '>i8', 10: '>u4', 11: '>u2', 12: '>u8',
+                  16: 'u1'}
+
+
+def layout(path):
+    '''Resolve the byte layout of a fixed-length SEG-Y file
+
+    Parameters
+    ----------
+    path : pathlib.Path or str
+        path to the segy file
+
+    Returns
+    -------
+    dict
+        data offset, number of traces and samples, sample format code,
+        on-disk sample dtype and trace size (in bytes)
+
+    Raises
+    ------
+    ValueError
+        if the sample format is unsupported or the file size does not match
+        a whole number of fixed-length traces
+    '''
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.seek(TEXT_HEADER_SIZE)
+        binary = f.read(BIN_HEADER_SIZE)
+        n_samples = int.from_bytes(binary[20:22], 'big')
+        fmt = int.from_bytes(binary[24:26], 'big')
+        n_ext = int.from_bytes(binary[304:306], 'big', signed=True)
+        offset = TEXT_HEADER_SIZE + BIN_HEADER_SIZE + \
+            max(n_ext, 0) * TEXT_HEADER_SIZE
+        # Fallback on the first trace header if bin sample count is missing
+        if n_samples == 0:
+            f.seek(offset + 114)
+            n_samples = int.from_bytes(f.read(2), 'big')
+    if fmt not in SAMPLE_FORMATS:
+        raise ValueError(f'Unsupported SEG-Y sample format code {fmt}')
+    dtype = np.dtype(SAMPLE_FORMATS[fmt])
+    trace_size = TRACE_HEADER_SIZE + n_samples * dtype.itemsize
+    if n_samples == 0 or (size - offset) % trace_size != 0:
+        raise ValueError(f'{path} is not a fixed-length SEG-Y file')
+    return {'offset': offset,
+            'n_traces': (size - offset) // trace_size,
+            'n_samples': n_samples,
+            'format': fmt,
+            'dtype': dtype,
+            'trace_size': trace_size}
+
+
+def ibm2ieee(ibm):
+    '''Decode big-endian IBM System/360 floats into IEEE float32
+
+    Parameters
+    ----------
+    ibm : np.array
+        raw 32-bit IBM float words (any shape)
+
+    Returns
+    -------
+    np.array
+        float32 array of the same shape
+    '''
+    ibm = np.asarray(ibm, dtype=np.uint32)
+    mantissa = (ibm & 0x00ffffff).astype(np.float32)
+    exponent = ((ibm >> 24) & 0x7f).astype(np.int32)
+    ieee = np.ldexp(mantissa, 4 * (exponent - 64) - 24)
+    return np.where(ibm >> 31, -ieee, ieee).astype(np.float32, copy=False)
+
+
+def ieee2ibm(ieee):
+    '''Encode floats into 32-bit IBM System/360 float words
+
+    Parameters
+    ----------
+    ieee : np.array
+        float array (any shape)
+
+    Returns
+    -------
+    np.array
+        uint32 IBM float words of the same shape (native byte order)
+    '''
+    ieee = np.asarray(ieee, dtype=np.float64)
+    sign = (ieee < 0).astype(np.uint32) << 31
+    # a = m * 2**e (0.5 <= m < 1) = f * 16**E (1/16 <= f < 1)
+    m, e = np.frexp(np.abs(ieee))
+    exponent = -(-e // 4)
+    fraction = np.rint(np.ldexp(m, 24 + e - 4 * exponent)).astype(np.int64)
+    # Rounding up to 2**24 carries into the exponent
+    carry = fraction >= 2**24
+    fraction = np.where(carry, fraction >> 4, fraction)
+    exponent = exponent + carry + 64
+    # Underflow to zero, overflow to the largest IBM float
+    fraction = np.where(exponent < 0, 0, fraction)
+    fraction = np.where(exponent > 127, 0xffffff, fraction)
+    exponent = np.clip(exponent, 0, 127)
+    ibm = sign | (exponent.astype(np.uint32) << 24) | \
+        fraction.astype(np.uint32)
+    return np.where(ieee == 0, 0, ibm).astype(np.uint32)
+
+
+class TraceArray():
+    '''Lazy 2-D (traces x samples) array over the trace block of a SEG-Y
+
+    Slicing maps the file without reading it; only the selected traces and
+    samples are read and decoded to float32 when indexed.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.layout = layout(path)
+        record = np.dtype([('header', f'V{TRACE_HEADER_SIZE}'),
+                           ('samples', self.layout['dtype'],
+                            (self.layout['n_samples'],))])
+        self._map = np.memmap(path, dtype=record, mode='r',
+                              offset=self.layout['offset'],
+                              shape=(self.layout['n_traces'],))
+        # Zero-copy view on the on-disk samples
+        self.raw = self._map['samples']
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        return self.decode(self.raw[key])
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[:]
+        return data if dtype is None else data.astype(dtype)
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float32)
+
+    def decode(self, raw):
+        '''Convert raw on-disk samples into native float32'''
+        if self.layout['format'] == 1:
+            return ibm2ieee(raw)
+        return np.asarray(raw).astype(np.float32)
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+'''
+Streaming amplitude spectra of trace groups (offset classes, shots, line)
+'''
+import numpy as np
+import pandas as pd
+import scipy.fft
+import scipy.signal as sps
+from .blocks import map_blocks
+
+# Amplitude histogram keys: (group cell << 16) | (dB bucket + 2**15)
+_BUCKET_BITS = 16
+_BUCKET_OFFSET = 2**15
+
+# Default offset class edges (absolute offset, in meters)
+OFFSET_CLASSES = (0, 250, 500, 1000, 2000)
+
+
+def offset_classes(offsets, edges=OFFSET_CLASSES):
+    '''Offset class of each trace, as the lower edge of its class
+
+    Parameters
+    ----------
+    offsets : array-like
+        trace offsets (signed or not, classes are set on absolute offsets)
+    edges : tuple, optional
+        increasing class edges, the last class being open-ended
+
+    Returns
+    -------
+    np.array
+        lower class edge of each trace
+    '''
+    edges = np.asarray(edges)
+    index = np.searchsorted(edges, np.abs(offsets), side='right') - 1
+    return edges[np.clip(index, 0, len(edges) - 1)]
+
+
+def block_spectra(block, n_fft, samples=slice(None), taper=0.1):
+    '''Amplitude spectra of a block of traces, in a single real FFT
+
+    Parameters
+    ----------
+    block : np.array
+        2-D (traces x samples) block
+    n_fft : int
+        FFT length (zero-padded window)
+    samples : slice, optional
+        time window of the traces (defaults to whole traces)
+    taper : float, optional
+        fraction of the window tapered by a Tukey window (defaults to 0.1)
+
+    Returns
+    -------
+    np.array
+        2-D float32 (traces x n_fft // 2 + 1 frequencies) amplitude spectra
+    '''
+    block = block[:, samples]
+    block = block * sps.windows.tukey(block.shape[1], taper).astype(
+        np.float32)
+    return np.abs(scipy.fft.rfft(block, n=n_fft, axis=1)).astype(np.float32)
+
+
+def amplitude_buckets(spectra, resolution=0.5):
+    '''dB bucket index of amplitudes (zero amplitudes in the lowest one)'''
+    with np.errstate(divide='ignore'):
+        buckets = np.floor(np.log10(spectra) * (20 / resolution))
+    buckets = np.nan_to_num(buckets, neginf=-_BUCKET_OFFSET)
+    return np.clip(buckets, -_BUCKET_OFFSET,
+                   _BUCKET_OFFSET - 1).astype(np.int64)
+
+
+def _histogram(cells, buckets):
+    # Sorted (cell, bucket) histogram keys and counts. Dense counting over
+    # the block range of cells and buckets when small enough, else sorting.
+    c0, b0 = cells.min(), buckets.min()
+    n_buckets = buckets.max() - b0 + 1
+    size = (cells.max() - c0 + 1) * n_buckets
+    if size <= 4 * len(cells):
+        counts = np.bincount((cells - c0) * n_buckets + (buckets - b0),
+                             minlength=size)
+        index = np.flatnonzero(counts)
+        counts = counts[index]
+        cells = index // n_buckets + c0
+        buckets = index % n_buckets + b0
+        return (cells << _BUCKET_BITS) | (buckets + _BUCKET_OFFSET), counts
+    keys = (cells << _BUCKET_BITS) | (buckets + _BUCKET_OFFSET)
+    return np.unique(keys, return_counts=True)
+
+
+class SpectrumStats():
+    '''Mean and percentile amplitude spectra of trace groups, streamed
+
+    Spectra are summed per group and frequency. With histogram, their
+    amplitudes are also counted in a sparse dB histogram per group and
+    frequency, from which percentile spectra are read (to the histogram
+    resolution). The histogram holds up to one count per group, frequency
+    and dB bucket, which can outgrow the spectra themselves for small
+    groups: keep it for a few large groups (line, offset classes).
+
+    Parameters
+    ----------
+    n_freqs : int
+        number of frequencies of the spectra
+    resolution : float, optional
+        histogram bucket width in dB (defaults to 0.5)
+    histogram : bool, optional
+        count amplitudes for percentile spectra (defaults to True)
+    '''
+
+    def __init__(self, n_freqs, resolution=0.5, histogram=True):
+        self.n_freqs = n_freqs
+        self.resolution = resolution
+        self.histogram = histogram
+        self.labels = {}
+        self._sum = np.zeros((0, n_freqs))
+        self._count = np.zeros(0, dtype=np.int64)
+        self._keys = []
+        self._counts = []
+        self._size = 0
+        self._compacted = 0
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _codes(self, labels):
+        # Integer code of each trace group, new groups being appended
+        values, inverse = np.unique(labels, return_inverse=True)
+        codes = np.array([self.labels.setdefault(v, len(self.labels))
+                          for v in values.tolist()], dtype=np.int64)
+        n = len(self.labels)
+        if n > len(self._count):
+            self._sum = np.vstack(
+                [self._sum, np.zeros((n - len(self._sum), self.n_freqs))])
+            self._count = np.r_[self._count,
+                                np.zeros(n - len(self._count), np.int64)]
+        return codes[inverse.ravel()]
+
+    def update(self, spectra, labels, buckets=None):
+        '''Add a block of spectra (traces x frequencies) and trace groups
+
+        buckets are the dB buckets of the spectra (see amplitude_buckets),
+        computed if None and needed by the histogram.
+        '''
+        codes = self._codes(labels)
+        n = len(self.labels)
+        cells = codes[:, np.newaxis] * self.n_freqs + np.arange(self.n_freqs)
+        self._sum += np.bincount(cells.ravel(), weights=spectra.ravel(),
+                                 minlength=n * self.n_freqs).reshape(
+                                     n, self.n_freqs)
+        self._count += np.bincount(codes, minlength=n)
+        if not self.histogram:
+            return self
+        if buckets is None:
+            buckets = amplitude_buckets(spectra, self.resolution)
+        keys, counts = _histogram(cells.ravel(), buckets.ravel())
+        self._keys.append(keys)
+        self._counts.append(counts)
+        self._size += len(keys)
+        # Merge block histograms once they outgrow the merged one
+        if self._size > 2 * max(self._compacted, 2**20):
+            self._compact()
+        return self
+
+    def _compact(self):
+        if len(self._keys) > 1:
+            keys, inverse = np.unique(np.concatenate(self._keys),
+                                      return_inverse=True)
+            counts = np.bincount(inverse.ravel(),
+                                 weights=np.concatenate(self._counts))
+            self._keys, self._counts = [keys], [counts.astype(np.int64)]
+        self._size = self._compacted = sum(len(k) for k in self._keys)
+
+    def count(self):
+        '''Number of traces per group'''
+        return pd.Series(self._count, index=list(self.labels))
+
+    def mean(self):
+        '''Mean amplitude spectrum per group (groups x frequencies)'''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._sum / self._count[:, np.newaxis]
+
+    def percentile(self, q):
+        '''Percentile amplitude spectrum per group (groups x frequencies)'''
+        if not self.histogram:
+            raise ValueError('Percentiles need amplitude histograms '
+                             '(histogram=True)')
+        self._compact()
+        grid = np.full(len(self.labels) * self.n_freqs, np.nan)
+        if not self._keys:
+            return grid.reshape(-1, self.n_freqs)
+        keys, counts = self._keys[0], self._counts[0]
+        cells = keys >> _BUCKET_BITS
+        cum = np.cumsum(counts)
+        # Cumulative count before each cell and rank of the percentile
+        starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+        before = np.r_[0, cum][starts]
+        totals = self._count[cells[starts] // self.n_freqs]
+        rank = np.maximum(1, np.ceil(q / 100 * totals)).astype(np.int64)
+        index = np.searchsorted(cum, before + rank)
+        bucket = (keys[index] & (2**_BUCKET_BITS - 1)) - _BUCKET_OFFSET
+        values = 10**((bucket + 0.5) * self.resolution / 20)
+        grid[cells[starts]] = np.where(bucket > -_BUCKET_OFFSET, values, 0.)
+        return grid.reshape(-1, self.n_freqs)
+
+
+def spectra(blocks, twt, groups, window=None, taper=0.1, percentiles=None,
+            resolution=0.5, workers=1):
+    '''Mean and percentile amplitude spectra of trace groups, in one pass
+
+    Each block of traces is transformed by a single batched real FFT, and
+    its spectra are added to the statistics of every grouping level. Mean
+    spectra only keep a sum per group and frequency. Percentile spectra
+    also need an amplitude histogram per group and frequency (see
+    SpectrumStats), so they are opt-in per level, for levels with few
+    groups.
+
+    Parameters
+    ----------
+    blocks : iterable
+        (trace range, 2-D block, header slice) tuples, as yielded by
+        vmlib.seis.segy.blocks.iter_blocks
+    twt : np.array
+        sample times in milliseconds
+    groups : dict
+        grouping level -> group label of each trace (in file order), e.g.
+        {'offset': offset_classes(offsets), 'shot': ffids}
+    window : tuple, optional
+        (start, stop) time window in milliseconds (defaults to whole traces)
+    taper : float, optional
+        fraction of the window tapered by a Tukey window (defaults to 0.1)
+    percentiles : dict, optional
+        grouping level -> percentile spectra to compute, e.g.
+        {'line': (10, 50, 90)}. Other levels get count and mean spectra only
+        (defaults to none).
+    resolution : float, optional
+        amplitude resolution of the percentile spectra in dB
+    workers : int, optional
+        number of FFT threads (see vmlib.seis.segy.blocks.map_blocks)
+
+    Returns
+    -------
+    dict
+        grouping level -> {'count': pd.Series, 'mean': pd.DataFrame,
+        'p<q>': pd.DataFrame...}, with one row per group (sorted) and one
+        column per frequency (Hz), p<q> tables for the requested percentiles
+    '''
+    twt = np.asarray(twt, dtype=np.float64)
+    samples = slice(None)
+    if window is not None:
+        samples = slice(*np.searchsorted(twt, window))
+    n_samples = len(twt[samples])
+    if n_samples < 2:
+        raise ValueError(f'Spectral window {window} holds less than 2 '
+                         'samples')
+    n_fft = scipy.fft.next_fast_len(n_samples, real=True)
+    freqs = scipy.fft.rfftfreq(n_fft, (twt[1] - twt[0]) / 1000)
+    percentiles = percentiles or {}
+    stats = {k: SpectrumStats(len(freqs), resolution, k in percentiles)
+             for k in groups}
+    histogram = any(s.histogram for s in stats.values())
+
+    def transform(block):
+        amplitude = block_spectra(block, n_fft, samples, taper)
+        if not histogram:
+            return amplitude, None
+        return amplitude, amplitude_buckets(amplitude, resolution)
+
+    for traces, (amplitude, buckets) in map_blocks(transform, blocks,
+                                                   workers):
+        for level, labels in groups.items():
+            stats[level].update(amplitude,
+                                np.asarray(labels)[traces.start:traces.stop],
+                                buckets)
+    result = {}
+    for level, s in stats.items():
+        index = list(s.labels)
+        tables = {'count': s.count()}
+        tables['mean'] = pd.DataFrame(s.mean(), index=index, columns=freqs)
+        for q in percentiles.get(level, ()):
+            tables[f'p{q:g}'] = pd.DataFrame(s.percentile(q), index=index,
+                                             columns=freqs)
+        result[level] = {k: v.sort_index() for k, v in tables.items()}
+    return result
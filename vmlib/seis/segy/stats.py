@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+'''
+Vectorized per-trace statistics computed over trace blocks
+'''
+import numpy as np
+import pandas as pd
+from ...stats.sketch import QuantileSketch
+from .blocks import iter_blocks
+from .cache import load_item
+
+TRACE_STATS = ['amplitude', 'rms', 'rms_top', 'rms_bkg', 'peak', 'mean',
+               'zero_fraction', 'clipped']
+
+
+def block_stats(block, clip=None):
+    '''Per-trace statistics of a 2-D (traces x samples) block
+
+    Parameters
+    ----------
+    block : np.array
+        2-D block of traces
+    clip : float, optional
+        clip level for the clipped-sample count. If None, samples reaching
+        the trace peak amplitude are counted when there are at least two of
+        them (a flat-topped, saturated trace), else the count is 0.
+
+    Returns
+    -------
+    dict
+        one array (len = number of traces) per statistic:
+        amplitude (range), rms, rms_top and rms_bkg (standard deviation of
+        the whole, top half and bottom half of each trace), peak (maximum
+        absolute amplitude), mean, zero_fraction (fraction of zero samples)
+        and clipped (clipped-sample count)
+    '''
+    half = int(block.shape[1] / 2)
+    bmax = block.max(axis=1)
+    bmin = block.min(axis=1)
+    peak = np.maximum(bmax, -bmin)
+    level = peak if clip is None else np.full(len(block), clip)
+    clipped = (np.abs(block) >= level[:, np.newaxis]).sum(axis=1)
+    if clip is None:
+        # A single sample always reaches its own trace peak
+        clipped[clipped < 2] = 0
+    return {'amplitude': bmax - bmin,
+            'rms': block.std(axis=1),
+            'rms_top': block[:, :half].std(axis=1),
+            'rms_bkg': block[:, half:-1].std(axis=1),
+            'peak': peak,
+            'mean': block.mean(axis=1),
+            'zero_fraction': (block == 0).mean(axis=1),
+            'clipped': np.where(peak > 0, clipped, 0)}
+
+
+def trace_stats(blocks, n_traces, clip=None, stats=TRACE_STATS):
+    '''Per-trace statistics over a whole file, block by block
+
+    Parameters
+    ----------
+    blocks : iterable
+        (trace range, 2-D block, header slice) tuples, as yielded by
+        vmlib.seis.segy.blocks.iter_blocks
+    n_traces : int
+        total number of traces
+    clip : float, optional
+        clip level for the clipped-sample count (see block_stats)
+    stats : list, optional
+        statistics to keep (defaults to all TRACE_STATS)
+
+    Returns
+    -------
+    pd.DataFrame
+        one column per statistic, index = trace sequence number (from 1)
+    '''
+    # Preallocate result arrays, filled block by block
+    values = {k: np.empty(n_traces) for k in stats}
+    for traces, block, _ in blocks:
+        result = block_stats(block, clip)
+        for k in stats:
+            values[k][traces] = result[k]
+    return pd.DataFrame(values, index=pd.RangeIndex(1, n_traces + 1))
+
+
+def amplitude_sketch(path, cache=None, memory=None, alpha=0.01):
+    '''Quantile sketch of all trace samples of a SEG-Y, in a single pass
+
+    Parameters
+    ----------
+    path : pathlib.Path or str
+        path to the segy file
+    cache : vmlib.seis.segy.cache.HeaderCache, optional
+        header cache, the sketch is stored with the file headers (computed
+        on every call if None)
+    memory : int, optional
+        memory budget in bytes of a trace block (see iter_blocks)
+    alpha : float, optional
+        relative accuracy of the sketch (defaults to 0.01)
+
+    Returns
+    -------
+    vmlib.stats.sketch.QuantileSketch
+        e.g. sketch.percentile(99) for a display clip value
+    '''
+    def decode():
+        sketch = QuantileSketch(alpha)
+        for _, block, _ in iter_blocks(path, memory=memory):
+            sketch.update(block)
+        return sketch.to_dict()
+    return QuantileSketch.from_dict(load_item(cache, path, f'sketch_{alpha}',
+                                              decode))
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+'''
+Statistics module
+
+Streaming and approximate statistics
+'''
+
+__all__ = ['sketch']
+
+from . import sketch
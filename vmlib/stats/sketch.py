@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+'''
+Mergeable streaming quantile sketch (log-bucketed histogram)
+'''
+import numpy as np
+
+# Absolute values below MIN_VALUE count as zeros, above MAX_VALUE are clipped
+MIN_VALUE = 1e-30
+MAX_VALUE = 1e30
+# Number of values bucketed at once (bounds temporary memory)
+CHUNK_SIZE = 2**20
+
+
+class QuantileSketch():
+    '''Approximate quantiles of a stream of values, fed block by block
+
+    Values are counted in logarithmically spaced buckets, one histogram per
+    sign, so that any quantile is estimated within a relative error alpha
+    with a fixed memory footprint. Sketches with the same alpha merge
+    exactly (bucket counts add up), e.g. across blocks, files or processes.
+
+    Parameters
+    ----------
+    alpha : float, optional
+        relative accuracy of the quantile estimates (defaults to 0.01)
+    '''
+
+    def __init__(self, alpha=0.01):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = np.log(self.gamma)
+        self._offset = int(np.floor(np.log(MIN_VALUE) / self._log_gamma))
+        size = int(np.ceil(np.log(MAX_VALUE) / self._log_gamma))
+        size = size - self._offset + 1
+        self.positive = np.zeros(size, dtype=np.int64)
+        self.negative = np.zeros(size, dtype=np.int64)
+        self.zero = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def count(self):
+        '''Number of values fed to the sketch'''
+        return int(self.positive.sum() + self.negative.sum() + self.zero)
+
+    def _bucket(self, values):
+        keys = np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+        keys -= self._offset
+        return np.bincount(np.clip(keys, 0, len(self.positive) - 1),
+                           minlength=len(self.positive))
+
+    def update(self, values):
+        '''Add values (any shape, NaNs are ignored), returns the sketch'''
+        values = np.asarray(values).ravel()
+        if values.dtype.kind != 'f':
+            values = values.astype(np.float64)
+        for start in range(0, len(values), CHUNK_SIZE):
+            chunk = values[start:start + CHUNK_SIZE]
+            chunk = np.clip(chunk[~np.isnan(chunk)], -MAX_VALUE, MAX_VALUE)
+            small = np.abs(chunk) < MIN_VALUE
+            self.zero += int(small.sum())
+            self.positive += self._bucket(chunk[(chunk > 0) & ~small])
+            self.negative += self._bucket(-chunk[(chunk < 0) & ~small])
+        return self
+
+    def merge(self, other):
+        '''Add the counts of another sketch (same alpha), returns the sketch
+        '''
+        if other.alpha != self.alpha:
+            raise ValueError('Cannot merge sketches with different alpha')
+        self.positive += other.positive
+        self.negative += other.negative
+        self.zero += other.zero
+        return self
+
+    def quantile(self, q):
+        '''Estimated quantile(s), q in [0, 1] (NaN for an empty sketch)'''
+        keys = np.arange(len(self.positive)) + self._offset
+        values = 2 * self.gamma**keys.astype(np.float64) / (self.gamma + 1)
+        # Buckets in increasing value order: negative, zero, positive
+        values = np.concatenate([-values[::-1], [0.], values])
+        counts = np.concatenate([self.negative[::-1], [self.zero],
+                                 self.positive])
+        cumulated = np.cumsum(counts)
+        if cumulated[-1] == 0:
+            return np.full(np.shape(q), np.nan)[()]
+        rank = np.asarray(q, dtype=np.float64) * (cumulated[-1] - 1)
+        return values[np.searchsorted(cumulated, rank, side='right')]
+
+    def percentile(self, p):
+        '''Estimated percentile(s), p in [0, 100] (as np.percentile)'''
+        return self.quantile(np.asarray(p, dtype=np.float64) / 100)
+
+    def to_dict(self):
+        '''JSON-able dict of the non-empty buckets'''
+        return {'alpha': self.alpha,
+                'zero': self.zero,
+                'positive': {str(k): int(self.positive[k])
+                             for k in np.flatnonzero(self.positive)},
+                'negative': {str(k): int(self.negative[k])
+                             for k in np.flatnonzero(self.negative)}}
+
+    @classmethod
+    def from_dict(cls, d):
+        '''Sketch from a dict created with to_dict'''
+        sketch = cls(d['alpha'])
+        sketch.zero = d['zero']
+        for k, v in d['positive'].items():
+            sketch.positive[int(k)] = v
+        for k, v in d['negative'].items():
+            sketch.negative[int(k)] = v
+        return sketch